@@ -0,0 +1,231 @@
+"""
+Admission control for outbound LLM and embedding calls.
+
+Each Scheduler allows at most max_concurrent calls in flight. Further callers
+wait in a priority queue (lower number = served first, FIFO within a
+priority) that holds at most max_queue entries; when it is full, a new
+caller either evicts the least urgent waiter or is rejected.
+
+Callers carry a deadline and priority in context variables, set once per
+incoming request with request_context(). They follow the request through
+asyncio tasks and copied contexts into worker threads. A call is rejected
+early, with AdmissionRejected, when the expected queueing delay plus the
+typical service time (an EWMA of recent calls) would overrun its deadline.
+Rejecting early costs nothing, whereas admitting a call that will miss its
+deadline wastes quota and slows everyone else down.
+
+Work done once for several callers (a micro-batch of queries) runs under
+shared_context() of their captured current_context()s: the loosest deadline
+and the most urgent priority, so no caller is rejected or queued behind
+because another one happened to lead.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+from backend.config import (
+    ADMISSION_MAX_QUEUE, CLIENT_PRIORITIES, EMBEDDING_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY, REQUEST_DEADLINE_SECONDS
+)
+from backend.metrics import ADMISSION_DECISIONS
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10  # ingestion: only uses capacity queries leave free
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)  # time.monotonic()
+_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+
+RequestContext = Tuple[Optional[float], int]  # (deadline, priority)
+
+
+class AdmissionRejected(RuntimeError):
+    """The call was shed instead of queued; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def request_context(timeout: Optional[float] = None, priority: Optional[int] = None) -> Iterator[None]:
+    """
+    Set the deadline (seconds from now) and priority for calls made inside the
+    block. A nested context can only tighten an outer deadline.
+    """
+    tokens = []
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        outer = _deadline.get()
+        tokens.append((_deadline, _deadline.set(deadline if outer is None else min(outer, deadline))))
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_context() -> RequestContext:
+    """The caller's deadline and priority, to carry into work done on its behalf."""
+    return _deadline.get(), _priority.get()
+
+
+@contextmanager
+def shared_context(contexts: Iterable[RequestContext]) -> Iterator[None]:
+    """
+    Run work shared by several callers under the loosest of their deadlines
+    (none if any has none) and the most urgent of their priorities. Unlike
+    request_context() this replaces the current values.
+    """
+    contexts = list(contexts)
+    if not contexts:
+        yield
+        return
+    deadlines = [deadline for deadline, _ in contexts]
+    deadline = None if None in deadlines else max(deadlines)
+    tokens = [(_deadline, _deadline.set(deadline)), (_priority, _priority.set(min(p for _, p in contexts)))]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline (None = no deadline)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout_from_headers(headers: Mapping[str, str]) -> float:
+    """Request budget: X-Request-Timeout-Ms from the caller, capped at REQUEST_DEADLINE_SECONDS."""
+    try:
+        requested = float(headers.get("x-request-timeout-ms", "")) / 1000.0
+    except ValueError:
+        return REQUEST_DEADLINE_SECONDS
+    return max(0.0, min(requested, REQUEST_DEADLINE_SECONDS))
+
+
+def priority_for_client(client_id: Optional[str]) -> int:
+    return CLIENT_PRIORITIES.get(client_id or "", PRIORITY_NORMAL)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "shed")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.shed = False
+
+
+class Scheduler:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = ADMISSION_MAX_QUEUE):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = []  # heap of (priority, seq, _Waiter)
+        self._seq = itertools.count()
+        self._service_ewma: Optional[float] = None  # typical call duration, seconds
+
+    def _reject(self, outcome: str, message: str, retry_after: float) -> AdmissionRejected:
+        ADMISSION_DECISIONS.labels(self.name, outcome).inc()
+        return AdmissionRejected(f"{self.name}: {message}", retry_after=max(0.5, round(retry_after, 1)))
+
+    def _expected_wait(self, ahead: int) -> float:
+        """Queueing delay for a caller with `ahead` waiters in front of it."""
+        if self._service_ewma is None:
+            return 0.0
+        return (ahead // self.max_concurrent + 1) * self._service_ewma
+
+    def _admit(self) -> None:
+        priority, deadline = _priority.get(), _deadline.get()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                ADMISSION_DECISIONS.labels(self.name, "admitted").inc()
+                return
+
+            ahead = sum(1 for p, _, _ in self._waiters if p <= priority)
+            expected_wait = self._expected_wait(ahead)
+            service = self._service_ewma or 0.0
+            now = time.monotonic()
+            if deadline is not None and now + expected_wait + service > deadline:
+                raise self._reject("rejected_deadline", "cannot finish before the request deadline", expected_wait)
+            if len(self._waiters) >= self.max_queue:
+                worst = max(self._waiters, key=lambda e: (e[0], e[1])) if self._waiters else None
+                if worst is None or worst[0] <= priority:
+                    raise self._reject("rejected_queue_full", "too many queued requests", expected_wait)
+                # Make room by shedding the least urgent (and most recent) waiter
+                self._waiters.remove(worst)
+                heapq.heapify(self._waiters)
+                worst[2].shed = True
+                worst[2].event.set()
+
+            waiter = _Waiter()
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            ADMISSION_DECISIONS.labels(self.name, "queued").inc()
+
+        # Give up once too little time is left to complete the call itself
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic() - service)
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.granted:
+                return
+            if not waiter.shed:
+                for i, entry in enumerate(self._waiters):
+                    if entry[2] is waiter:
+                        self._waiters.pop(i)
+                        heapq.heapify(self._waiters)
+                        break
+        if waiter.shed:
+            raise self._reject("shed", "shed for higher-priority requests", self._expected_wait(len(self._waiters)))
+        raise self._reject("rejected_deadline", "deadline expired while queued", self._expected_wait(ahead))
+
+    def _release(self, duration: float) -> None:
+        with self._lock:
+            self._service_ewma = duration if self._service_ewma is None else 0.8 * self._service_ewma + 0.2 * duration
+            if self._waiters:
+                # Hand the slot straight to the most urgent waiter
+                _, _, waiter = heapq.heappop(self._waiters)
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the scheduler's concurrency slots for the duration of the block."""
+        self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "typical_call_seconds": round(self._service_ewma, 3) if self._service_ewma is not None else None,
+            }
+
+
+# Per-process limits: with N workers the provider sees up to N x max_concurrent calls
+LLM_SCHEDULER = Scheduler("llm", LLM_MAX_CONCURRENCY)
+EMBEDDING_SCHEDULER = Scheduler("embedding", EMBEDDING_MAX_CONCURRENCY)
+
+
+def scheduler_states() -> Dict[str, dict]:
+    return {s.name: s.snapshot() for s in (LLM_SCHEDULER, EMBEDDING_SCHEDULER)}
@@ -0,0 +1,86 @@
+"""
+Dynamic micro-batching for calls that arrive concurrently from many threads.
+
+Callers submit one item and block for its result. The first caller to find no
+open batch becomes its leader: it holds the batch open for up to max_wait
+seconds (or until max_batch items have joined), processes all items with a
+single call and hands each caller its own result. No background thread is
+involved, and when the leader is the only caller in flight it does not wait
+at all, so an idle server pays no batching latency.
+"""
+import threading
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Batch:
+    __slots__ = ("items", "results", "error", "closed", "done")
+
+    def __init__(self):
+        self.items: list = []
+        self.results: Optional[list] = None
+        self.error: Optional[BaseException] = None
+        self.closed = threading.Event()  # set when the batch is full
+        self.done = threading.Event()
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(self, process: Callable[[List[T]], List[R]], max_batch: int = 32, max_wait: float = 0.005,
+                 on_batch: Optional[Callable[[int], None]] = None):
+        self.process = process
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.on_batch = on_batch  # called with each batch size (metrics)
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self._in_flight = 0
+
+    def submit(self, item: T) -> R:
+        """Process `item`, possibly together with concurrent submissions."""
+        if self.max_batch == 1 or self.max_wait == 0:
+            return self._run([item])[0]
+
+        with self._lock:
+            self._in_flight += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+                alone = self._in_flight == 1
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.closed.set()
+        try:
+            if leader:
+                if not alone:
+                    batch.closed.wait(self.max_wait)
+                with self._lock:
+                    if self._open is batch:
+                        self._open = None
+                try:
+                    batch.results = self._run(batch.items)
+                except BaseException as e:
+                    batch.error = e
+                finally:
+                    batch.done.set()
+            else:
+                batch.done.wait()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def _run(self, items: List[T]) -> List[R]:
+        if self.on_batch is not None:
+            self.on_batch(len(items))
+        results = self.process(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+        return results
@@ -0,0 +1,251 @@
+"""
+Structure-aware chunking of extracted documents.
+
+extract_all() saves each document twice: the flat text (PROCESSED_DIR/<name>.txt,
+for reading and listing) and its elements as JSON lines
+(ELEMENTS_DIR/<name>.jsonl), one object per element:
+
+    {"type": "Title", "text": "Installation", "page": 3, "depth": 0}
+    {"type": "NarrativeText", "text": "Run the installer ...", "page": 3}
+    {"type": "Table", "text": "Name Value ...", "page": 4}
+
+chunk_elements() packs consecutive elements into chunks of up to CHUNK_SIZE.
+A heading starts a new chunk, unless the current chunk is still too small
+to stand on its own. Tables and list items are never split mid-element
+unless they alone exceed it. Each chunk is prefixed with its heading
+path and pages, e.g. "Setup > Installation (p. 3-4)", so a chunk carries the
+context the flat splitter used to lose; the prefix counts towards CHUNK_SIZE. Chunks do not overlap: their
+boundaries are sections, not arbitrary character offsets.
+
+Sizes (CHUNK_SIZE, CHUNK_OVERLAP) are measured in tokens of CHUNK_TOKENIZER,
+a tiktoken encoding, so every chunk has a known token budget whatever its
+language or formatting. tiktoken is optional: without it tokens are
+estimated at 4 characters each; CHUNK_TOKENIZER="" measures characters.
+tiktoken encodes in Rust without holding the GIL, so chunk_documents()
+spreads documents over CHUNK_WORKERS threads.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import (
+    CHUNK_OVERLAP, CHUNK_SIZE, CHUNK_TOKENIZER, CHUNK_WORKERS, CHUNKING, ELEMENTS_DIR
+)
+from backend.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+TITLE_TYPES = {"Title", "Header"}
+SKIP_TYPES = {"PageBreak", "Footer", "PageNumber"}  # layout noise, not content
+
+
+def elements_path(processed_name: str) -> str:
+    """ELEMENTS_DIR file for a processed text file ("X.docx.txt" -> "X.docx.jsonl")."""
+    return os.path.join(ELEMENTS_DIR, os.path.splitext(processed_name)[0] + ".jsonl")
+
+
+def write_elements(path: str, elements: Iterable[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for element in elements:
+            f.write(json.dumps(element, ensure_ascii=False) + "\n")
+
+
+def read_elements(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def text_elements(text: str) -> List[dict]:
+    """Elements of a plain-text document: one per paragraph, Markdown "#" lines as titles."""
+    elements = []
+    for block in text.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        first, _, rest = block.partition("\n")
+        if first.startswith("#"):
+            level = len(first) - len(first.lstrip("#"))
+            elements.append({"type": "Title", "text": first.lstrip("# ").strip(), "depth": level - 1})
+            block = rest.strip()
+            if not block:
+                continue
+        elements.append({"type": "NarrativeText", "text": block})
+    return elements
+
+
+_encoding = None  # tiktoken.Encoding, or False if unavailable
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken  # optional: pip install tiktoken
+            _encoding = tiktoken.get_encoding(CHUNK_TOKENIZER)
+        except ImportError:
+            logger.warning("⚠️  tiktoken not installed; estimating chunk sizes at 4 characters per token")
+            _encoding = False
+        except Exception as e:  # unknown encoding name, or its file can't be downloaded (offline)
+            logger.warning("⚠️  Tokenizer '%s' unavailable (%s); estimating chunk sizes at 4 characters per token",
+                           CHUNK_TOKENIZER, e)
+            _encoding = False
+    return _encoding or None
+
+
+def length_function() -> Callable[[str], int]:
+    """How chunk sizes are measured: tokens of CHUNK_TOKENIZER, estimated tokens, or characters."""
+    if not CHUNK_TOKENIZER:
+        return len
+    encoding = _get_encoding()
+    if encoding is None:
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(encoding.encode_ordinary(text))
+
+
+def count_tokens(texts: Sequence[str]) -> List[int]:
+    """Token count of each text (estimated without tiktoken), encoded on several threads."""
+    encoding = _get_encoding() if CHUNK_TOKENIZER else None
+    if encoding is None:
+        return [(len(t) + 3) // 4 for t in texts]
+    return [len(ids) for ids in encoding.encode_ordinary_batch(list(texts), num_threads=_workers())]
+
+
+def token_stats(counts: Sequence[int]) -> dict:
+    """Summary of per-chunk token counts (for the log and the manifest)."""
+    if not len(counts):
+        return {"total": 0}
+    a = np.asarray(counts)
+    return {
+        "tokenizer": CHUNK_TOKENIZER if CHUNK_TOKENIZER and _get_encoding() else "estimate",
+        "total": int(a.sum()),
+        "mean": round(float(a.mean()), 1),
+        "p50": int(np.percentile(a, 50)),
+        "p95": int(np.percentile(a, 95)),
+        "max": int(a.max()),
+    }
+
+
+def _workers() -> int:
+    return CHUNK_WORKERS if CHUNK_WORKERS > 0 else (os.cpu_count() or 1)
+
+
+def _heading(path: List[str], pages: List[int]) -> str:
+    heading = " > ".join(path)
+    if pages:
+        lo, hi = min(pages), max(pages)
+        heading += f" (p. {lo})" if lo == hi else f" (p. {lo}-{hi})"
+    return heading.strip()
+
+
+def chunk_elements(elements: List[dict], max_size: int = CHUNK_SIZE,
+                   split_text: Optional[Callable[[str, int], List[str]]] = None,
+                   length: Optional[Callable[[str], int]] = None) -> List[str]:
+    """
+    Section-aware chunks of an element list, each at most max_size (heading
+    prefix included) as measured by `length` (default: length_function()).
+    `split_text(text, size)` breaks up a single element that does not fit in
+    `size`, the room a chunk has left next to its prefix (default: the
+    recursive splitter).
+    """
+    length = length or length_function()
+    if split_text is None:
+        splitters: Dict[int, Callable[[str], List[str]]] = {}
+
+        def split_text(text: str, size: int) -> List[str]:
+            if size not in splitters:
+                splitters[size] = _default_splitter(size, length)
+            return splitters[size](text)
+    min_size = max_size // 4  # smaller sections are merged with the next one
+
+    chunks: List[str] = []
+    titles: Dict[int, str] = {}  # depth -> current heading
+    path: List[str] = []  # heading path where the current chunk starts
+    parts: List[str] = []
+    pages: List[int] = []
+    size = 0  # body so far, plus one separator per part
+
+    def prefix_size(heading_path: List[str], chunk_pages: List[int]) -> int:
+        heading = _heading(heading_path, chunk_pages)
+        return length(heading) + 1 if heading else 0
+
+    def flush():
+        nonlocal parts, pages, size
+        if parts:
+            heading = _heading(path, pages)
+            body = "\n".join(parts)
+            chunks.append(f"{heading}\n{body}" if heading else body)
+        parts, pages, size = [], [], 0
+
+    for element in elements:
+        kind, text = element.get("type", ""), (element.get("text") or "").strip()
+        if not text or kind in SKIP_TYPES:
+            continue
+        page = element.get("page")
+        page_list = [page] if page is not None else []
+
+        if kind in TITLE_TYPES:
+            depth = int(element.get("depth") or 0)
+            titles = {d: t for d, t in titles.items() if d < depth}
+            titles[depth] = text
+            if size >= min_size:
+                flush()
+            if not parts:
+                path = [titles[d] for d in sorted(titles)]
+                pages.extend(page_list)
+                continue  # the heading is carried by the chunk prefix
+            # Small section merged into this chunk: keep its heading inline
+
+        # Room next to the prefix of a new chunk; a very long heading still leaves a useful piece size
+        fresh_path = [titles[d] for d in sorted(titles)]
+        room = max(max_size - prefix_size(fresh_path, (pages if not parts else []) + page_list), min_size, 1)
+        text_size = length(text)
+        pieces = [(text, text_size)] if text_size <= room else [(p, length(p)) for p in split_text(text, room)]
+        for piece, piece_size in pieces:
+            if size and size + piece_size + prefix_size(path, pages + page_list) > max_size:
+                flush()
+                path = [titles[d] for d in sorted(titles)]
+            parts.append(piece)
+            size += piece_size + 1
+            pages.extend(page_list)
+    flush()
+    return chunks
+
+
+def chunk_document(processed_path: str, text: str) -> List[str]:
+    """
+    Chunks of one processed document per CHUNKING. Structured chunking uses
+    the extracted elements when they are at least as new as the text (a .txt
+    dropped into PROCESSED_DIR by hand has none), else the text's paragraphs.
+    """
+    if CHUNKING != "structured":
+        return _default_splitter(CHUNK_SIZE, length_function())(text)
+    el_path = elements_path(os.path.basename(processed_path))
+    try:
+        fresh = os.path.getmtime(el_path) >= os.path.getmtime(processed_path)
+    except OSError:
+        fresh = False
+    return chunk_elements(read_elements(el_path) if fresh else text_elements(text))
+
+
+def chunk_documents(paths: Sequence[str]) -> List[Tuple[str, List[str]]]:
+    """(path, chunks) for every processed document, in input order, chunked in parallel."""
+    def work(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return path, chunk_document(path, f.read())
+
+    length_function()  # load the encoding once, before the threads race for it
+    if len(paths) <= 1:
+        return [work(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(_workers(), len(paths)), thread_name_prefix="chunk") as pool:
+        return list(pool.map(work, paths))
+
+
+def _default_splitter(max_size: int, length: Callable[[str], int]) -> Callable[[str], List[str]]:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=max_size, chunk_overlap=min(CHUNK_OVERLAP, max_size // 2), length_function=length
+    ).split_text
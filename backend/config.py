@@ -12,6 +12,36 @@ AZURE_OPENAI_EMBEDDING_MODEL = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL")  # embe
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Regular OpenAI API key
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "azure")  # "azure", "openai", or "sentence-transformers"
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")  # Model name for fallback
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "10"))  # Per-request timeout for remote providers
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "1"))  # SDK-level retries before falling back
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # Max chunks per embedding request at build time
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))  # Max tokens per embedding request at build time
+
+# Provider circuit breaker
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))  # Consecutive failures before opening
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))  # Cool-down before a half-open probe
+
+# Admission control for outbound LLM / embedding calls (per worker process)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Chat completions in flight
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))  # Embedding calls in flight
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))  # Waiting calls before load shedding
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))  # Default (and maximum) request budget
+# Per-client priority, lower is served first (default 5; ingestion runs at 10), e.g. "servicenow-client=0,reports=8"
+CLIENT_PRIORITIES = {
+    name.strip(): int(prio)
+    for name, _, prio in (item.partition("=") for item in os.getenv("CLIENT_PRIORITIES", "").split(",") if "=" in item)
+}
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json" (one object per line)
+LOG_FILE = os.getenv("LOG_FILE", "")  # Also append to this file ("" = console only)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))  # Fraction of DEBUG records kept
+
+# Tracing (optional; needs opentelemetry-sdk)
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()  # "none", "console", "file" or "otlp"
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")  # JSON lines written by the "file" exporter
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "document-agent")
 
 # OneDrive Configuration
 MICROSOFT_CLIENT_ID = os.getenv("MICROSOFT_CLIENT_ID")
@@ -22,7 +52,47 @@ ONEDRIVE_FOLDER_PATH = os.getenv("ONEDRIVE_FOLDER_PATH", "/")  # Root folder by
 DATA_DIR = "data"
 DOCS_DIR = os.path.join(DATA_DIR, "docs")
 PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+ELEMENTS_DIR = os.path.join(DATA_DIR, "elements")  # Typed elements per document (JSON lines) for structured chunking
 VECTOR_STORE_DIR = os.path.join(DATA_DIR, "vector_store")
 
-for d in [DOCS_DIR, PROCESSED_DIR, VECTOR_STORE_DIR]:
+# Chunking
+CHUNKING = os.getenv("CHUNKING", "structured").lower()  # "structured" (headings/tables/pages) or "recursive" (flat text)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")  # tiktoken encoding; sizes below are then in tokens ("" = characters)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "256"))  # Max tokens (or characters) per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))  # Overlap between recursive chunks (structured chunks don't overlap)
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0"))  # Threads chunking documents in parallel (0 = CPU count)
+
+# Chunk deduplication before embedding
+DEDUP = os.getenv("DEDUP", "near").lower()  # "near" (exact + MinHash/LSH), "exact" or "none"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # Estimated Jaccard similarity that counts as a duplicate
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))  # MinHash signature length (accuracy vs. speed)
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "5"))  # Words per shingle
+
+# Watch mode (python -m backend.watch)
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2"))  # Quiet period before changed files are ingested
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2"))  # Scan interval when watchdog (inotify) isn't installed
+WATCH_RETRY_SECONDS = float(os.getenv("WATCH_RETRY_SECONDS", "30"))  # Wait before retrying a failed index update
+
+# Vector store versioning
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))  # Old snapshots kept for rollback / in-flight readers
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "5"))  # How often readers check for a newer snapshot
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))  # Split the index by document hash; searched in parallel
+INDEX_SEARCH_THREADS = int(os.getenv("INDEX_SEARCH_THREADS", "0"))  # Shard fan-out threads (0 = one per shard, capped at CPU count)
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "flat").lower()  # "flat", "fp16", "sq8" or "pq"
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "0"))  # PQ bytes per vector (0 = dim/16)
+INDEX_RESCORE_FACTOR = int(os.getenv("INDEX_RESCORE_FACTOR", "4"))  # Candidates per result re-scored exactly (quantized modes)
+INDEX_DIM_REDUCTION = os.getenv("INDEX_DIM_REDUCTION", "none").lower()  # "none", "pca" or "truncate" (Matryoshka models)
+INDEX_TARGET_DIM = int(os.getenv("INDEX_TARGET_DIM", "512"))  # Indexed dimension when reduction is enabled
+INDEX_MMAP = os.getenv("INDEX_MMAP", "false").lower() in ("1", "true", "yes")  # Memory-map the index so workers share one copy
+
+# Query micro-batching: concurrent queries share one embedding call and one FAISS search
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))  # Largest batch (1 = no batching)
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))  # How long a batch stays open under load (0 = no batching)
+
+# Document reads (get_document_content)
+DOCUMENT_PAGE_BYTES = int(os.getenv("DOCUMENT_PAGE_BYTES", "4000"))  # Default page size
+DOCUMENT_MAX_PAGE_BYTES = int(os.getenv("DOCUMENT_MAX_PAGE_BYTES", "65536"))  # Largest page a caller may request
+SUMMARY_INPUT_BYTES = int(os.getenv("SUMMARY_INPUT_BYTES", "16000"))  # Leading bytes of a document sent to the LLM for a summary
+
+for d in [DOCS_DIR, PROCESSED_DIR, ELEMENTS_DIR, VECTOR_STORE_DIR]:
     os.makedirs(d, exist_ok=True)
\ No newline at end of file
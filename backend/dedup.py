@@ -0,0 +1,123 @@
+"""
+Chunk deduplication before embedding.
+
+Copies and versions of the same document, and boilerplate repeated across
+files, produce chunks that cost an embedding each, grow the index and crowd
+the top-k with near-identical hits. dedup_chunks() keeps the first
+occurrence of every chunk and records the others as aliases of it:
+
+    exact  same text after case and whitespace normalization (BLAKE2b hash)
+    near   estimated Jaccard similarity of word 5-gram shingles at least
+           DEDUP_THRESHOLD, found with MinHash signatures and LSH banding, so
+           each chunk is only compared against the few that share a band
+           instead of all previous chunks
+
+Chunks shorter than one shingle are only deduplicated exactly.
+"""
+import hashlib
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import DEDUP, DEDUP_NUM_PERM, DEDUP_SHINGLE_WORDS, DEDUP_THRESHOLD
+
+DEDUP_MODES = ("none", "exact", "near")
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_WORD = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def _lsh_shape(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    (bands, rows) whose S-curve (1/bands)^(1/rows) sits a little below the
+    threshold, so true near-duplicates almost always share a band; candidates
+    are then checked against the threshold itself.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold * 0.9:
+            best = (bands, rows)
+    return best
+
+
+class _MinHasher:
+    def __init__(self, num_perm: int, shingle_words: int, seed: int = 1):
+        rng = np.random.RandomState(seed)  # fixed: signatures are comparable across builds
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.k = shingle_words
+        # Per-position multipliers combining word hashes into a shingle hash
+        self.mix = rng.randint(1, 1 << 32, size=shingle_words, dtype=np.uint64) | np.uint64(1)
+
+    def signature(self, text: str):
+        """MinHash signature (num_perm,) uint64, or None if the text has fewer than k words."""
+        words = _WORD.findall(text.casefold())
+        if len(words) < self.k:
+            return None
+        word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        n = len(words) - self.k + 1
+        shingles = np.zeros(n, dtype=np.uint64)
+        for j in range(self.k):  # uint64 arithmetic wraps, which is fine for hashing
+            shingles += word_hashes[j:j + n] * self.mix[j]
+        shingles = np.unique((shingles >> np.uint64(16)) & _MAX_HASH)  # 32-bit, so a*x below cannot overflow
+        hashed = ((np.outer(shingles, self.a) + self.b) % _MERSENNE) & _MAX_HASH
+        return hashed.min(axis=0)
+
+
+def dedup_chunks(chunks: Sequence[str], mode: str = DEDUP, threshold: float = DEDUP_THRESHOLD,
+                 num_perm: int = DEDUP_NUM_PERM, shingle_words: int = DEDUP_SHINGLE_WORDS
+                 ) -> Tuple[List[int], Dict[int, int], Dict[str, int]]:
+    """
+    Returns (kept, duplicate_of, counts): indices of the chunks to embed in
+    input order, {duplicate index: kept index it repeats}, and how many
+    chunks each method removed.
+    """
+    mode = (mode or "none").lower()
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown DEDUP mode '{mode}'. Use one of: {', '.join(DEDUP_MODES)}")
+    counts = {"exact": 0, "near": 0}
+    if mode == "none":
+        return list(range(len(chunks))), {}, counts
+
+    kept: List[int] = []
+    duplicate_of: Dict[int, int] = {}
+    by_hash: Dict[bytes, int] = {}
+    hasher = _MinHasher(num_perm, shingle_words) if mode == "near" else None
+    bands, rows = _lsh_shape(num_perm, threshold)
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    signatures: Dict[int, np.ndarray] = {}
+
+    for i, chunk in enumerate(chunks):
+        digest = hashlib.blake2b(_normalize(chunk).encode("utf-8"), digest_size=16).digest()
+        original = by_hash.get(digest)
+        if original is not None:
+            duplicate_of[i] = original
+            counts["exact"] += 1
+            continue
+
+        sig = hasher.signature(chunk) if hasher is not None else None
+        if sig is not None:
+            keys = [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+            candidates = {c for key in keys for c in buckets.get(key, ())}
+            # Lowest index first: a chunk is attributed to its earliest near-copy
+            match = next((c for c in sorted(candidates) if np.mean(signatures[c] == sig) >= threshold), None)
+            if match is not None:
+                duplicate_of[i] = by_hash[digest] = match
+                counts["near"] += 1
+                continue
+            signatures[i] = sig
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+        by_hash[digest] = i
+        kept.append(i)
+    return kept, duplicate_of, counts
@@ -0,0 +1,140 @@
+"""
+Read access to processed documents (data/processed/*.txt) for the MCP tools.
+
+    find_document(name)        exact, case-insensitive or extension-less match
+                               against a cached catalog of PROCESSED_DIR
+    read_range(doc, offset, n) only the requested byte range, cut on UTF-8
+                               character boundaries
+    document_summary(doc)      LLM summary of the document's opening, cached
+                               until the file changes
+
+The catalog is re-listed only when the directory's mtime changes (a file was
+added, removed or renamed), so lookups are a dict hit plus one stat().
+Only names in the catalog are readable: a document name can never resolve
+to a path outside PROCESSED_DIR.
+"""
+import difflib
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from backend.admission import current_context
+from backend.config import DOCUMENT_MAX_PAGE_BYTES, PROCESSED_DIR, SUMMARY_INPUT_BYTES
+from backend.singleflight import SingleFlight
+
+
+class Document(NamedTuple):
+    name: str
+    path: str
+    size: int  # bytes
+    mtime_ns: int
+
+
+class Page(NamedTuple):
+    text: str
+    start: int  # byte offset of the first character returned
+    end: int  # byte offset to pass as `offset` for the next page
+    size: int  # total document size in bytes
+
+
+_catalog: Tuple[Optional[int], Dict[str, str]] = (None, {})  # (dir mtime_ns, casefolded name -> name)
+_catalog_lock = threading.Lock()
+_summaries: Dict[Tuple[str, int, int], str] = {}
+_summarizing = SingleFlight()
+
+
+def _names() -> Dict[str, str]:
+    global _catalog
+    mtime = os.stat(PROCESSED_DIR).st_mtime_ns
+    cached_mtime, names = _catalog
+    if cached_mtime != mtime:
+        with _catalog_lock:
+            cached_mtime, names = _catalog
+            if cached_mtime != mtime:
+                names = {
+                    entry.name.casefold(): entry.name
+                    for entry in os.scandir(PROCESSED_DIR)
+                    if entry.is_file() and entry.name.endswith(".txt")
+                }
+                _catalog = (mtime, names)
+    return names
+
+
+def list_documents() -> List[str]:
+    """Names of all processed documents, sorted."""
+    return sorted(_names().values())
+
+
+def find_document(name: str) -> Optional[Document]:
+    """Look up a document by name ("Report.txt", "report.txt" or "report"); None if unknown."""
+    names = _names()
+    key = name.strip().casefold()
+    actual = names.get(key) or names.get(key + ".txt")
+    if actual is None:
+        return None
+    path = os.path.join(PROCESSED_DIR, actual)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:  # removed after the catalog was listed
+        return None
+    return Document(actual, path, st.st_size, st.st_mtime_ns)
+
+
+def similar_documents(name: str, limit: int = 10) -> List[str]:
+    """Closest document names, for "not found" messages."""
+    names = _names()
+    matches = difflib.get_close_matches(name.strip().casefold(), list(names), n=limit, cutoff=0.4)
+    return [names[m] for m in matches]
+
+
+def read_range(doc: Document, offset: int, length: int) -> Page:
+    """
+    Read about `length` bytes starting at `offset`. The range is moved off any
+    partial UTF-8 sequence at either end, so pages concatenate back into the
+    exact document; `end` is where the next page starts.
+    """
+    length = max(1, min(length, DOCUMENT_MAX_PAGE_BYTES))
+    offset = max(0, min(offset, doc.size))
+    with open(doc.path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length + 3)  # up to 3 extra bytes to finish a character
+    # Skip continuation bytes: the start fell inside a multi-byte character
+    skip = 0
+    while skip < min(3, len(data)) and data[skip] & 0xC0 == 0x80:
+        skip += 1
+    data = data[skip:]
+    cut = min(length, len(data))
+    # Don't end inside a character: back up to the start of the one that is cut
+    while 0 < cut < len(data) and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    if cut == 0 and data:  # page smaller than one character: return that character
+        cut = 1
+        while cut < len(data) and data[cut] & 0xC0 == 0x80:
+            cut += 1
+    body = data[:cut]
+    start = offset + skip
+    return Page(body.decode("utf-8", errors="replace"), start, start + len(body), doc.size)
+
+
+def document_summary(doc: Document) -> str:
+    """
+    Summary of the document's first SUMMARY_INPUT_BYTES. Computed once per
+    file version (name, size, mtime); concurrent requests of the same priority
+    share one LLM call.
+    """
+    key = (doc.name, doc.size, doc.mtime_ns)
+    summary = _summaries.get(key)
+    if summary is None:
+        # Imports the LLM client; only needed here
+        from backend.llm_answer import DEADLINE_ERRORS, summarize_text
+
+        _, priority = current_context()
+        summary, _ = _summarizing.do(
+            (key, priority),
+            lambda: summarize_text(read_range(doc, 0, SUMMARY_INPUT_BYTES).text),
+            retry_on=DEADLINE_ERRORS,
+        )
+        for stale in [k for k in _summaries if k[0] == doc.name]:
+            _summaries.pop(stale, None)
+        _summaries[key] = summary
+    return summary
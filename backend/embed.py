@@ -1,52 +1,231 @@
-import os, pickle, faiss, numpy as np
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from backend.config import PROCESSED_DIR, VECTOR_STORE_DIR
+import os, json, pickle, time, hashlib, faiss, numpy as np
+from typing import Callable, Optional
+from backend.config import (
+    PROCESSED_DIR, INDEX_SHARDS, INDEX_QUANTIZATION, INDEX_PQ_M, INDEX_DIM_REDUCTION, INDEX_TARGET_DIM,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKENS, DEDUP
+)
+from backend.admission import PRIORITY_BACKGROUND, request_context
+from backend.chunking import chunk_documents, count_tokens, token_stats
+from backend.dedup import dedup_chunks
 from backend.embedding_utils import get_embedding_client
+from backend.logging_utils import get_logger
+from backend.index_store import (
+    INDEX_FILE, CHUNKS_FILE, SOURCES_FILE, ALIASES_FILE, VECTORS_FILE, MappedChunks, build_lock, current_version,
+    has_chunks_blob, read_manifest, snapshot_dir, staged_snapshot, write_chunks_blob, write_manifest
+)
+from backend.metrics import INGEST_ITEMS, ingest_timed
+from backend.vector_index import DimReducer, build_shards, shard_file
 
-def _normalize(mat: np.ndarray) -> np.ndarray:
-    n = np.linalg.norm(mat, axis=1, keepdims=True)
-    n[n == 0] = 1.0
-    return mat / n
+logger = get_logger(__name__)
 
-def embed_and_store():
+# Fresh embedding passes a build may start when a fallback provider answers mid-build
+MAX_PROVIDER_SWITCHES = 2
+
+def _batches(token_counts, max_items: int, max_tokens: int):
+    """(start, end) ranges of at most max_items chunks and max_tokens tokens (at least one chunk each)."""
+    start, tokens = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= max_items or tokens + n > max_tokens):
+            yield start, i
+            start, tokens = i, 0
+        tokens += n
+    if start < len(token_counts):
+        yield start, len(token_counts)
+
+def _chunk_key(chunk: str) -> bytes:
+    return hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).digest()
+
+def _previous_vectors(model_id: str):
+    """
+    (chunk hash -> row, vectors) of the live snapshot when its vectors can be
+    reused: same embedding model and stored unreduced. Otherwise ({}, None).
+    """
+    version = current_version()
+    manifest = read_manifest(version) if version else {}
+    if manifest.get("embedding_model") != model_id or manifest.get("dim_reduction", {}).get("mode", "none") != "none":
+        return {}, None
+    d = snapshot_dir(version)
+    try:
+        vectors = np.load(os.path.join(d, VECTORS_FILE), mmap_mode="r")
+        if has_chunks_blob(version):
+            old_chunks = MappedChunks(d)
+        else:
+            with open(os.path.join(d, CHUNKS_FILE), "rb") as f:
+                old_chunks = pickle.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("⚠️  Not reusing vectors of version %s: %s", version, e)
+        return {}, None
+    return {_chunk_key(c): i for i, c in enumerate(old_chunks)}, vectors
+
+def _embed_chunks(embedding_client, chunks, token_counts, reuse: bool, progress=None, switches: int = 0):
+    """
+    (X, model id): (n, dim) float32 embeddings of chunks and the model that
+    produced them. With `reuse`, chunks whose text is already in the live
+    snapshot take its vector, so an incremental build only embeds new or
+    changed text. Reuse is keyed on the provider calls resolve to, not on
+    EMBEDDING_PROVIDER, which may be "auto". If the provider changes mid-build,
+    every chunk is embedded again, at most MAX_PROVIDER_SWITCHES times.
+    """
+    provider = embedding_client.resolved_provider()
+    model_id = embedding_client.model_id(provider) if provider else None
+    rows, old_vectors = _previous_vectors(model_id) if reuse and model_id else ({}, None)
+    reused, missing = [], []
+    for i, chunk in enumerate(chunks):
+        row = rows.get(_chunk_key(chunk)) if old_vectors is not None else None
+        (missing if row is None else reused).append((i, row))
+
+    X = None  # allocated once the dimension is known
+    if reused:
+        X = np.empty((len(chunks), old_vectors.shape[1]), dtype="float32")
+        reused.sort(key=lambda pair: pair[1])  # ascending rows: sequential reads from the memmap
+        X[[i for i, _ in reused]] = old_vectors[[row for _, row in reused]]
+        INGEST_ITEMS.labels("chunks_reused").inc(len(reused))
+    logger.info("Embedding %d chunks (%d reused from the live index)...", len(missing), len(reused))
+
+    # Background priority: queries get embedding capacity first
+    with request_context(priority=PRIORITY_BACKGROUND):
+        for start, end in _batches([token_counts[i] for i, _ in missing], EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKENS):
+            ids = [i for i, _ in missing[start:end]]
+            # float32, already normalized, plus the provider that answered this very call
+            batch_embeddings, provider = embedding_client.embed_array_with_provider([chunks[i] for i in ids])
+            used = embedding_client.model_id(provider)
+            if X is not None and used != model_id:
+                # A fallback provider answered: its vectors can't be mixed with reused or earlier ones
+                if switches >= MAX_PROVIDER_SWITCHES:
+                    raise RuntimeError(
+                        f"Embedding provider keeps changing during the build (now {used}, was {model_id}, "
+                        f"after {switches} full re-embeds); not mixing vectors of different models. "
+                        f"Retry once the primary provider is stable or pin EMBEDDING_PROVIDER."
+                    )
+                logger.warning("⚠️  Embeddings came from %s instead of %s; re-embedding every chunk",
+                               used, model_id)
+                return _embed_chunks(embedding_client, chunks, token_counts, reuse=False, progress=progress,
+                                     switches=switches + 1)
+            model_id = used
+            if X is None:
+                X = np.empty((len(chunks), batch_embeddings.shape[1]), dtype="float32")
+            X[ids] = batch_embeddings
+            INGEST_ITEMS.labels("chunks_embedded").inc(len(ids))
+            logger.info("Processed %d/%d chunks", end, len(missing))
+            if progress:
+                progress(end, len(missing))
+    return X, model_id
+
+def embed_and_store(progress: Optional[Callable[[int, int], None]] = None, reuse: bool = True):
+    """
+    Chunk processed texts, embed them and publish a new vector store version.
+    Vectors of chunks unchanged since the live version are reused unless
+    `reuse` is False. `progress(done, total)` is called after each embedding
+    batch if given. Returns the new version id, or None if there was nothing
+    to index.
+    """
+    started = time.time()
     embedding_client = get_embedding_client()
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
     chunks: list[str] = []
+    sources: list[str] = []  # processed file each chunk came from
+    documents: dict[str, int] = {}  # chunks per processed file (stats)
+
+    with ingest_timed("chunking"):
+        paths = [os.path.join(PROCESSED_DIR, f) for f in os.listdir(PROCESSED_DIR)]
+        # Structured or recursive per CHUNKING, sized in tokens, documents in parallel
+        for fp, doc_chunks in chunk_documents([p for p in paths if os.path.isfile(p)]):
+            fname = os.path.basename(fp)
+            chunks.extend(doc_chunks)
+            sources.extend([fname] * len(doc_chunks))
+            documents[fname] = len(doc_chunks)
+
+    # Embed each distinct chunk once; duplicates are kept only as attribution
+    with ingest_timed("dedup"):
+        input_chunks = len(chunks)
+        kept, duplicate_of, dedup_counts = dedup_chunks(chunks)
+        new_id = {old: new for new, old in enumerate(kept)}
+        aliases: dict[int, list[str]] = {}  # chunk id -> other documents containing it
+        for dup, original in duplicate_of.items():
+            others = aliases.setdefault(new_id[original], [])
+            if sources[dup] != sources[original] and sources[dup] not in others:
+                others.append(sources[dup])
+        aliases = {i: docs for i, docs in aliases.items() if docs}
+        chunks = [chunks[i] for i in kept]
+        sources = [sources[i] for i in kept]
+        documents = dict.fromkeys(documents, 0)
+        for fname in sources:
+            documents[fname] += 1
+        INGEST_ITEMS.labels("chunks_deduplicated").inc(len(duplicate_of))
+        if duplicate_of:
+            logger.info("Skipped %d duplicate chunks of %d (exact=%d near=%d)",
+                        len(duplicate_of), input_chunks, dedup_counts["exact"], dedup_counts["near"])
 
-    for fname in os.listdir(PROCESSED_DIR):
-        fp = os.path.join(PROCESSED_DIR, fname)
-        if not os.path.isfile(fp):
-            continue
-        with open(fp, "r", encoding="utf-8") as f:
-            text = f.read()
-        chunks.extend(splitter.split_text(text))
+    with ingest_timed("token_count"):
+        token_counts = count_tokens(chunks)
+        chunk_tokens = token_stats(token_counts)
+        INGEST_ITEMS.labels("tokens_chunked").inc(chunk_tokens["total"])
 
     if not chunks:
-        print("No processed text found. Put .txt files in data/processed/")
+        logger.warning("No processed text found. Put .txt files in data/processed/")
         return
 
-    print(f"Embedding {len(chunks)} chunks...")
-    vecs: list[list[float]] = []
-    B = 64  # Batch size
-    for i in range(0, len(chunks), B):
-        batch = chunks[i:i+B]
-        batch_embeddings = embedding_client.embed_texts(batch)
-        vecs.extend(batch_embeddings)
-        print(f"Processed {min(i+B, len(chunks))}/{len(chunks)} chunks")
+    logger.info("Chunk tokens: %s", " ".join(f"{k}={v}" for k, v in chunk_tokens.items()))
+    with ingest_timed("embedding"):
+        X, embedding_model = _embed_chunks(embedding_client, chunks, token_counts, reuse, progress)
 
-    X = np.array(vecs, dtype="float32")
-    X = _normalize(X)
+    # Optional PCA / truncation; queries get the same transform at search time
+    embedding_dim = int(X.shape[1])
+    with ingest_timed("dim_reduction"):
+        reducer = DimReducer.fit(X, INDEX_DIM_REDUCTION, INDEX_TARGET_DIM)
+        if reducer is not None:
+            X = reducer.apply(X)
+            logger.info("Reduced embeddings %d -> %d dims (%s)", embedding_dim, X.shape[1], reducer.mode)
 
-    index = faiss.IndexFlatIP(X.shape[1])  # cosine via normalized dot product
-    index.add(X)
-    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-    faiss.write_index(index, os.path.join(VECTOR_STORE_DIR, "faiss_index.bin"))
+    # Cosine via normalized dot product; split by source document when sharded
+    num_shards = max(1, INDEX_SHARDS)
+    with ingest_timed("index_build"):
+        shards, quantization = build_shards(X, sources, num_shards, INDEX_QUANTIZATION, INDEX_PQ_M)
+    index_files = [INDEX_FILE] if num_shards == 1 else [shard_file(i) for i in range(num_shards)]
 
-    with open(os.path.join(VECTOR_STORE_DIR, "chunks.pkl"), "wb") as f:
-        pickle.dump(chunks, f)
+    # Write a complete new snapshot, then atomically make it the live version
+    with build_lock(), ingest_timed("snapshot_write"), staged_snapshot() as (version, snap_dir):
+        for index, index_file in zip(shards, index_files):
+            faiss.write_index(index, os.path.join(snap_dir, index_file))
+        reduction = reducer.save(snap_dir) if reducer is not None else {"mode": "none"}
+        index_bytes_total = sum(os.path.getsize(os.path.join(snap_dir, f)) for f in index_files)
+        np.save(os.path.join(snap_dir, VECTORS_FILE), X)  # exact vectors for re-scoring
+        with open(os.path.join(snap_dir, SOURCES_FILE), "w", encoding="utf-8") as f:
+            json.dump(sources, f)
+        with open(os.path.join(snap_dir, ALIASES_FILE), "w", encoding="utf-8") as f:
+            json.dump({str(i): docs for i, docs in sorted(aliases.items())}, f)
+        with open(os.path.join(snap_dir, CHUNKS_FILE), "wb") as f:
+            pickle.dump(chunks, f)
+        write_chunks_blob(snap_dir, chunks)
+        file_bytes = {f: os.path.getsize(os.path.join(snap_dir, f)) for f in sorted(os.listdir(snap_dir))}
+        # Everything stats readers need, so they never have to open the index
+        write_manifest(snap_dir, {
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "num_chunks": len(chunks),
+            "dim": int(X.shape[1]),
+            "embedding_dim": embedding_dim,
+            "embedding_model": embedding_model,
+            "dim_reduction": reduction,
+            "index_type": type(shards[0]).__name__,
+            "index_files": index_files,
+            "shard_sizes": [int(ix.ntotal) for ix in shards],
+            "quantization": quantization,
+            "index_bytes": index_bytes_total,
+            "file_bytes": file_bytes,
+            "num_documents": len(documents),
+            "chunk_tokens": chunk_tokens,
+            "dedup": dict(dedup_counts, mode=DEDUP, input_chunks=input_chunks),
+            "documents": documents,
+            "build_seconds": round(time.time() - started, 2),
+        })
 
-    print(f"✅ Stored {len(chunks)} chunks | dim={X.shape[1]}")
+    logger.info(
+        "✅ Stored %d chunks | dim=%d | shards=%d | %s %.1f MB (float32 %.1f MB) | version=%s (%.1fs)",
+        len(chunks), X.shape[1], num_shards, quantization, index_bytes_total / 1e6, X.nbytes / 1e6,
+        version, time.time() - started,
+    )
+    return version
 
 if __name__ == "__main__":
     embed_and_store()
\ No newline at end of file
@@ -1,15 +1,38 @@
 """
 Embedding utilities with fallback support for multiple providers.
 """
+import base64
+import importlib.util
 import numpy as np
-from typing import List, Optional
-from openai import AzureOpenAI, OpenAI
+from typing import List, Optional, Tuple
+from openai import APIConnectionError, APIStatusError, AzureOpenAI, OpenAI
+from backend.admission import EMBEDDING_SCHEDULER
+from backend.circuit_breaker import CircuitOpenError, get_breaker
+from backend.logging_utils import get_logger
+from backend.metrics import EMBEDDING_CALLS
+from backend.tracing import set_attributes, span
+from backend.vector_index import normalize_inplace
 from backend.config import (
     AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION,
     AZURE_OPENAI_EMBEDDING_MODEL, OPENAI_API_KEY, EMBEDDING_PROVIDER,
-    EMBEDDING_MODEL_NAME
+    EMBEDDING_MODEL_NAME, EMBEDDING_TIMEOUT_SECONDS, EMBEDDING_MAX_RETRIES
 )
 
+logger = get_logger(__name__)
+
+SENTENCE_TRANSFORMER_MODEL = "all-MiniLM-L6-v2"
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for errors that say the provider is unhealthy (timeouts, connection errors, 429, 5xx)."""
+    if isinstance(error, (APIConnectionError, TimeoutError, ConnectionError)):  # APITimeoutError included
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
 class EmbeddingClient:
     def __init__(self):
         self.provider = EMBEDDING_PROVIDER.lower()
@@ -26,6 +49,8 @@ class EmbeddingClient:
                 api_key=AZURE_OPENAI_API_KEY,
                 api_version=AZURE_OPENAI_API_VERSION,
                 azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                timeout=EMBEDDING_TIMEOUT_SECONDS,
+                max_retries=EMBEDDING_MAX_RETRIES,
             )
         return self._azure_client
     
@@ -34,69 +59,185 @@ class EmbeddingClient:
         if not OPENAI_API_KEY:
             return None
         if self._openai_client is None:
-            self._openai_client = OpenAI(api_key=OPENAI_API_KEY)
+            self._openai_client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=EMBEDDING_TIMEOUT_SECONDS,
+                max_retries=EMBEDDING_MAX_RETRIES,
+            )
         return self._openai_client
     
+    @staticmethod
+    def model_id(provider: str) -> str:
+        """Which model a provider embeds with; vectors are only interchangeable when these match."""
+        model = {"azure": AZURE_OPENAI_EMBEDDING_MODEL, "openai": EMBEDDING_MODEL_NAME}.get(provider, SENTENCE_TRANSFORMER_MODEL)
+        return f"{provider}:{model}"
+
+    def resolved_provider(self) -> Optional[str]:
+        """
+        The provider calls go to first: the first configured one in the
+        fallback chain (EMBEDDING_PROVIDER may be "auto"). None if none is.
+        """
+        configured = {
+            "azure": lambda: all([AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_EMBEDDING_MODEL]),
+            "openai": lambda: bool(OPENAI_API_KEY),
+            "sentence-transformers": lambda: importlib.util.find_spec("sentence_transformers") is not None,
+        }
+        return next((name for name in self._provider_chain() if configured[name]()), None)
+    
     def _get_sentence_transformer(self):
         """Get sentence transformer model if available."""
         if self._sentence_transformer is None:
             try:
                 from sentence_transformers import SentenceTransformer
-                self._sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
+                self._sentence_transformer = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
             except ImportError:
-                print("sentence-transformers not installed. Install with: pip install sentence-transformers")
+                logger.warning("sentence-transformers not installed. Install with: pip install sentence-transformers")
                 return None
         return self._sentence_transformer
     
+    def _decode_response(self, resp, n: int) -> np.ndarray:
+        """
+        Decode an embeddings response into one preallocated float32 matrix.
+        Base64 payloads are copied straight from the raw bytes; plain float
+        lists (providers that ignore encoding_format) are copied row by row.
+        """
+        data = sorted(resp.data, key=lambda d: d.index)
+        if len(data) != n:
+            raise RuntimeError(f"Embedding provider returned {len(data)} vectors for {n} inputs")
+
+        out: Optional[np.ndarray] = None
+        for row, d in enumerate(data):
+            emb = d.embedding
+            if isinstance(emb, str):
+                vec = np.frombuffer(base64.b64decode(emb), dtype="<f4")
+            else:
+                vec = np.asarray(emb, dtype="float32")
+            if out is None:
+                out = np.empty((n, vec.shape[0]), dtype="float32")
+            out[row] = vec
+        return out
+
+    def _provider_chain(self) -> List[str]:
+        """Providers to try, in order, for the configured EMBEDDING_PROVIDER."""
+        chain = []
+        if self.provider in ["azure", "auto"]:
+            chain.append("azure")
+        if self.provider in ["azure", "openai", "auto"]:
+            chain.append("openai")
+        if self.provider in ["sentence-transformers", "azure", "openai", "auto"]:
+            chain.append("sentence-transformers")
+        return chain
+
+    def _call_provider(self, name: str, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed with one provider. Returns None if that provider isn't configured."""
+        if name == "azure":
+            client = self._get_azure_client()
+            if not client:
+                return None
+            logger.debug("Using Azure OpenAI embeddings: %s", AZURE_OPENAI_EMBEDDING_MODEL)
+            resp = client.embeddings.create(
+                model=AZURE_OPENAI_EMBEDDING_MODEL, input=texts, encoding_format="base64"
+            )
+            return self._decode_response(resp, len(texts))
+        if name == "openai":
+            client = self._get_openai_client()
+            if not client:
+                return None
+            logger.debug("Using OpenAI embeddings: %s", EMBEDDING_MODEL_NAME)
+            resp = client.embeddings.create(
+                model=EMBEDDING_MODEL_NAME, input=texts, encoding_format="base64"
+            )
+            return self._decode_response(resp, len(texts))
+        model = self._get_sentence_transformer()
+        if not model:
+            return None
+        logger.debug("Using local sentence-transformers embeddings")
+        embeddings = model.encode(texts, convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype="float32")
+
+    def _embed_raw(self, texts: List[str]) -> Tuple[np.ndarray, Optional[str]]:
+        """
+        Embed a list of texts using the configured provider with fallbacks.
+        Returns an (n, dim) float32 matrix, not normalized, and the provider
+        that produced it (None for no texts).
+
+        Providers whose circuit is open are skipped without being called, so
+        an outage costs one timeout per reset window instead of one per request.
+        The configured provider itself is strict: if it fails (or its circuit
+        is open) the error is raised rather than silently falling back.
+        Only transient errors count against a provider; client errors (bad
+        request, auth, unknown model) are raised as-is from any provider,
+        since retrying the same input elsewhere would hide a configuration bug.
+
+        Calls hold an EMBEDDING_SCHEDULER slot, so they are queued by request
+        priority and rejected with AdmissionRejected when they cannot meet
+        the request deadline.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype="float32"), None  # nothing to send; the dimension is unknown
+        with span("embed", {"embedding.texts": len(texts)}) as s, EMBEDDING_SCHEDULER.slot():
+            for name in self._provider_chain():
+                strict = name == self.provider
+                breaker = get_breaker(f"embedding:{name}")
+                if not breaker.allow():
+                    EMBEDDING_CALLS.labels(name, "skipped_open_circuit").inc()
+                    s.add_event("provider_skipped", {"embedding.provider": name, "reason": "circuit_open"})
+                    if strict:
+                        raise CircuitOpenError(
+                            f"Embedding provider '{name}' is unavailable (circuit open); "
+                            f"retry in {breaker.snapshot()['retry_in_seconds']}s"
+                        )
+                    continue
+                try:
+                    result = self._call_provider(name, texts)
+                except Exception as e:
+                    EMBEDDING_CALLS.labels(name, "error").inc()
+                    s.add_event("provider_failed", {"embedding.provider": name, "error": str(e)})
+                    logger.warning("%s embeddings failed: %s", name, e, extra={"provider": name})
+                    if not is_transient(e):
+                        breaker.release()
+                        raise
+                    breaker.record_failure(e)
+                    if strict:
+                        raise
+                    continue
+                if result is None:
+                    breaker.release()
+                    continue
+                breaker.record_success()
+                EMBEDDING_CALLS.labels(name, "ok").inc()
+                set_attributes(s, {"embedding.provider": name, "embedding.dim": int(result.shape[1])})
+                return result, name
+
+            raise RuntimeError("No embedding provider available. Please configure Azure OpenAI, OpenAI API, or install sentence-transformers.")
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts into an (n, dim) float32 matrix, L2-normalized in place.
+        Prefer this over embed_texts() for indexing and search.
+        """
+        return self.embed_array_with_provider(texts)[0]
+
+    def embed_array_with_provider(self, texts: List[str]) -> Tuple[np.ndarray, Optional[str]]:
+        """
+        embed_array(), plus the provider that answered this call, which may be
+        a fallback. The client is shared across threads, so callers that care
+        which model produced the vectors must take it from here.
+        """
+        embeddings, provider = self._embed_raw(texts)
+        return normalize_inplace(embeddings), provider
+
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """
         Embed a list of texts using the configured provider with fallbacks.
         """
-        # Try Azure OpenAI first if configured
-        if self.provider == "azure" or self.provider == "auto":
-            try:
-                client = self._get_azure_client()
-                if client:
-                    print(f"Using Azure OpenAI embeddings: {AZURE_OPENAI_EMBEDDING_MODEL}")
-                    resp = client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_MODEL, input=texts)
-                    return [d.embedding for d in resp.data]
-            except Exception as e:
-                print(f"Azure OpenAI embeddings failed: {e}")
-                if self.provider == "azure":
-                    raise
-        
-        # Try regular OpenAI as fallback
-        if self.provider in ["openai", "auto"] or self.provider == "azure":
-            try:
-                client = self._get_openai_client()
-                if client:
-                    print(f"Using OpenAI embeddings: {EMBEDDING_MODEL_NAME}")
-                    resp = client.embeddings.create(model=EMBEDDING_MODEL_NAME, input=texts)
-                    return [d.embedding for d in resp.data]
-            except Exception as e:
-                print(f"OpenAI embeddings failed: {e}")
-                if self.provider == "openai":
-                    raise
-        
-        # Try sentence transformers as final fallback
-        if self.provider in ["sentence-transformers", "auto"] or self.provider in ["azure", "openai"]:
-            try:
-                model = self._get_sentence_transformer()
-                if model:
-                    print("Using local sentence-transformers embeddings")
-                    embeddings = model.encode(texts)
-                    return embeddings.tolist()
-            except Exception as e:
-                print(f"Sentence transformers failed: {e}")
-                if self.provider == "sentence-transformers":
-                    raise
-        
-        raise RuntimeError("No embedding provider available. Please configure Azure OpenAI, OpenAI API, or install sentence-transformers.")
+        return self._embed_raw(texts)[0].tolist()
     
     def embed_single(self, text: str) -> List[float]:
         """Embed a single text."""
         return self.embed_texts([text])[0]
 
+
 # Global instance
 _embedding_client = None
 
@@ -1,5 +1,9 @@
 import os
-from backend.config import DOCS_DIR, PROCESSED_DIR
+from typing import Callable, Iterable, Optional
+from backend.chunking import elements_path, text_elements, write_elements
+from backend.config import DOCS_DIR, ELEMENTS_DIR, PROCESSED_DIR
+from backend.logging_utils import get_logger
+from backend.metrics import INGEST_ITEMS, ingest_timed
 
 # Unstructured import blocks (install unstructured with extras if you want better OCR)
 from unstructured.partition.pdf import partition_pdf
@@ -7,47 +11,152 @@ from unstructured.partition.docx import partition_docx
 from unstructured.partition.ppt import partition_ppt
 from unstructured.partition.pptx import partition_pptx
 
+logger = get_logger(__name__)
+
 def _write_txt(base_name: str, text: str):
     out_path = os.path.join(PROCESSED_DIR, base_name + ".txt")
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(text)
+    return out_path
 
 def _extract_text_generic(path: str) -> str:
     # Fallback for .txt / .csv / etc.
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         return f.read()
 
-def _join(elems):
-    return "\n".join([e.text for e in elems if getattr(e, "text", None)])
-
-def extract_all():
-    for root, _, files in os.walk(DOCS_DIR):
-        for fn in files:
-            fp = os.path.join(root, fn)
-            rel = os.path.relpath(fp, DOCS_DIR)
-            base = os.path.splitext(rel)[0].replace("\\", "__").replace("/", "__")
-
-            try:
-                if fn.lower().endswith(".pdf"):
-                    text = _join(partition_pdf(filename=fp))
-                elif fn.lower().endswith(".docx"):
-                    text = _join(partition_docx(filename=fp))
-                elif fn.lower().endswith(".pptx"):
-                    text = _join(partition_pptx(filename=fp))
-                elif fn.lower().endswith(".ppt"):
-                    text = _join(partition_ppt(filename=fp))
-                elif fn.lower().endswith(".txt") or fn.lower().endswith(".csv"):
-                    text = _extract_text_generic(fp)
-                else:
-                    # Unknown -> try generic read
-                    text = _extract_text_generic(fp)
-                if text and text.strip():
-                    _write_txt(base, text)
-                    print(f"📝 Processed → {base}.txt")
-            except Exception as e:
-                print(f"⚠️  Failed to process {rel}: {e}")
-
-    print("✅ Extraction finished: see data/processed/")
+def _to_dicts(elems):
+    """unstructured elements -> {"type", "text", "page", "depth"} dicts (see backend/chunking.py)"""
+    out = []
+    for e in elems:
+        if not getattr(e, "text", None):
+            continue
+        meta = getattr(e, "metadata", None)
+        element = {"type": getattr(e, "category", "Text"), "text": e.text}
+        page = getattr(meta, "page_number", None)
+        if page is not None:
+            element["page"] = page
+        depth = getattr(meta, "category_depth", None)
+        if depth is not None:
+            element["depth"] = depth
+        out.append(element)
+    return out
+
+def _join(elements):
+    return "\n".join(e["text"] for e in elements)
+
+def _extract_file(fp: str, fn: str):
+    """(flat text, typed elements) of one source file."""
+    if fn.lower().endswith(".pdf"):
+        elements = _to_dicts(partition_pdf(filename=fp))
+    elif fn.lower().endswith(".docx"):
+        elements = _to_dicts(partition_docx(filename=fp))
+    elif fn.lower().endswith(".pptx"):
+        elements = _to_dicts(partition_pptx(filename=fp))
+    elif fn.lower().endswith(".ppt"):
+        elements = _to_dicts(partition_ppt(filename=fp))
+    else:
+        # .txt / .csv / unknown -> generic read, paragraphs as elements
+        text = _extract_text_generic(fp)
+        return text, text_elements(text)
+    return _join(elements), elements
+
+def _base_name(fp: str) -> str:
+    """Processed name of a source file: its path under DOCS_DIR without extension, "/" -> "__"."""
+    rel = os.path.relpath(fp, DOCS_DIR)
+    return os.path.splitext(rel)[0].replace("\\", "__").replace("/", "__")
+
+def processed_path(fp: str) -> str:
+    """PROCESSED_DIR text file that a source file under DOCS_DIR is extracted to."""
+    return os.path.join(PROCESSED_DIR, _base_name(fp) + ".txt")
+
+def extracted_mtime_ns(fp: str) -> Optional[int]:
+    """
+    When a source file was last extracted: the newer of its processed text
+    and its elements file, which is written (empty) even when the source had
+    no text. None if it never was.
+    """
+    out_path = processed_path(fp)
+    mtimes = []
+    for path in (out_path, elements_path(os.path.basename(out_path))):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            pass
+    return max(mtimes) if mtimes else None
+
+def extract_file(fp: str) -> bool:
+    """
+    Extract one source file under DOCS_DIR. If it fails or yields no text,
+    output left from an earlier version of the file is deleted rather than
+    kept in the index; a source without text is still recorded as extracted
+    (an empty elements file), so it is not extracted again until it changes.
+    True if PROCESSED_DIR changed.
+    """
+    base = _base_name(fp)
+    try:
+        with ingest_timed("extract_file"):
+            text, elements = _extract_file(fp, os.path.basename(fp))
+        if text and text.strip():
+            out_path = _write_txt(base, text)
+            write_elements(elements_path(os.path.basename(out_path)), elements)
+            INGEST_ITEMS.labels("documents_extracted").inc()
+            logger.info("📝 Processed → %s.txt", base)
+            return True
+        changed = remove_extracted(fp)
+        write_elements(elements_path(base + ".txt"), [])
+        logger.info("∅ No text in %s", os.path.relpath(fp, DOCS_DIR))
+        return changed
+    except Exception as e:
+        logger.warning("⚠️  Failed to process %s: %s", os.path.relpath(fp, DOCS_DIR), e)
+    return remove_extracted(fp)
+
+def remove_extracted(fp: str) -> bool:
+    """Delete the processed text and elements of a removed source file; True if PROCESSED_DIR changed."""
+    return _remove_outputs(processed_path(fp))
+
+def remove_orphans(sources: Iterable[str]) -> bool:
+    """
+    Delete extracted output whose source file is not in `sources` (removed
+    while nothing was watching). Only text that has an elements file was
+    written by extraction; .txt files put into PROCESSED_DIR by hand are kept.
+    Elements files without text are the records of sources that had none.
+    True if PROCESSED_DIR changed.
+    """
+    expected = {os.path.basename(processed_path(fp)) for fp in sources}
+    names = {name for name in os.listdir(PROCESSED_DIR) if name.endswith(".txt")}
+    names |= {os.path.splitext(name)[0] + ".txt" for name in os.listdir(ELEMENTS_DIR) if name.endswith(".jsonl")}
+    removed = False
+    for name in sorted(names):
+        if name not in expected and os.path.exists(elements_path(name)):
+            removed = _remove_outputs(os.path.join(PROCESSED_DIR, name)) or removed
+    return removed
+
+def _remove_outputs(out_path: str) -> bool:
+    """Delete a processed text file and its elements; True if the text existed."""
+    removed = []
+    for path in (out_path, elements_path(os.path.basename(out_path))):
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info("🗑️  Removed %s", os.path.basename(out_path))
+    return out_path in removed
+
+def extract_all(progress: Optional[Callable[[int, int], None]] = None):
+    """
+    Extract every file under DOCS_DIR into PROCESSED_DIR (flat text) and
+    ELEMENTS_DIR (typed elements for structured chunking).
+    `progress(done, total)` is called after each file if given.
+    """
+    paths = [os.path.join(root, fn) for root, _, files in os.walk(DOCS_DIR) for fn in files]
+    for done, fp in enumerate(paths, start=1):
+        extract_file(fp)
+        if progress:
+            progress(done, len(paths))
+
+    logger.info("✅ Extraction finished: see data/processed/")
 
 if __name__ == "__main__":
     os.makedirs(PROCESSED_DIR, exist_ok=True)
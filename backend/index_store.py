@@ -0,0 +1,326 @@
+"""
+Versioned on-disk layout for the vector store.
+
+    data/vector_store/
+        CURRENT                      <- name of the live version (replaced atomically)
+        versions/<version>/          <- one complete, immutable snapshot per build
+            faiss_index.bin              <- or shard_000.bin ... when INDEX_SHARDS > 1
+            chunks.pkl
+            chunk_sources.json           <- source document of each chunk
+            chunk_aliases.json           <- other documents containing a (near-)duplicate of a chunk
+            vectors.npy                  <- exact float32 vectors (re-scoring, incremental builds)
+            chunks.bin + chunk_offsets.npy   <- same chunks, mmap-friendly
+            manifest.json
+
+Builders write a whole snapshot into a hidden staging directory, rename it
+into place and only then swap CURRENT. Readers resolve CURRENT once and load
+every file from the same version directory, so they can never pair a new
+index with old chunks or read a half-written file.
+
+Stores built before versioning (flat files directly in VECTOR_STORE_DIR) are
+still readable and reported as the "legacy" version.
+"""
+import json
+import os
+import pickle
+import secrets
+import struct
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import VECTOR_STORE_DIR, INDEX_KEEP_VERSIONS
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+
+INDEX_FILE = "faiss_index.bin"
+CHUNKS_FILE = "chunks.pkl"
+MANIFEST_FILE = "manifest.json"
+CHUNKS_BLOB_FILE = "chunks.bin"
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+SOURCES_FILE = "chunk_sources.json"
+ALIASES_FILE = "chunk_aliases.json"
+VECTORS_FILE = "vectors.npy"
+
+VERSIONS_DIR = os.path.join(VECTOR_STORE_DIR, "versions")
+CURRENT_POINTER = os.path.join(VECTOR_STORE_DIR, "CURRENT")
+LEGACY_VERSION = "legacy"
+
+
+def _new_version() -> str:
+    """Sortable, collision-resistant version id, e.g. 20250101T120000-a1b2c3."""
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + secrets.token_hex(3)
+
+
+def _atomic_write_text(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync_tree(path: str) -> None:
+    """Flush every file in a staging directory before it is published."""
+    for fname in os.listdir(path):
+        fp = os.path.join(path, fname)
+        if os.path.isfile(fp):
+            with open(fp, "rb") as f:
+                os.fsync(f.fileno())
+
+
+def current_version() -> Optional[str]:
+    """Return the live version, LEGACY_VERSION for a pre-versioning store, or None."""
+    try:
+        with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except FileNotFoundError:
+        pass
+    if os.path.exists(os.path.join(VECTOR_STORE_DIR, INDEX_FILE)):
+        return LEGACY_VERSION
+    return None
+
+
+def snapshot_dir(version: Optional[str] = None) -> str:
+    """Directory holding the files of `version` (default: the live version)."""
+    version = version or current_version()
+    if version is None or version == LEGACY_VERSION:
+        return VECTOR_STORE_DIR
+    return os.path.join(VERSIONS_DIR, version)
+
+
+def snapshot_paths(version: Optional[str] = None) -> Tuple[str, str]:
+    """Return paths to the FAISS index and chunks store of a version."""
+    d = snapshot_dir(version)
+    return os.path.join(d, INDEX_FILE), os.path.join(d, CHUNKS_FILE)
+
+
+def index_files(version: Optional[str] = None) -> List[str]:
+    """Absolute paths of every index shard of a version."""
+    d = snapshot_dir(version)
+    names = read_manifest(version).get("index_files") or [INDEX_FILE]
+    return [os.path.join(d, name) for name in names]
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(version: Optional[str] = None) -> dict:
+    """Manifest of a version; empty for legacy stores that never wrote one."""
+    try:
+        with open(os.path.join(snapshot_dir(version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def read_chunk_sources(version: Optional[str] = None) -> Tuple[Optional[List[str]], Dict[int, List[str]]]:
+    """
+    Source document of every chunk, and {chunk id: other documents that
+    contained a duplicate of it}. Snapshots written before these files
+    existed give (None, {}) or no aliases.
+    """
+    d = snapshot_dir(version)
+    sources, aliases = None, {}
+    if os.path.exists(os.path.join(d, SOURCES_FILE)):
+        with open(os.path.join(d, SOURCES_FILE), "r", encoding="utf-8") as f:
+            sources = [sys.intern(name) for name in json.load(f)]  # one string per document, not per chunk
+    if os.path.exists(os.path.join(d, ALIASES_FILE)):
+        with open(os.path.join(d, ALIASES_FILE), "r", encoding="utf-8") as f:
+            aliases = {int(i): docs for i, docs in json.load(f).items()}
+    return sources, aliases
+
+
+# FAISS index file: 4-byte type code, then d (int32) and ntotal (int64)
+_INDEX_HEADER = struct.Struct("<4siq")
+_INDEX_TYPES = {
+    b"IxFI": "IndexFlatIP", b"IxF2": "IndexFlatL2", b"IxMp": "IndexIDMap", b"IxM2": "IndexIDMap2",
+    b"IxSQ": "IndexScalarQuantizer", b"IxPq": "IndexPQ",
+}
+
+
+def read_index_header(path: str) -> Tuple[bytes, int, int]:
+    """(type code, dimension, vector count) of a FAISS index file, without reading its vectors."""
+    with open(path, "rb") as f:
+        return _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+
+
+def _legacy_stats(d: str) -> dict:
+    """
+    Stats of a pre-versioning store, which has no manifest: dimension, type and
+    size from the index file header (the vectors are not read) and the chunk
+    count from the chunks file.
+    """
+    index_path, chunks_path = os.path.join(d, INDEX_FILE), os.path.join(d, CHUNKS_FILE)
+    code, dim, ntotal = read_index_header(index_path)
+    stats = {
+        "dim": dim,
+        "embedding_dim": dim,
+        "index_type": _INDEX_TYPES.get(code, code.decode("ascii", "replace")),
+        "shard_sizes": [ntotal],
+        "index_bytes": os.path.getsize(index_path),
+        "file_bytes": {name: os.path.getsize(os.path.join(d, name)) for name in (INDEX_FILE, CHUNKS_FILE)
+                       if os.path.exists(os.path.join(d, name))},
+    }
+    if os.path.exists(chunks_path):
+        with open(chunks_path, "rb") as f:
+            stats["num_chunks"] = len(pickle.load(f))
+    return stats
+
+
+_stats_cache: Tuple[Optional[str], dict] = (None, {})
+_stats_lock = threading.Lock()
+
+
+def _derive_stats(version: str) -> dict:
+    """
+    Stats of a version from its manifest. Snapshots written before the build
+    recorded document counts and file sizes get them from the small side
+    files (chunk_sources.json, chunk_offsets.npy), never from the index;
+    legacy stores from their index header and chunks file.
+    """
+    d = snapshot_dir(version)
+    stats = dict(read_manifest(version), version=version)
+    if version == LEGACY_VERSION:
+        stats.update(_legacy_stats(d))
+    if "documents" not in stats and os.path.exists(os.path.join(d, SOURCES_FILE)):
+        with open(os.path.join(d, SOURCES_FILE), "r", encoding="utf-8") as f:
+            stats["documents"] = dict(Counter(json.load(f)))
+        stats["num_documents"] = len(stats["documents"])
+    if "num_chunks" not in stats and has_chunks_blob(version):
+        stats["num_chunks"] = len(np.load(os.path.join(d, CHUNK_OFFSETS_FILE), mmap_mode="r")) - 1
+    if "file_bytes" not in stats:
+        stats["file_bytes"] = {f: os.path.getsize(os.path.join(d, f)) for f in sorted(os.listdir(d))}
+    return stats
+
+
+def vector_store_stats() -> Optional[dict]:
+    """
+    Manifest-based statistics of the live version, or None if there is no
+    store. Computed once per version and then served from memory; each call
+    only re-reads the CURRENT pointer to notice a new build.
+    """
+    global _stats_cache
+    version = current_version()
+    if version is None:
+        return None
+    cached_version, stats = _stats_cache
+    if cached_version != version:
+        with _stats_lock:
+            cached_version, stats = _stats_cache
+            if cached_version != version:
+                stats = _derive_stats(version)
+                _stats_cache = (version, stats)
+    return stats
+
+
+def write_chunks_blob(path: str, chunks: Sequence[str]) -> None:
+    """
+    Store chunks as one UTF-8 blob plus an int64 offsets array, so readers can
+    memory-map them and share a single page-cached copy across processes.
+    """
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    with open(os.path.join(path, CHUNKS_BLOB_FILE), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            data = chunk.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(path, CHUNK_OFFSETS_FILE), offsets)
+
+
+class MappedChunks(Sequence):
+    """Read-only, memory-mapped list of chunk strings (decoded on access)."""
+
+    def __init__(self, path: str):
+        self._offsets = np.load(os.path.join(path, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        blob_path = os.path.join(path, CHUNKS_BLOB_FILE)
+        # np.memmap rejects empty files; an empty store has no chunks to read anyway
+        self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+
+def has_chunks_blob(version: Optional[str] = None) -> bool:
+    d = snapshot_dir(version)
+    return os.path.exists(os.path.join(d, CHUNKS_BLOB_FILE)) and os.path.exists(os.path.join(d, CHUNK_OFFSETS_FILE))
+
+
+def list_versions() -> List[str]:
+    """Published versions, oldest first."""
+    if not os.path.isdir(VERSIONS_DIR):
+        return []
+    return sorted(v for v in os.listdir(VERSIONS_DIR)
+                  if not v.startswith(".") and os.path.isdir(os.path.join(VERSIONS_DIR, v)))
+
+
+def prune_versions(keep: int = INDEX_KEEP_VERSIONS) -> None:
+    """
+    Delete all but the newest `keep` versions (never the live one).
+    Processes that already loaded an old version keep working: the index is
+    held in memory, and on POSIX open or mapped files outlive their unlink.
+    """
+    live = current_version()
+    versions = list_versions()
+    for version in versions[:max(0, len(versions) - max(1, keep))]:
+        if version != live:
+            shutil.rmtree(os.path.join(VERSIONS_DIR, version), ignore_errors=True)
+
+
+@contextmanager
+def build_lock() -> Iterator[None]:
+    """Serialize snapshot builds across processes sharing the store."""
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    with open(os.path.join(VECTOR_STORE_DIR, ".build.lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def staged_snapshot() -> Iterator[Tuple[str, str]]:
+    """
+    Yield (version, staging_dir) for a new snapshot. Write every file into
+    staging_dir; on normal exit the snapshot is published as the live version,
+    on error the staging directory is discarded and CURRENT is untouched.
+    """
+    version = _new_version()
+    staging = os.path.join(VERSIONS_DIR, f".{version}.partial")
+    os.makedirs(staging)
+    try:
+        yield version, staging
+        _fsync_tree(staging)
+        os.rename(staging, os.path.join(VERSIONS_DIR, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _atomic_write_text(CURRENT_POINTER, version)
+    prune_versions()
@@ -7,10 +7,13 @@ from typing import List, Dict, Optional
 import requests
 from msal import ConfidentialClientApplication, PublicClientApplication
 from backend.config import DOCS_DIR
+from backend.logging_utils import get_logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # OneDrive/Microsoft Graph API configuration
 CLIENT_ID = os.getenv("MICROSOFT_CLIENT_ID")
 CLIENT_SECRET = os.getenv("MICROSOFT_CLIENT_SECRET")  # Optional for public client
@@ -56,12 +59,12 @@ class OneDriveClient:
                 return
         
         # Interactive authentication - always use interactive flow for delegated permissions
-        print("🔐 Opening browser for Microsoft authentication...")
+        logger.info("🔐 Opening browser for Microsoft authentication...")
         result = self.app.acquire_token_interactive(scopes=SCOPES)
         
         if "access_token" in result:
             self.access_token = result["access_token"]
-            print("✅ Successfully authenticated with Microsoft Graph")
+            logger.info("✅ Successfully authenticated with Microsoft Graph")
         else:
             error_msg = result.get('error_description', result.get('error', 'Unknown error'))
             raise Exception(f"Authentication failed: {error_msg}")
@@ -115,7 +118,7 @@ class OneDriveClient:
         """Download a file from OneDrive."""
         download_url = item.get("@microsoft.graph.downloadUrl")
         if not download_url:
-            print(f"⚠️  No download URL for {item['name']}")
+            logger.warning("⚠️  No download URL for %s", item['name'])
             return
         
         content = self._download_file_content(download_url)
@@ -124,7 +127,7 @@ class OneDriveClient:
         with open(dest_path, "wb") as f:
             f.write(content)
         
-        print(f"⬇️  Downloaded: {dest_path}")
+        logger.info("⬇️  Downloaded: %s", dest_path)
 
 def _safe_name(name: str) -> str:
     """Create a safe filename by removing invalid characters."""
@@ -168,22 +171,22 @@ def fetch_onedrive_folder(folder_path: str = "/"):
                             from datetime import datetime
                             remote_mtime = datetime.fromisoformat(remote_mtime_str.replace("Z", "+00:00")).timestamp()
                             if local_mtime >= remote_mtime:
-                                print(f"⏭️  Skipping (up to date): {os.path.join(local_prefix, name) if local_prefix else name}")
+                                logger.info("⏭️  Skipping (up to date): %s", os.path.join(local_prefix, name) if local_prefix else name)
                                 continue
                     
                     client.download_file(item, dest_path)
                     
         except Exception as e:
-            print(f"⚠️  Error processing folder {current_path}: {e}")
+            logger.warning("⚠️  Error processing folder %s: %s", current_path, e)
     
     recurse_folder(folder_path)
-    print("✅ OneDrive ingestion complete.")
+    logger.info("✅ OneDrive ingestion complete.")
 
 if __name__ == "__main__":
     if not CLIENT_ID:
-        print("❌ Set MICROSOFT_CLIENT_ID in .env file")
+        logger.error("❌ Set MICROSOFT_CLIENT_ID in .env file")
         sys.exit(1)
     
     folder_path = ONEDRIVE_FOLDER_PATH or "/"
-    print(f"📁 Fetching from OneDrive folder: {folder_path}")
+    logger.info("📁 Fetching from OneDrive folder: %s", folder_path)
     fetch_onedrive_folder(folder_path)
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Minimal in-process background job runner.
+
+Long operations (like a full reindex) are submitted as jobs and run on a
+small worker pool; callers get a job id back immediately and poll for
+status. Submitting a job while another job of the same kind is queued or
+running returns the existing job instead of starting a duplicate.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from backend.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = secrets.token_hex(6)
+        self.kind = kind
+        self.status = QUEUED
+        self.stage = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def update(self, stage: Optional[str] = None, progress: Optional[float] = None, message: Optional[str] = None) -> None:
+        """Report progress from inside the job function."""
+        if stage is not None:
+            self.stage = stage
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+
+    def to_dict(self) -> dict:
+        elapsed_end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed_end - (self.started_at or elapsed_end), 1),
+        }
+
+
+class JobRunner:
+    def __init__(self, max_workers: int = 1, history: int = 50):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], dedupe: bool = True) -> Tuple[Job, bool]:
+        """
+        Queue fn(job) in the background. Returns (job, created); created is
+        False when an active job of the same kind was returned instead.
+        """
+        with self._lock:
+            if dedupe:
+                for job in reversed(self._jobs.values()):
+                    if job.kind == kind and job.active:
+                        return job, False
+            job = Job(kind)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.active:
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.update(stage="running")
+        try:
+            job.result = fn(job)
+            job.status = SUCCEEDED
+            job.update(stage="done", progress=1.0)
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            job.update(stage="failed")
+            logger.exception("❌ Job %s/%s failed: %s", job.kind, job.id, e, extra={"job_id": job.id})
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, kind: Optional[str] = None) -> Optional[Job]:
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if kind is None or job.kind == kind:
+                    return job
+        return None
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        """Known jobs, newest first."""
+        with self._lock:
+            return [j for j in reversed(self._jobs.values()) if kind is None or j.kind == kind]
+
+
+# Global instance
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Get the global job runner instance."""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner()
+    return _job_runner
@@ -1,5 +1,9 @@
-from openai import AzureOpenAI
-from backend.retriever import retrieve_relevant_chunks
+from openai import APITimeoutError, AzureOpenAI
+from backend.admission import LLM_SCHEDULER, AdmissionRejected, current_context, remaining_time
+from backend.metrics import COALESCED_REQUESTS, LLM_TOKENS, timed
+from backend.singleflight import SingleFlight
+from backend.tracing import set_attributes, span
+from backend.retriever import current_index_version, retrieve_relevant_chunks
 from backend.config import (
     AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT,
     AZURE_OPENAI_API_VERSION, AZURE_OPENAI_DEPLOYMENT
@@ -11,16 +15,66 @@ _client = AzureOpenAI(
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
 )
 
+_in_flight = SingleFlight()
+# Failures that say the leader's deadline ran out, not that the question can't be answered
+DEADLINE_ERRORS = (AdmissionRejected, APITimeoutError)
+
+def _question_key(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question."""
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
 def generate_answer(query: str) -> str:
+    """
+    Answer a question from the indexed documents. Concurrent identical
+    questions (same normalized text, same index version, same priority) share
+    one retrieval and chat completion instead of each paying for their own;
+    a caller whose shared call ran out of the leader's time budget retries
+    under its own.
+    """
+    with timed("generate_answer"), span("generate_answer", {"query.chars": len(query)}) as s:
+        _, priority = current_context()
+        key = (_question_key(query), current_index_version(), priority)
+        answer, shared = _in_flight.do(key, lambda: _generate_answer(query), retry_on=DEADLINE_ERRORS)
+        set_attributes(s, {"coalesced": shared})
+        if shared:
+            COALESCED_REQUESTS.labels("generate_answer").inc()
+        return answer
+
+def _generate_answer(query: str) -> str:
     context = retrieve_relevant_chunks(query)
+    with timed("prompt_assembly"):
+        messages = [
+            {"role": "system", "content": "You are a helpful document assistant. Use the context faithfully; say 'Not found in docs' if needed."},
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
+        ]
+    return _chat_completion(messages)
+
+def summarize_text(text: str) -> str:
+    """Short summary of a document excerpt (get_document_content summaries)."""
     messages = [
-        {"role": "system", "content": "You are a helpful document assistant. Use the context faithfully; say 'Not found in docs' if needed."},
-        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
+        {"role": "system", "content": "Summarize the document in 3-5 sentences. Only use what the text says."},
+        {"role": "user", "content": text},
     ]
-    resp = _client.chat.completions.create(
-        model=AZURE_OPENAI_DEPLOYMENT,   # deployment name
-        messages=messages,
-        temperature=0.2,
-        max_tokens=500,
-    )
+    return _chat_completion(messages, max_tokens=250)
+
+def _chat_completion(messages: list, max_tokens: int = 500) -> str:
+    with timed("chat_completion"), span("chat_completion", {"gen_ai.request.model": AZURE_OPENAI_DEPLOYMENT}) as s, \
+            LLM_SCHEDULER.slot():
+        budget = remaining_time()
+        resp = _client.chat.completions.create(
+            model=AZURE_OPENAI_DEPLOYMENT,   # deployment name
+            messages=messages,
+            temperature=0.2,
+            max_tokens=max_tokens,
+            # Don't outlive the caller's deadline (the SDK default is 10 minutes)
+            **({"timeout": max(1.0, budget)} if budget is not None else {}),
+        )
+        if resp.usage:
+            LLM_TOKENS.labels("prompt").inc(resp.usage.prompt_tokens)
+            LLM_TOKENS.labels("completion").inc(resp.usage.completion_tokens)
+            set_attributes(s, {
+                "gen_ai.usage.input_tokens": resp.usage.prompt_tokens,
+                "gen_ai.usage.output_tokens": resp.usage.completion_tokens,
+                "gen_ai.response.finish_reason": resp.choices[0].finish_reason,
+            })
     return resp.choices[0].message.content
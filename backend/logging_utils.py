@@ -0,0 +1,127 @@
+"""
+Structured, non-blocking logging for the backend and the MCP servers.
+
+configure_logging() makes a QueueHandler the root logger's only handler.
+Request threads and the event loop only enqueue records; a QueueListener
+thread formats them and does the (possibly slow) console and LOG_FILE writes.
+Handlers installed earlier (a library calling logging.basicConfig()) are
+removed, so records are neither printed twice nor written synchronously.
+Call it before creating objects that configure logging themselves (FastMCP).
+
+    LOG_LEVEL              records below this level are dropped before any
+                           formatting (use %-style arguments, not f-strings)
+    LOG_FORMAT             "text" for humans, "json" for one object per line
+    LOG_FILE               also append to this file ("" = console only)
+    LOG_DEBUG_SAMPLE_RATE  keep this fraction of DEBUG records, so per-request
+                           debug logging can stay on under load
+
+Structured fields go in `extra`, e.g.
+    logger.info("Tool call finished", extra={"tool": name, "ms": 12.5})
+and become keys of the JSON object (or key=value pairs in text mode).
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from backend.config import LOG_DEBUG_SAMPLE_RATE, LOG_FILE, LOG_FORMAT, LOG_LEVEL
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_text:  # rendered by _Enqueue before the record crossed threads
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class DebugSampler(logging.Filter):
+    """Keep a random fraction of DEBUG records; INFO and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class _Enqueue(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback in the calling thread, so the listener
+        # never touches caller objects; extra fields stay on the record.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> None:
+    """Make the queue-based handler the root's only handler, once per process (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if LOG_FILE:
+            handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        enqueue = _Enqueue(log_queue)
+        enqueue.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(enqueue)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # flush queued records on exit
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Module logger; configures logging on first use."""
+    configure_logging()
+    return logging.getLogger(name)
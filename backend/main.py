@@ -1,10 +1,21 @@
+import math
 import os
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from starlette.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+from backend.admission import (
+    PRIORITY_INTERACTIVE, AdmissionRejected, request_context, scheduler_states, timeout_from_headers
+)
+from backend.circuit_breaker import breaker_states
 from backend.llm_answer import generate_answer
-from backend.mcp_server import mcp
+from backend.metrics import render_metrics
+from backend.tracing import remote_parent, span
+
+try:
+    from backend.mcp_server import mcp
+except ImportError:  # MCP tools are served by mcp-new-main/mcp_server_oauth.py instead
+    mcp = None
 
 app = FastAPI(
     title="Document Agent MCP Server", 
@@ -22,7 +33,8 @@ app.add_middleware(
 )
 
 # Expose MCP over HTTP at /mcp
-app.mount("/mcp", mcp.streamable_http_app())
+if mcp is not None:
+    app.mount("/mcp", mcp.streamable_http_app())
 
 
 class Query(BaseModel):
@@ -31,14 +43,29 @@ class Query(BaseModel):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "providers": breaker_states(), "admission": scheduler_states()}
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (per-stage latency, embedding calls, tokens)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
+# Plain def: FastAPI runs it in its threadpool, so a request waiting on an
+# identical in-flight question (or on the LLM) never blocks the event loop
 @app.post("/ask")
-async def ask_question(q: Query):
+def ask_question(q: Query, request: Request):
     try:
-        answer = generate_answer(q.question)
+        with remote_parent(request.headers), span("http.ask"), \
+                request_context(timeout_from_headers(request.headers), PRIORITY_INTERACTIVE):
+            answer = generate_answer(q.question)
         return {"answer": answer}
+    except AdmissionRejected as e:
+        # Shed under load: tell the client when to come back
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
     except FileNotFoundError as e:
         # Vector store not built yet
         raise HTTPException(status_code=503, detail=str(e))
@@ -65,6 +92,7 @@ def server_info():
         "endpoints": {
             "mcp": "/mcp - MCP protocol endpoint",
             "health": "/health - Health check",
+            "metrics": "/metrics - Prometheus metrics",
             "ask": "/ask - Direct Q&A endpoint",
             "root": "/ - Server information"
         },
@@ -0,0 +1,91 @@
+"""
+Prometheus metrics for query stages and ingestion.
+
+prometheus_client is optional: without it the helpers below are no-ops and
+the /metrics endpoints say metrics are disabled. With several uvicorn
+workers, set PROMETHEUS_MULTIPROC_DIR to a shared empty directory so
+/metrics aggregates every worker instead of reporting whichever one answered.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+# Query stages run from milliseconds (FAISS) to tens of seconds (chat completion)
+_QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+_INGEST_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "docagent_stage_seconds", "Latency of query-path stages", ["stage"], buckets=_QUERY_BUCKETS)
+    STAGE_ERRORS = Counter(
+        "docagent_stage_errors_total", "Query-path stages that raised", ["stage"])
+    INGEST_SECONDS = Histogram(
+        "docagent_ingest_stage_seconds", "Latency of ingestion stages", ["stage"], buckets=_INGEST_BUCKETS)
+    INGEST_ITEMS = Counter(
+        "docagent_ingest_items_total", "Items processed by ingestion", ["kind"])
+    EMBEDDING_CALLS = Counter(
+        "docagent_embedding_calls_total", "Embedding provider calls", ["provider", "outcome"])
+    LLM_TOKENS = Counter(
+        "docagent_llm_tokens_total", "Chat completion tokens", ["kind"])
+    COALESCED_REQUESTS = Counter(
+        "docagent_coalesced_requests_total", "Requests served by joining an identical in-flight call", ["stage"])
+    BATCH_SIZE = Histogram(
+        "docagent_batch_size", "Items per micro-batch", ["stage"], buckets=_BATCH_BUCKETS)
+    ADMISSION_DECISIONS = Counter(
+        "docagent_admission_total", "Admission decisions for outbound calls", ["scheduler", "outcome"])
+else:
+    STAGE_SECONDS = STAGE_ERRORS = INGEST_SECONDS = INGEST_ITEMS = EMBEDDING_CALLS = LLM_TOKENS = _NoopMetric()
+    COALESCED_REQUESTS = BATCH_SIZE = ADMISSION_DECISIONS = _NoopMetric()
+
+
+@contextmanager
+def timed(stage: str, histogram=None) -> Iterator[None]:
+    """Record the duration of a block under `stage`; exceptions are counted and re-raised."""
+    histogram = histogram or STAGE_SECONDS
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        histogram.labels(stage).observe(time.perf_counter() - start)
+
+
+def ingest_timed(stage: str):
+    """timed() for ingestion stages, which use wider buckets."""
+    return timed(stage, INGEST_SECONDS)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return (body, content_type) for a /metrics response."""
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus_client not installed; metrics disabled\n", "text/plain; charset=utf-8"
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,34 +1,70 @@
 import os
 import pickle
-from typing import Optional, Tuple, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple
 
 import faiss
 import numpy as np
 
-from backend.config import VECTOR_STORE_DIR
+from backend.admission import RequestContext, current_context, shared_context
+from backend.batcher import MicroBatcher
+from backend.config import (
+    INDEX_MMAP, INDEX_REFRESH_SECONDS, INDEX_RESCORE_FACTOR, INDEX_SEARCH_THREADS, QUERY_BATCH_MAX,
+    QUERY_BATCH_WAIT_MS
+)
 from backend.embedding_utils import get_embedding_client
+from backend.logging_utils import get_logger
+from backend.metrics import BATCH_SIZE, timed
+from backend.tracing import set_attributes, span
+from backend.index_store import (
+    VECTORS_FILE, MappedChunks, current_version, has_chunks_blob, index_files, read_chunk_sources, read_index_header,
+    read_manifest, snapshot_dir, snapshot_paths
+)
+from backend.vector_index import DimReducer, rescore, search_shards
+
+logger = get_logger(__name__)
 
 # -------- In-memory singletons (lazy-loaded) --------
 _embedding_client: Optional = None
-_index: Optional[faiss.Index] = None
-_chunks: Optional[List[str]] = None
 
 
-# ----------------- Helpers -----------------
-def _paths() -> Tuple[str, str]:
-    """Return absolute paths to the FAISS index and chunks store."""
-    index_path = os.path.join(VECTOR_STORE_DIR, "faiss_index.bin")
-    chunks_path = os.path.join(VECTOR_STORE_DIR, "chunks.pkl")
-    return index_path, chunks_path
+class _Snapshot:
+    """Index shards and the chunks they were built from. Never mutated after creation."""
+    __slots__ = ("version", "indexes", "chunks", "manifest", "vectors", "reducer", "sources", "aliases")
+
+    def __init__(self, version: str, indexes: List[faiss.Index], chunks: List[str], manifest: dict,
+                 vectors: Optional[np.ndarray] = None, reducer: Optional[DimReducer] = None,
+                 sources: Optional[List[str]] = None, aliases: Optional[Dict[int, List[str]]] = None):
+        self.version = version
+        self.indexes = indexes
+        self.chunks = chunks
+        self.manifest = manifest
+        self.vectors = vectors  # exact float32 memmap, only for quantized indexes
+        self.reducer = reducer  # PCA / truncation the index was built with
+        self.sources = sources  # source document per chunk (None for old stores)
+        self.aliases = aliases or {}  # chunk id -> other documents dedup folded into it
 
+    def documents_of(self, chunk_id: int) -> List[str]:
+        """Every document a chunk appears in: its source, then those holding a duplicate of it."""
+        first = [self.sources[chunk_id]] if self.sources is not None else []
+        return first + self.aliases.get(chunk_id, [])
 
-def _normalize(v: np.ndarray) -> np.ndarray:
-    """L2-normalize vectors (so inner-product approximates cosine)."""
-    n = np.linalg.norm(v, axis=1, keepdims=True)
-    n[n == 0] = 1.0
-    return v / n
+    def project(self, qv: np.ndarray) -> np.ndarray:
+        """Map query embeddings into the index's (possibly reduced) space."""
+        return self.reducer.apply(qv) if self.reducer is not None else qv
 
 
+# Readers take one reference to the live snapshot and use only that; a reload
+# builds a complete new snapshot and swaps this single global (atomic under the GIL).
+_snapshot: Optional[_Snapshot] = None
+_load_lock = threading.Lock()
+_next_refresh_check = 0.0
+_search_pool: Optional[ThreadPoolExecutor] = None
+
+
+# ----------------- Helpers -----------------
 def _embedding_client_once():
     """Get the embedding client once."""
     global _embedding_client
@@ -37,60 +73,216 @@ def _embedding_client_once():
     return _embedding_client
 
 
-def _ensure_loaded() -> None:
-    """Load FAISS index + chunks from disk if not already loaded."""
-    global _index, _chunks
-    if _index is not None and _chunks is not None:
-        return
+def _search_executor(num_shards: int) -> Optional[ThreadPoolExecutor]:
+    """Shared pool for shard fan-out; None when there is nothing to parallelize."""
+    return _search_pool if num_shards > 1 else None
 
-    index_path, chunks_path = _paths()
-    if not (os.path.exists(index_path) and os.path.exists(chunks_path)):
+
+def _ensure_search_pool(num_shards: int) -> None:
+    """Create the fan-out pool the first time a sharded snapshot is loaded."""
+    global _search_pool
+    if num_shards > 1 and _search_pool is None:
+        workers = INDEX_SEARCH_THREADS or min(num_shards, os.cpu_count() or 1)
+        _search_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="faiss-shard")
+
+
+def _load_snapshot(version: Optional[str]) -> _Snapshot:
+    """Read every file of one version from disk."""
+    _, chunks_path = snapshot_paths(version)
+    paths = index_files(version) if version is not None else []
+    if version is None or not (all(os.path.exists(p) for p in paths) and os.path.exists(chunks_path)):
+        expected = "".join(f"- {p}\n" for p in paths or snapshot_paths(version)[:1])
         raise FileNotFoundError(
             "Vector store not found. Expected files:\n"
-            f"- {index_path}\n- {chunks_path}\n"
+            f"{expected}- {chunks_path}\n"
             "Run the embed step to (re)build the vector store."
         )
 
-    _index = faiss.read_index(index_path)
-    with open(chunks_path, "rb") as f:
-        _chunks = pickle.load(f)
+    read = _read_index_mmap if INDEX_MMAP else faiss.read_index
+    indexes = [read(p) for p in paths]
+    _ensure_search_pool(len(indexes))
+    if INDEX_MMAP and has_chunks_blob(version):
+        chunks = MappedChunks(snapshot_dir(version))
+    else:
+        with open(chunks_path, "rb") as f:
+            chunks = pickle.load(f)
+    manifest = read_manifest(version)
+    vectors = None
+    vectors_path = os.path.join(snapshot_dir(version), VECTORS_FILE)
+    if manifest.get("quantization", "flat") != "flat" and os.path.exists(vectors_path):
+        vectors = np.load(vectors_path, mmap_mode="r")
+    reducer = DimReducer.load(snapshot_dir(version), manifest.get("dim_reduction"))
+    sources, aliases = read_chunk_sources(version)
+    return _Snapshot(version, indexes, chunks, manifest, vectors, reducer, sources, aliases)
+
+
+def _read_index_mmap(index_path: str) -> faiss.Index:
+    """
+    Map the index file instead of copying it into process memory, so every
+    worker on the node shares one page-cached copy. The flag depends on the
+    index type: IVF indexes map their inverted lists with IO_FLAG_MMAP, while
+    the flat-coded indexes this repo builds (flat, fp16/sq8, PQ and IndexIDMap
+    shards over them) need IO_FLAG_MMAP_IFC (FAISS >= 1.9), since IO_FLAG_MMAP
+    would quietly read them into memory. Without a usable flag the index is
+    read into memory and the fallback is logged.
+    """
+    code = read_index_header(index_path)[0]
+    flag_name = "IO_FLAG_MMAP" if code.startswith(b"Iw") else "IO_FLAG_MMAP_IFC"
+    flag = getattr(faiss, flag_name, None)
+    if flag is None:
+        logger.warning("⚠️  FAISS %s has no %s; reading %s into memory",
+                       getattr(faiss, "__version__", "?"), flag_name, os.path.basename(index_path))
+        return faiss.read_index(index_path)
+    try:
+        return faiss.read_index(index_path, flag | getattr(faiss, "IO_FLAG_READ_ONLY", 0))
+    except RuntimeError as e:
+        logger.warning("⚠️  %s failed for %s (%s); reading it into memory", flag_name, index_path, e)
+        return faiss.read_index(index_path)
+
+
+def _ensure_loaded(force: bool = False) -> _Snapshot:
+    """
+    Return the live snapshot, loading it from disk if needed.
+
+    Every INDEX_REFRESH_SECONDS one caller checks the CURRENT pointer and, if
+    another process published a newer version, loads it. Other callers keep
+    serving from the previous snapshot meanwhile instead of waiting.
+    """
+    global _snapshot, _next_refresh_check
+    snap = _snapshot
+    if snap is not None and not force and time.monotonic() < _next_refresh_check:
+        return snap
+
+    if not _load_lock.acquire(blocking=snap is None or force):
+        return snap  # another thread is already refreshing
+    try:
+        snap = _snapshot
+        version = current_version()
+        if force or snap is None or snap.version != version:
+            try:
+                snap = _load_snapshot(version)
+            except Exception as e:
+                if force or snap is None:
+                    raise
+                # Keep serving the snapshot we have; retry at the next check
+                logger.warning("⚠️  Failed to load index version %s: %s", version, e)
+            else:
+                _snapshot = snap
+        _next_refresh_check = time.monotonic() + INDEX_REFRESH_SECONDS
+        return snap
+    finally:
+        _load_lock.release()
 
 
 def reload_index() -> None:
     """
     Force the process to reload the FAISS index & chunks from disk.
     Call this after rebuilding the vector store (e.g., MCP reindex()).
+    In-flight queries finish on the snapshot they started with.
     """
-    global _index, _chunks, _embedding_client
-    _index = None
-    _chunks = None
+    global _embedding_client
     _embedding_client = None
-    _ensure_loaded()
+    _ensure_loaded(force=True)
+
+
+def current_index_version() -> Optional[str]:
+    """Version of the snapshot this process is serving, if loaded."""
+    snap = _snapshot
+    return snap.version if snap is not None else None
 
 
-def _embed_query(q: str) -> np.ndarray:
-    """Embed a single query string using the configured embedding provider."""
-    client = _embedding_client_once()
-    embedding = client.embed_single(q)
-    vec = np.array([embedding], dtype="float32")
-    return _normalize(vec)
+def _search(snap: _Snapshot, qv: np.ndarray, k: int):
+    """Top-k over all shards; quantized indexes over-fetch and re-score exactly."""
+    executor = _search_executor(len(snap.indexes))
+    if snap.vectors is None:
+        return search_shards(snap.indexes, qv, k, executor)
+    candidates = min(len(snap.chunks), k * max(1, INDEX_RESCORE_FACTOR))
+    _, cand_ids = search_shards(snap.indexes, qv, candidates, executor)
+    return rescore(snap.vectors, qv, cand_ids, k)
+
+
+def _search_batch(requests: List[Tuple[_Snapshot, str, int, RequestContext]]) -> List[List[Tuple[int, float]]]:
+    """
+    Embed many queries with one provider call and search them with one FAISS
+    call per snapshot (requests that straddle a reload may use two). Each
+    request is (snapshot, query, k, submitter's admission context) with k
+    already clamped to the snapshot; the embedding call is admitted under
+    the members' merged context, not just the leader's.
+    """
+    with timed("embed_query"), span("embed_query", {"batch.size": len(requests)}), \
+            shared_context(ctx for _, _, _, ctx in requests):
+        Q = _embedding_client_once().embed_array([q for _, q, _, _ in requests])  # float32, L2-normalized
+
+    by_snapshot: Dict[int, List[int]] = {}
+    for row, (snap, _, _, _) in enumerate(requests):
+        by_snapshot.setdefault(id(snap), []).append(row)
+
+    results: List[List[Tuple[int, float]]] = [[] for _ in requests]
+    for rows in by_snapshot.values():
+        snap = requests[rows[0]][0]
+        k = max(requests[row][2] for row in rows)  # a top-k list starts with every smaller top-k
+        qv = snap.project(Q[rows])
+        with timed("faiss_search"), span("faiss_search", {
+            "retrieval.k": k, "batch.size": len(rows), "index.shards": len(snap.indexes),
+            "index.rescored": snap.vectors is not None,
+        }):
+            scores, idx = _search(snap, qv, k)
+        for j, row in enumerate(rows):
+            k_row = requests[row][2]
+            results[row] = [(int(i), float(s)) for i, s in zip(idx[j][:k_row], scores[j][:k_row])
+                            if 0 <= i < len(snap.chunks)]
+    return results
+
+
+_query_batcher = MicroBatcher(
+    _search_batch, max_batch=QUERY_BATCH_MAX, max_wait=QUERY_BATCH_WAIT_MS / 1000.0,
+    on_batch=lambda n: BATCH_SIZE.labels("query").observe(n),
+)
+
+
+def _search_snapshot(snap: _Snapshot, query: str, k: int) -> List[Tuple[int, float]]:
+    """Embed, project and search one query against a fixed snapshot (micro-batched)."""
+    if not len(snap.chunks):
+        return []
+    k = max(1, min(k, len(snap.chunks)))  # clamp k to available chunks
+    return _query_batcher.submit((snap, query, k, current_context()))
 
 
 # ----------------- Public API -----------------
-def retrieve_relevant_chunks(query: str, k: int = 4) -> str:
+def search(query: str, k: int = 4) -> List[Tuple[int, float]]:
     """
-    Return top-k chunks concatenated with separators.
+    Return up to k (chunk_id, score) pairs for a query, best first.
     Raises FileNotFoundError if the vector store is missing.
     """
-    _ensure_loaded()
-    assert _index is not None and _chunks is not None
+    snap = _ensure_loaded()
+    return _search_snapshot(snap, query, k)
+
 
-    if not _chunks:
-        return ""
+def retrieve_chunks(query: str, k: int = 4) -> List[Tuple[str, float, List[str]]]:
+    """
+    Return up to k (chunk text, score, documents) for a query, best first.
+    `documents` lists every document the chunk appears in, including
+    (near-)duplicates removed at build time.
+    Raises FileNotFoundError if the vector store is missing.
+    """
+    snap = _ensure_loaded()
+    return [(snap.chunks[i], score, snap.documents_of(i)) for i, score in _search_snapshot(snap, query, k)]
 
-    qv = _embed_query(query)
-    k = max(1, min(k, len(_chunks)))  # clamp k to available chunks
-    scores, idx = _index.search(qv, k)
 
-    selected = [ _chunks[i] for i in idx[0] if 0 <= i < len(_chunks) ]
-    return "\n\n---\n\n".join(selected)
+def retrieve_relevant_chunks(query: str, k: int = 4) -> str:
+    """
+    Return top-k chunks concatenated with separators.
+    Raises FileNotFoundError if the vector store is missing.
+    """
+    with span("retrieve_relevant_chunks", {"retrieval.k": k}) as s:
+        snap = _ensure_loaded()
+        hits = _search_snapshot(snap, query, k)
+        with timed("context_assembly"):
+            context = "\n\n---\n\n".join(snap.chunks[i] for i, _ in hits)
+        set_attributes(s, {
+            "index.version": snap.version,
+            "retrieval.chunks": len(hits),
+            "retrieval.top_score": hits[0][1] if hits else None,
+            "retrieval.context_chars": len(context),
+        })
+        return context
@@ -0,0 +1,61 @@
+"""
+Coalesce concurrent identical calls into one in-flight computation.
+
+The first caller for a key runs the function; callers that arrive with the
+same key while it is running wait for it and get the same result (or the
+same exception). The call runs under the first caller's request context, so
+exceptions that only reflect that context (its deadline ran out) can be
+listed in `retry_on`: a waiter that gets one runs the call itself instead.
+Nothing is cached: once the call finishes, the next caller starts a fresh
+one. Thread-based, because answers are computed in worker threads
+(FastAPI's threadpool, the MCP tool pool).
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple, Type
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           retry_on: Tuple[Type[BaseException], ...] = ()) -> Tuple[Any, bool]:
+        """Run fn() once per in-flight key. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if isinstance(call.error, retry_on):
+                return self.do(key, fn)  # once: waiters retrying together share a fresh call
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,128 @@
+"""
+OpenTelemetry tracing for the query path (MCP tool call -> answer ->
+retrieval -> embeddings -> chat completion).
+
+The OpenTelemetry SDK is optional: without it, or with OTEL_TRACES_EXPORTER
+set to "none", span() is a no-op. Exporters:
+
+    console   pretty-printed spans on stdout
+    file      one JSON span per line appended to OTEL_TRACES_FILE
+    otlp      OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (needs opentelemetry-exporter-otlp-proto-http)
+
+If the process was started under opentelemetry-instrument (or something else
+already installed a tracer provider), spans go to that provider instead.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Mapping, Optional
+
+from backend.config import OTEL_SERVICE_NAME, OTEL_TRACES_EXPORTER, OTEL_TRACES_FILE
+from backend.logging_utils import get_logger
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+EXPORTERS = ("none", "console", "file", "otlp")
+
+_tracer = None
+_initialized = False
+_init_lock = threading.Lock()
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _build_exporter(kind: str):
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "file":
+        out = open(OTEL_TRACES_FILE, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    return OTLPSpanExporter()
+
+
+def _get_tracer():
+    """Configure tracing on first use; None when tracing is disabled."""
+    global _tracer, _initialized
+    if _initialized:
+        return _tracer
+    with _init_lock:
+        if _initialized:
+            return _tracer
+        kind = OTEL_TRACES_EXPORTER
+        if kind not in EXPORTERS:
+            logger.warning("⚠️  Unknown OTEL_TRACES_EXPORTER '%s'. Use one of: %s; tracing disabled", kind, ", ".join(EXPORTERS))
+        elif not OTEL_AVAILABLE:
+            if kind != "none":
+                logger.warning("⚠️  OTEL_TRACES_EXPORTER is set but opentelemetry-sdk is not installed; tracing disabled")
+        elif kind != "none":
+            try:
+                provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+                provider.add_span_processor(BatchSpanProcessor(_build_exporter(kind)))
+                trace.set_tracer_provider(provider)
+                logger.info("🔭 Tracing enabled (%s exporter)", kind)
+            except Exception as e:
+                logger.warning("⚠️  Could not set up %s trace exporter: %s", kind, e)
+        if OTEL_AVAILABLE:
+            # Also picks up a provider installed by opentelemetry-instrument
+            _tracer = trace.get_tracer("docagent")
+        _initialized = True
+    return _tracer
+
+
+def _clean(attributes: dict) -> dict:
+    """OpenTelemetry accepts str/bool/int/float attribute values; drop None."""
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v)
+            for k, v in attributes.items() if v is not None}
+
+
+@contextmanager
+def span(name: str, attributes: Optional[dict] = None) -> Iterator[object]:
+    """
+    Run a block inside a child span of the current trace. Yields the span so
+    callers can add attributes known only at the end (token counts, provider).
+    Exceptions are recorded on the span and re-raised.
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+    with tracer.start_as_current_span(name, attributes=_clean(attributes or {})) as s:
+        yield s
+
+
+def set_attributes(current_span, attributes: dict) -> None:
+    current_span.set_attributes(_clean(attributes))
+
+
+@contextmanager
+def remote_parent(headers: Optional[Mapping[str, str]]) -> Iterator[None]:
+    """Continue a trace from incoming W3C traceparent headers, if any."""
+    if _get_tracer() is None or not headers:
+        yield
+        return
+    token = otel_context.attach(propagate.extract(headers))
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
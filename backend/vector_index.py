@@ -0,0 +1,231 @@
+"""
+FAISS index construction and search shared by the builder (embed.py) and the
+retriever.
+
+A vector store is one or more shards. With a single shard the index is a plain
+IndexFlatIP whose row numbers are chunk ids. With N shards, chunks are routed
+by a stable hash of their source document so a document's chunks stay
+together; each shard is an IndexIDMap carrying global chunk ids, and queries
+fan out to every shard in parallel before the per-shard top-k lists are merged.
+
+Vectors can be stored quantized to cut index memory:
+
+    flat  float32, exact                      4 bytes/dim
+    fp16  half precision                      2 bytes/dim   (2x smaller)
+    sq8   8-bit scalar quantizer              1 byte/dim    (4x smaller)
+    pq    product quantizer, M bytes/vector   e.g. 1536-d, M=96 -> 64x smaller
+
+Lossy modes over-fetch candidates and re-score them exactly against the
+float32 vectors kept in a memory-mapped side file (see rescore()).
+
+Independently, a DimReducer can shrink vectors before indexing (PCA trained
+at build time, or plain truncation for Matryoshka-style models). It is saved
+with the snapshot and applied to queries with the same parameters.
+"""
+import os
+import zlib
+from concurrent.futures import Executor
+from typing import List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from backend.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_inplace(mat: np.ndarray) -> np.ndarray:
+    """L2-normalize rows of a float32 matrix without allocating a copy of it."""
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    np.divide(mat, norms, out=mat)
+    return mat
+
+
+REDUCTION_MODES = ("none", "pca", "truncate")
+PCA_FILE = "pca.bin"
+
+
+class DimReducer:
+    """Maps full-dimension embeddings to the indexed dimension."""
+
+    def __init__(self, mode: str, in_dim: int, out_dim: int, pca: Optional[faiss.VectorTransform] = None):
+        self.mode = mode
+        self.in_dim = in_dim
+        self.out_dim = out_dim
+        self.pca = pca
+
+    @classmethod
+    def fit(cls, X: np.ndarray, mode: str, target_dim: int) -> Optional["DimReducer"]:
+        """Train a reducer on the corpus; None if no reduction applies."""
+        mode = (mode or "none").lower()
+        if mode not in REDUCTION_MODES:
+            raise ValueError(f"Unknown dimension reduction '{mode}'. Use one of: {', '.join(REDUCTION_MODES)}")
+        d = X.shape[1]
+        if mode == "none" or target_dim <= 0 or target_dim >= d:
+            return None
+        if mode == "truncate":
+            return cls(mode, d, target_dim)
+        if X.shape[0] < target_dim:
+            logger.warning("⚠️  PCA to %d dims needs >= %d vectors (have %d); skipping reduction", target_dim, target_dim, X.shape[0])
+            return None
+        pca = faiss.PCAMatrix(d, target_dim)
+        pca.train(X)
+        return cls(mode, d, target_dim, pca)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Reduce and re-normalize (n, in_dim) -> (n, out_dim) float32."""
+        if X.shape[1] != self.in_dim:
+            raise ValueError(f"Expected {self.in_dim}-d embeddings, got {X.shape[1]}-d; was the embedding model changed?")
+        if self.mode == "truncate":
+            out = np.array(X[:, :self.out_dim], dtype="float32")
+        else:
+            out = np.ascontiguousarray(self.pca.apply(np.ascontiguousarray(X, dtype="float32")), dtype="float32")
+        return normalize_inplace(out)
+
+    def save(self, path: str) -> dict:
+        """Persist into a snapshot directory; returns the manifest entry."""
+        if self.pca is not None:
+            faiss.write_VectorTransform(self.pca, os.path.join(path, PCA_FILE))
+        return {"mode": self.mode, "in_dim": self.in_dim, "out_dim": self.out_dim}
+
+    @classmethod
+    def load(cls, path: str, entry: Optional[dict]) -> Optional["DimReducer"]:
+        """Restore from a snapshot directory given its manifest entry."""
+        if not entry or entry.get("mode", "none") == "none":
+            return None
+        pca = faiss.read_VectorTransform(os.path.join(path, PCA_FILE)) if entry["mode"] == "pca" else None
+        return cls(entry["mode"], entry["in_dim"], entry["out_dim"], pca)
+
+
+def shard_of(source: str, num_shards: int) -> int:
+    """Stable shard assignment for a source document (same in every process)."""
+    if num_shards <= 1:
+        return 0
+    return zlib.crc32(source.encode("utf-8")) % num_shards
+
+
+def shard_file(shard: int) -> str:
+    return f"shard_{shard:03d}.bin"
+
+
+QUANTIZATION_MODES = ("flat", "fp16", "sq8", "pq")
+PQ_MIN_TRAIN = 256  # 2^nbits centroids per sub-quantizer need at least this many points
+
+
+def _pq_subquantizers(d: int, m: int = 0) -> int:
+    """Largest divisor of d not above the requested M (default: ~16 dims per code byte)."""
+    m = m or max(1, d // 16)
+    while d % m:
+        m -= 1
+    return m
+
+
+def empty_index(X: np.ndarray, quantization: str = "flat", pq_m: int = 0) -> Tuple[faiss.Index, str]:
+    """
+    Create (and train, if needed) an empty index for vectors like X.
+    Returns the index and the quantization actually used: PQ needs at least
+    PQ_MIN_TRAIN vectors to train and falls back to sq8 on small corpora.
+    """
+    d = X.shape[1]
+    quantization = (quantization or "flat").lower()
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization '{quantization}'. Use one of: {', '.join(QUANTIZATION_MODES)}")
+    if quantization == "pq" and X.shape[0] < PQ_MIN_TRAIN:
+        logger.warning("⚠️  PQ needs >= %d vectors to train (have %d); using sq8", PQ_MIN_TRAIN, X.shape[0])
+        quantization = "sq8"
+
+    if quantization == "flat":
+        return faiss.IndexFlatIP(d), quantization
+    if quantization == "pq":
+        index = faiss.IndexPQ(d, _pq_subquantizers(d, pq_m), 8, faiss.METRIC_INNER_PRODUCT)
+    else:
+        qtype = faiss.ScalarQuantizer.QT_fp16 if quantization == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_INNER_PRODUCT)
+    index.train(X)
+    return index, quantization
+
+
+def build_index(X: np.ndarray, quantization: str = "flat", pq_m: int = 0) -> faiss.Index:
+    """Inner-product index over X (cosine, since vectors are normalized)."""
+    index, _ = empty_index(X, quantization, pq_m)
+    index.add(X)
+    return index
+
+
+def build_shards(X: np.ndarray, sources: Sequence[str], num_shards: int,
+                 quantization: str = "flat", pq_m: int = 0) -> Tuple[List[faiss.Index], str]:
+    """
+    Split X into num_shards indexes by source document. A single shard is a
+    plain index; multiple shards map local rows back to global chunk ids.
+    Quantizers are trained once on the whole corpus and cloned per shard.
+    Returns the shards and the quantization actually used.
+    """
+    template, quantization = empty_index(X, quantization, pq_m)
+    if num_shards <= 1:
+        template.add(X)
+        return [template], quantization
+
+    assignment = np.fromiter((shard_of(s, num_shards) for s in sources), dtype=np.int64, count=len(sources))
+    shards = []
+    for shard in range(num_shards):
+        ids = np.flatnonzero(assignment == shard).astype(np.int64)
+        index = faiss.IndexIDMap(faiss.clone_index(template))
+        if len(ids):
+            index.add_with_ids(X[ids], ids)
+        shards.append(index)
+    return shards, quantization
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def rescore(vectors: np.ndarray, qv: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-rank candidate ids (nq, k') by exact inner product against the float32
+    vectors (typically a read-only memmap, so only candidate rows are paged in)
+    and keep the top k.
+    """
+    out_scores = np.full((ids.shape[0], k), -np.inf, dtype="float32")
+    out_ids = np.full((ids.shape[0], k), -1, dtype=np.int64)
+    for row in range(ids.shape[0]):
+        cand = np.sort(ids[row][ids[row] >= 0])  # sorted ids -> sequential memmap reads
+        if not len(cand):
+            continue
+        exact = np.asarray(vectors[cand], dtype="float32") @ qv[row]
+        order = np.argsort(-exact, kind="stable")[:k]
+        out_scores[row, :len(order)] = exact[order]
+        out_ids[row, :len(order)] = cand[order]
+    return out_scores, out_ids
+
+
+def merge_topk(results: Sequence[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge per-shard (scores, ids) of shape (nq, k_i) into the global top-k."""
+    if len(results) == 1:
+        return results[0]
+    scores = np.concatenate([r[0] for r in results], axis=1)
+    ids = np.concatenate([r[1] for r in results], axis=1)
+    scores = np.where(ids < 0, -np.inf, scores)  # empty slots sort last
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def search_shards(indexes: Sequence[faiss.Index], qv: np.ndarray, k: int,
+                  executor: Optional[Executor] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search every shard for the top-k of each query row and merge.
+    FAISS releases the GIL during search, so an executor gives real
+    parallelism across shards.
+    """
+    live = [ix for ix in indexes if ix.ntotal > 0]
+    if not live:
+        nq = qv.shape[0]
+        return np.full((nq, k), -np.inf, dtype="float32"), np.full((nq, k), -1, dtype=np.int64)
+    if executor is None or len(live) == 1:
+        results = [ix.search(qv, min(k, ix.ntotal)) for ix in live]
+    else:
+        results = list(executor.map(lambda ix: ix.search(qv, min(k, ix.ntotal)), live))
+    return merge_topk(results, k)
@@ -0,0 +1,170 @@
+"""
+Continuous incremental ingestion: python -m backend.watch
+
+Watches DOCS_DIR and keeps the vector store in step with it:
+
+    1. a change is noticed through watchdog (inotify, FSEvents, ...) or, when
+       watchdog is not installed, by scanning every WATCH_POLL_SECONDS
+    2. changes are debounced: nothing happens until DOCS_DIR has been quiet
+       for WATCH_DEBOUNCE_SECONDS, so a burst of saves or a file still being
+       downloaded becomes one update
+    3. only added or modified files are extracted; removed files, and files
+       that no longer yield any text, have their extracted text deleted (a
+       file without text is still recorded as extracted, so it is not
+       extracted again on every startup)
+    4. embed_and_store() publishes a new version, embedding only chunks whose
+       text is not already in the live index
+
+On startup the watcher first catches up with changes made while it was not
+running, including sources deleted in the meantime. Servers pick the new
+version up within INDEX_REFRESH_SECONDS. Run a single
+watcher per store: builds are serialized by the build lock, but every
+watcher would repeat the same work.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import DOCS_DIR, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_SECONDS, WATCH_RETRY_SECONDS
+from backend.embed import embed_and_store
+from backend.extract_answers import extract_file, extracted_mtime_ns, remove_extracted, remove_orphans
+from backend.index_store import current_version
+from backend.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Editor swap files, Office lock files and partial downloads
+_IGNORED_PREFIXES = (".", "~$")
+_IGNORED_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload", ".swp")
+
+
+def _ignored(name: str) -> bool:
+    return name.startswith(_IGNORED_PREFIXES) or name.lower().endswith(_IGNORED_SUFFIXES)
+
+
+def _scan() -> Dict[str, Tuple[int, int]]:
+    """{path: (mtime_ns, size)} of every source file under DOCS_DIR."""
+    files = {}
+    for root, dirs, names in os.walk(DOCS_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if _ignored(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:  # removed while scanning
+                continue
+            files[path] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def _stale(files: Dict[str, Tuple[int, int]]) -> List[str]:
+    """Source files never extracted, or changed since they last were."""
+    stale = []
+    for path, (mtime_ns, _) in files.items():
+        extracted = extracted_mtime_ns(path)
+        if extracted is None or extracted < mtime_ns:
+            stale.append(path)
+    return stale
+
+
+def _start_observer(wake: threading.Event):
+    """watchdog observer that sets `wake` on any change under DOCS_DIR, or None to poll."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        logger.info("watchdog not installed; polling %s every %.1fs", DOCS_DIR, WATCH_POLL_SECONDS)
+        return None
+
+    class _Wake(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type not in ("opened", "closed_no_write"):  # reads don't change anything
+                wake.set()
+
+    observer = Observer()
+    observer.schedule(_Wake(), DOCS_DIR, recursive=True)
+    observer.daemon = True
+    observer.start()
+    logger.info("👀 Watching %s for changes", DOCS_DIR)
+    return observer
+
+
+def _ingest(changed: List[str], removed: List[str]) -> bool:
+    """Extract changed files and drop removed ones; True if PROCESSED_DIR changed."""
+    touched = False
+    for path in changed:
+        touched = extract_file(path) or touched
+    for path in removed:
+        touched = remove_extracted(path) or touched
+    return touched
+
+
+def _update_index() -> bool:
+    started = time.time()
+    try:
+        version = embed_and_store()
+    except Exception:
+        logger.exception("❌ Index update failed; retrying in %.0fs", WATCH_RETRY_SECONDS)
+        return False
+    logger.info("✅ Index updated to version %s in %.1fs", version, time.time() - started)
+    return True
+
+
+def watch(stop: Optional[threading.Event] = None) -> None:
+    """Ingest changes in DOCS_DIR until `stop` is set (or forever)."""
+    stop = stop or threading.Event()
+    wake = threading.Event()
+    os.makedirs(DOCS_DIR, exist_ok=True)
+    observer = _start_observer(wake)
+
+    # Catch up with changes made while no watcher was running
+    known = _scan()
+    pending = _ingest(_stale(known), [])
+    pending = remove_orphans(known) or pending or current_version() is None
+    retry_at = 0.0
+    try:
+        while not stop.is_set():
+            if pending and time.time() >= retry_at:
+                if _update_index():
+                    pending = False
+                else:
+                    retry_at = time.time() + WATCH_RETRY_SECONDS
+
+            if observer is not None:
+                if not wake.wait(timeout=1.0):
+                    continue
+            elif stop.wait(WATCH_POLL_SECONDS):
+                break
+            current = _scan()
+            if current == known and not wake.is_set():
+                continue
+
+            # Debounce: wait until a full quiet period passes with no events and no changes
+            while True:
+                wake.clear()
+                if stop.wait(WATCH_DEBOUNCE_SECONDS):
+                    return
+                settled = _scan()
+                if settled == current and not wake.is_set():
+                    break
+                current = settled
+
+            changed = [p for p, sig in current.items() if known.get(p) != sig]
+            removed = [p for p in known if p not in current]
+            known = current
+            if changed or removed:
+                logger.info("🔄 %d changed, %d removed file(s) in %s", len(changed), len(removed), DOCS_DIR)
+                pending = _ingest(changed, removed) or pending
+    finally:
+        if observer is not None:
+            observer.stop()
+
+
+if __name__ == "__main__":
+    try:
+        watch()
+    except KeyboardInterrupt:
+        pass
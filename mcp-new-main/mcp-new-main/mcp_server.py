@@ -1,9 +1,14 @@
 from __future__ import annotations
+import logging
 import os
 from datetime import datetime, timezone
 
 from mcp.server.fastmcp import FastMCP
 
+# Configure logging before FastMCP() installs a handler of its own
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
 # --- Minimal MCP server ---
 mcp = FastMCP("Time MCP Server")
 
@@ -29,20 +34,16 @@ if API_KEY:
     from starlette.middleware.base import BaseHTTPMiddleware
     from starlette.requests import Request
     from starlette.responses import Response
-    import logging
-    
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
 
     class APIKeyMiddleware(BaseHTTPMiddleware):
         async def dispatch(self, request: Request, call_next):
             # Log all requests
-            logger.info(f"Request: {request.method} {request.url} from {request.client.host}")
+            logger.debug("Request: %s %s from %s", request.method, request.url.path, request.client.host)
             
             # Check API key
             api_key = request.headers.get("X-API-Key")
             if api_key != API_KEY:
-                logger.warning(f"Unauthorized request from {request.client.host}")
+                logger.warning("Unauthorized request from %s", request.client.host)
                 return Response("Unauthorized", status_code=401)
             
             # Add CORS headers
@@ -54,9 +55,9 @@ if API_KEY:
             return response
 
     app.add_middleware(APIKeyMiddleware)
-    print(f"🔐 API Key authentication enabled")
+    logger.info("🔐 API Key authentication enabled")
 else:
-    print("⚠️  No API key configured - server is open to all requests")
+    logger.warning("⚠️  No API key configured - server is open to all requests")
 
 if __name__ == "__main__":
     # Run HTTP server
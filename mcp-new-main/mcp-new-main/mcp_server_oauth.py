@@ -1,51 +1,106 @@
 from __future__ import annotations
+import asyncio
+import contextvars
+import functools
 import os
 import secrets
 import time
+from contextlib import nullcontext
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Optional
+from typing import Optional, Tuple
 import hashlib
 import base64
-import json
+from concurrent.futures import ThreadPoolExecutor
 
 from mcp.server.fastmcp import FastMCP
-from starlette.middleware.base import BaseHTTPMiddleware
+from pydantic import ValidationError
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
 from starlette.routing import Route
 from starlette.applications import Starlette
 
+from token_store import open_token_store
+
 # OAuth 2.0 Configuration
 OAUTH_CLIENT_ID = os.getenv("OAUTH_CLIENT_ID", "servicenow-client")
 OAUTH_CLIENT_SECRET = os.getenv("OAUTH_CLIENT_SECRET", "your-client-secret-here")
 OAUTH_REDIRECT_URI = os.getenv("OAUTH_REDIRECT_URI", "https://your-servicenow-instance.service-now.com/oauth_redirect.do")
 
-# In-memory token storage (use Redis/database in production)
-active_tokens: Dict[str, dict] = {}
-authorization_codes: Dict[str, dict] = {}
-
-# --- MCP Server with FastMCP ---
-mcp = FastMCP("OAuth MCP Server")
+# Token storage: memory:// is per-process; use sqlite:///tokens.db (one host) or
+# redis://host:6379/0 (several hosts) when running more than one worker
+TOKEN_STORE_URL = os.getenv("TOKEN_STORE_URL", "memory://")
+TOKEN_SWEEP_SECONDS = float(os.getenv("TOKEN_SWEEP_SECONDS", "60"))  # How often expired entries are purged
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")  # Serve /metrics without a bearer token
+active_tokens = open_token_store(TOKEN_STORE_URL, "access_token", TOKEN_SWEEP_SECONDS)
+authorization_codes = open_token_store(TOKEN_STORE_URL, "authorization_code", TOKEN_SWEEP_SECONDS)
 
 # Import document agent modules
 import sys
 import os
 sys.path.append('/home/ubuntu/mcp-new')  # Add your main app path
 
+# Before FastMCP(), whose own logging.basicConfig() would otherwise stay on as
+# a second, synchronous console handler
+import logging
+try:
+    from backend.logging_utils import configure_logging
+except ImportError:
+    def configure_logging():
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), force=True)
+configure_logging()
+logger = logging.getLogger("mcp_server_oauth")
+
+# --- MCP Server with FastMCP ---
+mcp = FastMCP("OAuth MCP Server")
+
 try:
     from backend.llm_answer import generate_answer
-    from backend.retriever import reload_index, retrieve_relevant_chunks
-    from backend.config import PROCESSED_DIR, VECTOR_STORE_DIR
+    from backend.retriever import reload_index, retrieve_chunks
+    from backend.config import DOCUMENT_PAGE_BYTES
+    from backend import documents
+    from backend.index_store import vector_store_stats
     from backend.extract_answers import extract_all
     from backend.embed import embed_and_store
-    import pickle
-    import faiss
-    from pathlib import Path
+    from backend.jobs import get_job_runner
     DOCUMENT_AGENT_AVAILABLE = True
-    print("✅ Document agent modules loaded successfully")
+    logger.info("✅ Document agent modules loaded successfully")
 except ImportError as e:
     DOCUMENT_AGENT_AVAILABLE = False
-    print(f"⚠️ Document agent not available: {e}")
+    logger.warning("⚠️ Document agent not available: %s", e)
+
+try:
+    from backend.metrics import render_metrics, timed
+    from backend.tracing import remote_parent, set_attributes, span
+except ImportError:
+    def render_metrics():
+        return b"# backend.metrics not available; metrics disabled\n", "text/plain; charset=utf-8"
+
+    def timed(stage):
+        return nullcontext()
+
+    def span(name, attributes=None):
+        return nullcontext()
+
+    def remote_parent(headers):
+        return nullcontext()
+
+    def set_attributes(current_span, attributes):
+        pass
+
+try:
+    from backend.admission import AdmissionRejected, priority_for_client, request_context, timeout_from_headers
+except ImportError:
+    class AdmissionRejected(Exception):
+        retry_after = 1.0
+
+    def priority_for_client(client_id):
+        return None
+
+    def request_context(timeout=None, priority=None):
+        return nullcontext()
+
+    def timeout_from_headers(headers):
+        return None
 
 # Document Agent Tools
 @mcp.tool(title="Ask document question")
@@ -54,7 +109,10 @@ def ask_document(question: str) -> str:
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available. Please check configuration."
     try:
-        return generate_answer(question)
+        with span("ask_document", {"query.chars": len(question)}):
+            return generate_answer(question)
+    except AdmissionRejected as e:
+        return f"⏳ Server is busy, please retry in {e.retry_after:.0f}s ({e})"
     except FileNotFoundError:
         return "Vector store not found. Please run reindex_documents first."
     except Exception as e:
@@ -66,45 +124,96 @@ def list_documents() -> str:
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available."
     try:
-        docs = sorted([f for f in os.listdir(PROCESSED_DIR) if f.endswith(".txt")])
+        docs = documents.list_documents()
         if not docs:
             return "No documents found. Please run reindex_documents to process documents."
         return f"Available documents ({len(docs)}):\n" + "\n".join(f"- {doc}" for doc in docs)
     except Exception as e:
         return f"Error listing documents: {str(e)}"
 
+def _run_reindex(job) -> str:
+    """Background reindex pipeline: extract -> embed -> reload (progress 0..1)."""
+    job.update(stage="extracting", progress=0.0)
+    extract_all(progress=lambda done, total: job.update(
+        progress=0.2 * done / max(total, 1), message=f"Extracted {done}/{total} files"))
+
+    job.update(stage="embedding", progress=0.2)
+    version = embed_and_store(progress=lambda done, total: job.update(
+        progress=0.2 + 0.75 * done / max(total, 1), message=f"Embedded {done}/{total} chunks"))
+
+    job.update(stage="reloading", progress=0.95)
+    reload_index()
+    return version
+
+def _format_job(job) -> str:
+    info = job.to_dict()
+    lines = [
+        f"Job {info['id']} ({info['kind']}): {info['status']}",
+        f"- Stage: {info['stage']}",
+        f"- Progress: {info['progress'] * 100:.0f}%",
+        f"- Elapsed: {info['elapsed_seconds']}s",
+    ]
+    if info["message"]:
+        lines.append(f"- Detail: {info['message']}")
+    if info["result"]:
+        lines.append(f"- Index version: {info['result']}")
+    if info["error"]:
+        lines.append(f"- Error: {info['error']}")
+    return "\n".join(lines)
+
 @mcp.tool(title="Reindex documents")
 def reindex_documents() -> str:
-    """Re-extract texts from documents and rebuild the FAISS vector index."""
+    """Start a background job that re-extracts texts and rebuilds the FAISS vector index. Returns a job id to poll with get_reindex_status."""
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available."
     try:
-        # Extract documents
-        extract_all()
-        # Build embeddings and FAISS index
-        embed_and_store()
-        # Reload in-memory index
-        reload_index()
-        return "✅ Document reindexing completed successfully. Vector store rebuilt."
+        job, created = get_job_runner().submit("reindex", _run_reindex)
+        if created:
+            return (f"🔄 Reindex job {job.id} started. Queries keep using the current index until it finishes.\n"
+                    f"Poll get_reindex_status with job_id={job.id} for progress.")
+        return (f"⏳ A reindex is already {job.status} (job {job.id}, {job.progress * 100:.0f}%). "
+                f"Poll get_reindex_status with job_id={job.id}.")
     except Exception as e:
-        return f"Error during reindexing: {str(e)}"
+        return f"Error starting reindex: {str(e)}"
+
+@mcp.tool(title="Get reindex job status")
+def get_reindex_status(job_id: str = "") -> str:
+    """Report status and progress of a reindex job (the most recent one if job_id is empty)."""
+    if not DOCUMENT_AGENT_AVAILABLE:
+        return "Document agent not available."
+    runner = get_job_runner()
+    job = runner.get(job_id) if job_id else runner.latest("reindex")
+    if job is None:
+        return f"No reindex job found{f' with id {job_id}' if job_id else ''}."
+    return _format_job(job)
 
 @mcp.tool(title="Get document content")
-def get_document_content(document_name: str) -> str:
-    """Get the full content of a specific processed document by name."""
+def get_document_content(document_name: str, offset: int = 0, length: int = 0, summary: bool = False) -> str:
+    """
+    Read a processed document page by page. Returns `length` bytes (default
+    DOCUMENT_PAGE_BYTES) from byte `offset`, plus the offset of the next page.
+    Set summary=true to prepend a short AI summary of the document.
+    """
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available."
     try:
-        doc_path = Path(PROCESSED_DIR) / document_name
-        if not doc_path.exists():
-            available_docs = [f for f in os.listdir(PROCESSED_DIR) if f.endswith(".txt")]
-            return f"Document '{document_name}' not found. Available documents: {', '.join(available_docs)}"
+        doc = documents.find_document(document_name)
+        if doc is None:
+            similar = documents.similar_documents(document_name)
+            hint = f" Did you mean: {', '.join(similar)}?" if similar else " Use list_documents to see available documents."
+            return f"Document '{document_name}' not found.{hint}"
         
-        content = doc_path.read_text(encoding="utf-8", errors="ignore")
-        # Truncate if too long for display
-        if len(content) > 2000:
-            content = content[:2000] + f"\n\n... (truncated, full document has {len(content)} characters)"
-        return content
+        page = documents.read_range(doc, offset, length or DOCUMENT_PAGE_BYTES)
+        parts = []
+        if summary:
+            parts.append(f"📝 Summary:\n{documents.document_summary(doc)}\n")
+        parts.append(f"📄 {doc.name} (bytes {page.start}-{page.end} of {page.size})\n")
+        parts.append(page.text)
+        if page.end < page.size:
+            parts.append(f"\n\n... more available: call again with offset={page.end}")
+        return "\n".join(parts)
+    except AdmissionRejected as e:
+        return f"⏳ Server is busy, please retry in {e.retry_after:.0f}s ({e})"
     except Exception as e:
         return f"Error reading document: {str(e)}"
 
@@ -114,26 +223,42 @@ def get_vector_stats() -> str:
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available."
     try:
-        idx_path = Path(VECTOR_STORE_DIR) / "faiss_index.bin"
-        ch_path = Path(VECTOR_STORE_DIR) / "chunks.pkl"
-        
-        if not idx_path.exists() or not ch_path.exists():
+        # Served from the build manifest (cached per version): no index load
+        stats = vector_store_stats()
+        if not stats:
             return "Vector store not found. Run reindex_documents to build the index."
         
-        # Load index and chunks
-        index = faiss.read_index(str(idx_path))
-        with open(ch_path, "rb") as f:
-            chunks = pickle.load(f)
+        def mb(n):
+            return f"{n / 1e6:.1f} MB" if n is not None else "n/a"
         
-        # Get document count
-        doc_count = len([f for f in os.listdir(PROCESSED_DIR) if f.endswith(".txt")])
-        
-        return f"""📊 Vector Store Statistics:
-- Documents processed: {doc_count}
-- Text chunks: {len(chunks)}
-- Vector dimensions: {index.d}
-- Index type: {type(index).__name__}
-- Index size: {index.ntotal} vectors"""
+        chunk_counts = stats.get("documents", {})
+        file_bytes = stats.get("file_bytes", {})
+        lines = [
+            "📊 Vector Store Statistics:",
+            f"- Version: {stats['version']} (built {stats.get('created_at', 'n/a')}"
+            f" in {stats.get('build_seconds', 'n/a')}s)",
+            f"- Documents indexed: {stats.get('num_documents', 'n/a')}",
+            f"- Text chunks: {stats.get('num_chunks', 'n/a')}",
+            f"- Vector dimensions: {stats.get('dim', 'n/a')} (embedding {stats.get('embedding_dim', 'n/a')})",
+            f"- Index type: {stats.get('index_type', 'n/a')} ({stats.get('quantization', 'flat')})",
+            f"- Index shards: {len(stats.get('index_files') or [1])}",
+            f"- Index size: {sum(stats.get('shard_sizes') or []) or stats.get('num_chunks', 'n/a')} vectors,"
+            f" {mb(stats.get('index_bytes'))} on disk",
+            f"- Snapshot size: {mb(sum(file_bytes.values()) if file_bytes else None)}",
+        ]
+        dedup = stats.get("dedup")
+        if dedup and dedup.get("mode") != "none":
+            lines.append(f"- Duplicates skipped ({dedup['mode']}): {dedup['exact']} exact, {dedup['near']} near"
+                         f" of {dedup['input_chunks']} chunks")
+        tokens = stats.get("chunk_tokens")
+        if tokens and tokens.get("total"):
+            lines.append(f"- Tokens per chunk ({tokens['tokenizer']}): mean {tokens['mean']}, p95 {tokens['p95']},"
+                         f" max {tokens['max']} ({tokens['total']} total)")
+        if chunk_counts:
+            top = sorted(chunk_counts.items(), key=lambda item: (-item[1], item[0]))[:20]
+            lines.append(f"- Chunks per document (top {len(top)} of {len(chunk_counts)}):")
+            lines.extend(f"    {name}: {count}" for name, count in top)
+        return "\n".join(lines)
     except Exception as e:
         return f"Error getting vector stats: {str(e)}"
 
@@ -143,10 +268,16 @@ def search_chunks(query: str, num_results: int = 4) -> str:
     if not DOCUMENT_AGENT_AVAILABLE:
         return "Document agent not available."
     try:
-        chunks = retrieve_relevant_chunks(query, k=num_results)
-        if not chunks:
+        hits = retrieve_chunks(query, k=num_results)
+        if not hits:
             return "No relevant chunks found for your query."
-        return f"📄 Found {num_results} relevant chunks:\n\n{chunks}"
+        blocks = []
+        for text, score, docs in hits:
+            source = f"📎 {', '.join(docs)} (score {score:.2f})\n" if docs else ""
+            blocks.append(f"{source}{text}")
+        return f"📄 Found {len(hits)} relevant chunks:\n\n" + "\n\n---\n\n".join(blocks)
+    except AdmissionRejected as e:
+        return f"⏳ Server is busy, please retry in {e.retry_after:.0f}s ({e})"
     except FileNotFoundError:
         return "Vector store not found. Please run reindex_documents first."
     except Exception as e:
@@ -164,204 +295,128 @@ def add(a: int, b: int) -> int:
     return a + b
 
 # --- ServiceNow Compatibility Wrapper ---
-async def servicenow_mcp_handler(request: Request):
-    """ServiceNow-compatible MCP handler that wraps FastMCP"""
+# Tool registry generated from the FastMCP tool list, so a new @mcp.tool is
+# callable (and listed) without touching the handler. The tool manager is used
+# directly because FastMCP.call_tool() runs sync tools on the event loop.
+TOOL_REGISTRY = {tool.name: tool for tool in mcp._tool_manager.list_tools()}
+TOOLS_LIST = [
+    {"name": tool.name, "description": tool.description, "inputSchema": tool.parameters}
+    for tool in TOOL_REGISTRY.values()
+]
+
+# Sync tools (LLM calls, FAISS search, file reads) run here instead of on the
+# event loop, so one slow question does not stall every other request
+MCP_TOOL_THREADS = int(os.getenv("MCP_TOOL_THREADS", "8"))
+_tool_pool = ThreadPoolExecutor(max_workers=MCP_TOOL_THREADS, thread_name_prefix="mcp-tool")
+
+def _rpc_result(request_id, result: dict) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+def _rpc_error(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+async def _run_tool(tool, kwargs: dict):
+    if tool.is_async:
+        return await tool.fn(**kwargs)
+    # copy_context() carries the current trace span into the worker thread
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tool_pool, functools.partial(ctx.run, tool.fn, **kwargs))
+
+async def _call_tool(params: dict, request_id) -> dict:
+    tool_name = params.get("name")
+    arguments = params.get("arguments") or {}
+    
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None:
+        return _rpc_error(request_id, -32601, f"Unknown tool: {tool_name}")
+    
+    logger.debug("🛠️ Calling FastMCP tool: %s with args: %s", tool_name, arguments)
+    try:
+        kwargs = tool.fn_metadata.arg_model.model_validate(arguments).model_dump_one_level()
+    except ValidationError as e:
+        return _rpc_error(request_id, -32602, f"Invalid arguments for {tool_name}: {e}")
+    
+    try:
+        with span("mcp.tools/call", {"mcp.tool": tool_name, "jsonrpc.id": request_id}), \
+                timed(f"tool:{tool_name}"):
+            result = await _run_tool(tool, kwargs)
+    except Exception as tool_error:
+        logger.exception("❌ Tool execution error: %s", tool_error, extra={"tool": tool_name})
+        return _rpc_result(request_id, {
+            "content": [{"type": "text", "text": f"Error: {str(tool_error)}"}],
+            "isError": True
+        })
+    
+    logger.debug("✅ Tool result sent to ServiceNow: %.100s", result)  # Truncate long results in log
+    return _rpc_result(request_id, {
+        "content": [{"type": "text", "text": str(result)}],
+        "isError": False
+    })
+
+async def _handle_message(message) -> Optional[dict]:
+    """Handle one JSON-RPC message; None for notifications (no response)."""
+    if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+        return _rpc_error(message.get("id") if isinstance(message, dict) else None, -32600, "Invalid Request")
+    
+    method = message["method"]
+    params = message.get("params") or {}
+    request_id = message.get("id")
+    
+    logger.debug("🔧 ServiceNow MCP method: %s", method, extra={"jsonrpc_id": request_id})
+    
+    if "id" not in message:
+        return None  # notification, e.g. notifications/initialized
+    
     try:
-        data = await request.json()
-        method = data.get("method")
-        params = data.get("params", {})
-        request_id = data.get("id")
-        
-        print(f"🔧 ServiceNow MCP method: {method}")
-        
         if method == "initialize":
             # ServiceNow-compatible initialize response
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "protocolVersion": "2025-03-26",  # Match ServiceNow's version
-                    "capabilities": {
-                        "tools": {"listChanged": False}
-                    },
-                    "serverInfo": {
-                        "name": "OAuth MCP Server",
-                        "version": "1.0.0"
-                    }
-                }
-            }
-            print(f"✅ Initialize response sent to ServiceNow")
-            return JSONResponse(response)
-        
-        elif method == "tools/list":
-            # Get tools from FastMCP and format for ServiceNow
-            tools = [
-                {
-                    "name": "now",
-                    "description": "Get current date and time in ISO 8601 format",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False
-                    }
+            logger.info("✅ Initialize response sent to ServiceNow")
+            return _rpc_result(request_id, {
+                "protocolVersion": "2025-03-26",  # Match ServiceNow's version
+                "capabilities": {
+                    "tools": {"listChanged": False}
                 },
-                {
-                    "name": "add", 
-                    "description": "Add two integers together",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "a": {"type": "integer", "description": "First number"},
-                            "b": {"type": "integer", "description": "Second number"}
-                        },
-                        "required": ["a", "b"],
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "ask_document",
-                    "description": "Answer questions using the SharePoint document index and Azure OpenAI",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "question": {"type": "string", "description": "Question to ask about the documents"}
-                        },
-                        "required": ["question"],
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "list_documents",
-                    "description": "List all processed documents available for querying",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "reindex_documents",
-                    "description": "Re-extract texts from documents and rebuild the FAISS vector index",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "get_document_content",
-                    "description": "Get the full content of a specific processed document by name",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "document_name": {"type": "string", "description": "Name of the document to retrieve"}
-                        },
-                        "required": ["document_name"],
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "get_vector_stats",
-                    "description": "Get statistics about the current vector store and document index",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False
-                    }
-                },
-                {
-                    "name": "search_chunks",
-                    "description": "Search for relevant document chunks without generating an AI answer",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "query": {"type": "string", "description": "Search query"},
-                            "num_results": {"type": "integer", "description": "Number of results to return", "default": 4}
-                        },
-                        "required": ["query"],
-                        "additionalProperties": False
-                    }
+                "serverInfo": {
+                    "name": "OAuth MCP Server",
+                    "version": "1.0.0"
                 }
-            ]
-            
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {"tools": tools}
-            }
-            print(f"✅ Tools list sent to ServiceNow: {len(tools)} tools")
-            return JSONResponse(response)
-        
-        elif method == "tools/call":
-            # Call the actual FastMCP tool functions
-            tool_name = params.get("name")
-            arguments = params.get("arguments", {})
-            
-            print(f"🛠️ Calling FastMCP tool: {tool_name} with args: {arguments}")
-            
-            try:
-                if tool_name == "now":
-                    result = now()
-                elif tool_name == "add":
-                    result = add(arguments.get("a", 0), arguments.get("b", 0))
-                elif tool_name == "ask_document":
-                    result = ask_document(arguments.get("question", ""))
-                elif tool_name == "list_documents":
-                    result = list_documents()
-                elif tool_name == "reindex_documents":
-                    result = reindex_documents()
-                elif tool_name == "get_document_content":
-                    result = get_document_content(arguments.get("document_name", ""))
-                elif tool_name == "get_vector_stats":
-                    result = get_vector_stats()
-                elif tool_name == "search_chunks":
-                    result = search_chunks(
-                        arguments.get("query", ""),
-                        arguments.get("num_results", 4)
-                    )
-                else:
-                    return JSONResponse({
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": {"code": -32601, "message": f"Unknown tool: {tool_name}"}
-                    })
-                
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [{"type": "text", "text": str(result)}],
-                        "isError": False
-                    }
-                }
-                print(f"✅ Tool result sent to ServiceNow: {result[:100]}...")  # Truncate long results in log
-                return JSONResponse(response)
-                
-            except Exception as tool_error:
-                print(f"❌ Tool execution error: {tool_error}")
-                return JSONResponse({
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [{"type": "text", "text": f"Error: {str(tool_error)}"}],
-                        "isError": True
-                    }
-                })
-        
-        else:
-            return JSONResponse({
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {"code": -32601, "message": f"Unknown method: {method}"}
             })
-            
+        if method == "tools/list":
+            logger.debug("✅ Tools list sent to ServiceNow: %d tools", len(TOOLS_LIST))
+            return _rpc_result(request_id, {"tools": TOOLS_LIST})
+        if method == "tools/call":
+            return await _call_tool(params, request_id)
+        if method == "ping":
+            return _rpc_result(request_id, {})
+        return _rpc_error(request_id, -32601, f"Unknown method: {method}")
     except Exception as e:
-        print(f"❌ ServiceNow MCP Error: {e}")
-        return JSONResponse({
-            "jsonrpc": "2.0",
-            "id": data.get("id") if 'data' in locals() else None,
-            "error": {"code": -32603, "message": str(e)}
-        })
+        logger.exception("❌ ServiceNow MCP Error: %s", e)
+        return _rpc_error(request_id, -32603, str(e))
+
+async def servicenow_mcp_handler(request: Request):
+    """
+    ServiceNow-compatible MCP handler that wraps FastMCP. Accepts a single
+    JSON-RPC message or a batch array; batch entries run concurrently.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse(_rpc_error(None, -32700, "Parse error"))
+    
+    # Join the caller's trace when ServiceNow (or a proxy) sends a traceparent header;
+    # the deadline and client priority follow the tool calls into the worker threads
+    client_id = request.scope.get("state", {}).get("oauth_client_id")
+    with remote_parent(request.headers), \
+            request_context(timeout_from_headers(request.headers), priority_for_client(client_id)):
+        if not isinstance(data, list):
+            response = await _handle_message(data)
+            return JSONResponse(response) if response is not None else Response(status_code=202)
+        
+        if not data:
+            return JSONResponse(_rpc_error(None, -32600, "Invalid Request: empty batch"))
+        responses = [r for r in await asyncio.gather(*(_handle_message(m) for m in data)) if r is not None]
+        return JSONResponse(responses) if responses else Response(status_code=202)
 
 # --- OAuth 2.0 Endpoints ---
 
@@ -387,20 +442,18 @@ async def oauth_authorize(request: Request):
     
     # Generate authorization code
     auth_code = secrets.token_urlsafe(32)
-    authorization_codes[auth_code] = {
+    authorization_codes.put(auth_code, {
         "client_id": client_id,
         "redirect_uri": redirect_uri,
         "scope": scope,
-        "expires_at": time.time() + 600,  # 10 minutes
-        "used": False
-    }
+    }, expires_at=time.time() + 600)  # 10 minutes
     
     # Build redirect URL with code and state
     redirect_url = f"{redirect_uri}?code={auth_code}"
     if state:
         redirect_url += f"&state={state}"
     
-    print(f"🔄 Redirecting to: {redirect_url}")
+    logger.debug("🔄 Redirecting to: %s", redirect_uri)
     
     # Return 302 redirect (this is what ServiceNow expects!)
     return RedirectResponse(url=redirect_url, status_code=302)
@@ -418,9 +471,8 @@ async def oauth_token(request: Request):
         form_data = await request.form()
         data = dict(form_data)
     
-    print(f"🎫 Token request data: {data}")
-    print(f"🔍 Content-Type: {content_type}")
-    print(f"🔑 Headers: {dict(request.headers)}")
+    # Never log the request itself: it carries the client secret and authorization code
+    logger.debug("🎫 Token request (Content-Type: %s)", content_type)
     
     # Handle Client Secret Basic authentication (ServiceNow uses this)
     auth_header = request.headers.get("Authorization", "")
@@ -430,21 +482,21 @@ async def oauth_token(request: Request):
         try:
             decoded = base64.b64decode(encoded).decode('utf-8')
             client_id, client_secret = decoded.split(':', 1)
-            print(f"🔐 Basic Auth - Client ID: {client_id}")
+            logger.debug("🔐 Basic Auth - Client ID: %s", client_id)
         except Exception as e:
-            print(f"❌ Basic Auth decode error: {e}")
+            logger.warning("❌ Basic Auth decode error: %s", e)
             return JSONResponse({"error": "invalid_client"}, status_code=401)
     else:
         # Get from form/JSON data
         client_id = data.get("client_id")
         client_secret = data.get("client_secret")
-        print(f"🔐 Form Auth - Client ID: {client_id}")
+        logger.debug("🔐 Form Auth - Client ID: %s", client_id)
     
     grant_type = data.get("grant_type")
     code = data.get("code")
     redirect_uri = data.get("redirect_uri")
     
-    print(f"📋 Grant type: {grant_type}, Code: {code}, Redirect: {redirect_uri}")
+    logger.debug("📋 Grant type: %s, Redirect: %s", grant_type, redirect_uri)
     
     # Validate grant type
     if grant_type != "authorization_code":
@@ -452,43 +504,33 @@ async def oauth_token(request: Request):
     
     # Validate client credentials
     if client_id != OAUTH_CLIENT_ID or client_secret != OAUTH_CLIENT_SECRET:
-        print(f"❌ Client validation failed. Expected: {OAUTH_CLIENT_ID}, Got: {client_id}")
+        logger.warning("❌ Client validation failed for client: %s", client_id)
         return JSONResponse({"error": "invalid_client"}, status_code=401)
     
-    # Validate authorization code
-    if not code or code not in authorization_codes:
-        print(f"❌ Invalid authorization code: {code}")
-        print(f"📋 Available codes: {list(authorization_codes.keys())}")
-        return JSONResponse({"error": "invalid_grant"}, status_code=400)
-    
-    auth_data = authorization_codes[code]
-    
-    # Check if code is expired or used
-    if time.time() > auth_data["expires_at"] or auth_data["used"]:
-        print(f"❌ Authorization code expired or used")
+    # Redeem the authorization code: pop() is atomic, so it is single use across workers
+    auth_data = authorization_codes.pop(code) if code else None
+    if auth_data is None:
+        logger.warning("❌ Authorization code invalid, expired or used (client: %s)", client_id)
         return JSONResponse({"error": "invalid_grant"}, status_code=400)
     
     # Validate redirect URI matches
     if redirect_uri != auth_data["redirect_uri"]:
-        print(f"❌ Redirect URI mismatch. Expected: {auth_data['redirect_uri']}, Got: {redirect_uri}")
+        logger.warning("❌ Redirect URI mismatch. Expected: %s, Got: %s", auth_data['redirect_uri'], redirect_uri)
         return JSONResponse({"error": "invalid_grant"}, status_code=400)
     
-    # Mark code as used
-    auth_data["used"] = True
-    
     # Generate access token
     access_token = secrets.token_urlsafe(32)
     refresh_token = secrets.token_urlsafe(32)
     
     # Store token
-    active_tokens[access_token] = {
+    expires_at = time.time() + 3600  # 1 hour
+    active_tokens.put(access_token, {
         "client_id": client_id,
         "scope": auth_data["scope"],
-        "expires_at": time.time() + 3600,  # 1 hour
         "refresh_token": refresh_token
-    }
+    }, expires_at=expires_at)
     
-    print(f"✅ Token generated successfully for client: {client_id}")
+    logger.info("✅ Token generated successfully for client: %s", client_id)
     
     # Return standard OAuth token response
     return JSONResponse({
@@ -507,13 +549,11 @@ async def oauth_userinfo(request: Request):
     
     token = auth_header[7:]  # Remove "Bearer "
     
-    if token not in active_tokens:
+    # Expired tokens are never returned by the store
+    token_data = active_tokens.get(token)
+    if token_data is None:
         return JSONResponse({"error": "invalid_token"}, status_code=401)
     
-    token_data = active_tokens[token]
-    if time.time() > token_data["expires_at"]:
-        return JSONResponse({"error": "token_expired"}, status_code=401)
-    
     return JSONResponse({
         "sub": "mcp-server-user",
         "name": "MCP Server",
@@ -539,58 +579,71 @@ async def oauth_revoke(request: Request):
             return JSONResponse({"error": "invalid_client"}, status_code=401)
     
     # Revoke the token
-    if token in active_tokens:
-        del active_tokens[token]
+    if token:
+        active_tokens.delete(token)
     
     # Always return 200 for security (don't reveal if token existed)
     return JSONResponse({"revoked": True})
 
 # --- OAuth Middleware ---
-class OAuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Skip OAuth for OAuth endpoints
-        if request.url.path in ["/oauth/authorize", "/oauth/token", "/oauth/userinfo", "/.well-known/oauth-authorization-server"]:
-            return await call_next(request)
-        
-        # Log MCP requests for debugging
-        if request.url.path == "/mcp":
-            try:
-                body = await request.body()
-                if body:
-                    mcp_data = json.loads(body.decode())
-                    print(f"📨 MCP Request: {json.dumps(mcp_data, indent=2)}")
-                
-                # Recreate request for processing
-                async def receive():
-                    return {"type": "http.request", "body": body}
-                
-                request = Request(request.scope, receive)
-            except Exception as e:
-                print(f"❌ Error logging MCP request: {e}")
-        
-        # Check for Bearer token
-        auth_header = request.headers.get("Authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return JSONResponse({"error": "missing_token"}, status_code=401)
-        
-        token = auth_header[7:]  # Remove "Bearer "
+PUBLIC_PATHS = frozenset(["/oauth/authorize", "/oauth/token", "/oauth/userinfo", "/.well-known/oauth-authorization-server"]
+                         + (["/metrics"] if METRICS_PUBLIC else []))
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type, Accept, Authorization, mcp-session-id"),
+]
+
+def _check_bearer(auth_header: str) -> Tuple[Optional[str], Optional[dict]]:
+    """Return (OAuth error code, None) for a bad Authorization header, or (None, token data)."""
+    if not auth_header.startswith("Bearer "):
+        return "missing_token", None
+    
+    token = auth_header[7:]  # Remove "Bearer "
+    
+    # Validate token (expired tokens are never returned by the store)
+    token_data = active_tokens.get(token)
+    if token_data is None:
+        return "invalid_token", None
+    return None, token_data
+
+class OAuthMiddleware:
+    """
+    Pure ASGI bearer-token check. Only the request headers are inspected; the
+    body stream is passed to the app untouched (no buffering, no re-parsing),
+    so streaming responses and large requests work as if there were no
+    middleware.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        # Skip OAuth for OAuth endpoints (and lifespan / websocket scopes)
+        if scope["type"] != "http" or scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
         
-        # Validate token
-        if token not in active_tokens:
-            return JSONResponse({"error": "invalid_token"}, status_code=401)
+        auth_header = ""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value.decode("latin-1")
+                break
         
-        token_data = active_tokens[token]
-        if time.time() > token_data["expires_at"]:
-            del active_tokens[token]  # Clean up expired token
-            return JSONResponse({"error": "token_expired"}, status_code=401)
+        error, token_data = _check_bearer(auth_header)
+        if error:
+            await JSONResponse({"error": error}, status_code=401)(scope, receive, send)
+            return
+        # Exposed as request.state.oauth_client_id (admission priority)
+        scope.setdefault("state", {})["oauth_client_id"] = token_data.get("client_id")
         
         # Add CORS headers
-        response = await call_next(request)
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Accept, Authorization, mcp-session-id"
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + CORS_HEADERS
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_cors)
 
 # --- OAuth Discovery Endpoint ---
 async def oauth_discovery(request: Request):
@@ -608,6 +661,11 @@ async def oauth_discovery(request: Request):
         "scopes_supported": ["mcp:read", "mcp:write"]
     })
 
+async def metrics_endpoint(request: Request):
+    """Prometheus scrape endpoint (bearer token required unless METRICS_PUBLIC=true)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # --- Build Application ---
 # Create OAuth routes
 oauth_routes = [
@@ -616,6 +674,7 @@ oauth_routes = [
     Route("/oauth/userinfo", oauth_userinfo, methods=["GET"]),
     Route("/oauth/revoke", oauth_revoke, methods=["POST"]),
     Route("/.well-known/oauth-authorization-server", oauth_discovery, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
 ]
 
 # Create hybrid app: FastMCP + ServiceNow compatibility
@@ -643,12 +702,12 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8001))
     
-    print("🔐 OAuth 2.0 MCP Server Starting...")
-    print(f"📍 Server URL: http://{host}:{port}")
-    print(f"🔑 Client ID: {OAUTH_CLIENT_ID}")
-    print(f"🔒 Client Secret: {OAUTH_CLIENT_SECRET}")
-    print(f"📋 Authorization URL: http://{host}:{port}/oauth/authorize")
-    print(f"🎫 Token URL: http://{host}:{port}/oauth/token")
-    print(f"👤 UserInfo URL: http://{host}:{port}/oauth/userinfo")
+    logger.info("🔐 OAuth 2.0 MCP Server Starting...")
+    logger.info("📍 Server URL: http://%s:%s", host, port)
+    logger.info("🔑 Client ID: %s", OAUTH_CLIENT_ID)
+    logger.info("🔒 Client Secret: %s", "(set)" if OAUTH_CLIENT_SECRET else "(not set)")
+    logger.info("📋 Authorization URL: http://%s:%s/oauth/authorize", host, port)
+    logger.info("🎫 Token URL: http://%s:%s/oauth/token", host, port)
+    logger.info("👤 UserInfo URL: http://%s:%s/oauth/userinfo", host, port)
     
     uvicorn.run(app, host=host, port=port, log_level="info")
\ No newline at end of file
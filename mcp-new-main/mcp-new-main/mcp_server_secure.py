@@ -9,7 +9,7 @@ from starlette.requests import Request
 from starlette.responses import Response
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # --- Secure MCP server ---
@@ -19,14 +19,14 @@ mcp = FastMCP("Time MCP Server")
 def now() -> str:
     """Return the current date/time in ISO 8601 with UTC offset."""
     result = datetime.now(timezone.utc).astimezone().isoformat()
-    logger.info(f"Time requested: {result}")
+    logger.debug("Time requested: %s", result)
     return result
 
 @mcp.tool(title="Add two integers")
 def add(a: int, b: int) -> int:
     """Return the sum of two integers."""
     result = a + b
-    logger.info(f"Addition requested: {a} + {b} = {result}")
+    logger.debug("Addition requested: %s + %s = %s", a, b, result)
     return result
 
 # --- Security Middleware ---
@@ -35,13 +35,13 @@ API_KEY = os.getenv("API_KEY")
 class SecurityMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Log all requests
-        logger.info(f"Request: {request.method} {request.url} from {request.client.host}")
+        logger.debug("Request: %s %s from %s", request.method, request.url.path, request.client.host)
         
         # Check API key if configured
         if API_KEY:
             api_key = request.headers.get("X-API-Key")
             if api_key != API_KEY:
-                logger.warning(f"Unauthorized request from {request.client.host}")
+                logger.warning("Unauthorized request from %s", request.client.host)
                 return Response("Unauthorized", status_code=401)
         
         # CORS headers for ServiceNow
@@ -67,7 +67,7 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8001))
     
-    logger.info(f"Starting MCP server on {host}:{port}")
+    logger.info("Starting MCP server on %s:%s", host, port)
     if API_KEY:
         logger.info("API key authentication enabled")
     else:
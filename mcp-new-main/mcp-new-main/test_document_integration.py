@@ -64,7 +64,8 @@ def test_data_availability():
     print("📄 Testing data availability...")
     
     try:
-        from backend.config import PROCESSED_DIR, VECTOR_STORE_DIR
+        from backend.config import PROCESSED_DIR
+        from backend.index_store import current_version, index_files, snapshot_paths
         import os
         
         # Check processed documents
@@ -77,11 +78,10 @@ def test_data_availability():
             print("❌ Processed directory not found")
         
         # Check vector store
-        index_path = os.path.join(VECTOR_STORE_DIR, "faiss_index.bin")
-        chunks_path = os.path.join(VECTOR_STORE_DIR, "chunks.pkl")
+        chunks_path = snapshot_paths()[1]
         
-        if os.path.exists(index_path) and os.path.exists(chunks_path):
-            print("✅ Vector store files found")
+        if all(os.path.exists(p) for p in index_files()) and os.path.exists(chunks_path):
+            print(f"✅ Vector store files found (version: {current_version()})")
         else:
             print("❌ Vector store not built - run reindex_documents")
             
@@ -0,0 +1,239 @@
+"""
+Expiring key/value storage for OAuth access tokens and authorization codes.
+
+    memory://                      per-process dict (single worker only)
+    sqlite:///tokens.db            shared by every worker on one host (sqlite:////abs/path.db)
+    redis://localhost:6379/0       shared across hosts; any Redis-protocol server
+                                   (Redis, Valkey, KeyDB, a local redis-server in tests)
+
+Every entry has an absolute expires_at. get() never returns an expired entry
+and pop() is an atomic get-and-delete, so an authorization code can only be
+redeemed once even with several workers racing for it.
+
+Expired entries are swept as a side effect of put(), at most once per
+sweep_interval, through an expiry-ordered index: a min-heap in memory
+(O(log n) per expired entry) and an index on expires_at in SQLite. Redis
+expires keys itself. Persistent backends store a SHA-256 of the key, never
+the token itself.
+"""
+import hashlib
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+
+class TokenStore(ABC):
+    def __init__(self, sweep_interval: float = 60.0):
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def put(self, key: str, data: dict, expires_at: float) -> None:
+        """Store `data` under `key` until the absolute time `expires_at`."""
+        self._put(key, data, expires_at)
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+
+    @abstractmethod
+    def _put(self, key: str, data: dict, expires_at: float) -> None:
+        """Store an entry; put() wraps this with the periodic sweep."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        """Entry data, or None if missing or expired."""
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[dict]:
+        """Atomically remove and return an unexpired entry."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an entry if present."""
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove expired entries; returns how many were removed."""
+        return 0
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class MemoryTokenStore(TokenStore):
+    def __init__(self, sweep_interval: float = 60.0):
+        super().__init__(sweep_interval)
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        # (expires_at, key) min-heap; entries replaced or deleted early are
+        # skipped when they surface, so the heap never outlives the longest TTL
+        self._expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _put(self, key: str, data: dict, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, dict(data))
+            heapq.heappush(self._expiry, (expires_at, key))
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            return dict(entry[1])
+
+    def pop(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == expires_at:
+                    del self._entries[key]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteTokenStore(TokenStore):
+    """One table shared by all namespaces; WAL mode so workers read concurrently."""
+
+    def __init__(self, path: str, namespace: str, sweep_interval: float = 60.0):
+        super().__init__(sweep_interval)
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS oauth_tokens ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS oauth_tokens_expiry ON oauth_tokens (namespace, expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _put(self, key: str, data: dict, expires_at: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO oauth_tokens (namespace, key, data, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, _key_hash(key), json.dumps(data), expires_at),
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT data FROM oauth_tokens WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.namespace, _key_hash(key), time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pop(self, key: str) -> Optional[dict]:
+        conn = self._conn()
+        params = (self.namespace, _key_hash(key))
+        conn.execute("BEGIN IMMEDIATE")  # take the write lock before reading: no double redemption
+        try:
+            row = conn.execute(
+                "SELECT data, expires_at FROM oauth_tokens WHERE namespace = ? AND key = ?", params
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM oauth_tokens WHERE namespace = ? AND key = ?", params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key: str) -> None:
+        self._conn().execute(
+            "DELETE FROM oauth_tokens WHERE namespace = ? AND key = ?", (self.namespace, _key_hash(key))
+        )
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        cursor = self._conn().execute(
+            "DELETE FROM oauth_tokens WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time() if now is None else now),
+        )
+        return cursor.rowcount
+
+
+class RedisTokenStore(TokenStore):
+    """Keys carry a server-side TTL, so there is nothing to sweep."""
+
+    def __init__(self, client, namespace: str):
+        super().__init__(sweep_interval=float("inf"))
+        self.client = client
+        self.prefix = f"mcp-oauth:{namespace}:"
+
+    def _key(self, key: str) -> str:
+        return self.prefix + _key_hash(key)
+
+    def _put(self, key: str, data: dict, expires_at: float) -> None:
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.client.set(self._key(key), json.dumps({"data": data, "expires_at": expires_at}), px=ttl_ms)
+
+    @staticmethod
+    def _decode(raw) -> Optional[dict]:
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["data"] if entry["expires_at"] > time.time() else None
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._decode(self.client.get(self._key(key)))
+
+    def pop(self, key: str) -> Optional[dict]:
+        # MULTI/EXEC rather than GETDEL so servers older than Redis 6.2 work too
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self._key(key))
+        pipe.delete(self._key(key))
+        raw, _ = pipe.execute()
+        return self._decode(raw)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._key(key))
+
+
+def open_token_store(url: str, namespace: str, sweep_interval: float = 60.0) -> TokenStore:
+    """Create the store for `namespace` ("access_token", "authorization_code", ...) from a URL."""
+    scheme = url.split("://", 1)[0].lower() if "://" in url else url.lower()
+    if scheme in ("", "memory"):
+        return MemoryTokenStore(sweep_interval)
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):]
+        if not path:
+            raise ValueError("TOKEN_STORE_URL sqlite:/// needs a file path, e.g. sqlite:///tokens.db")
+        return SqliteTokenStore(path, namespace, sweep_interval)
+    if scheme in ("redis", "rediss", "unix"):
+        import redis  # optional dependency: pip install redis
+        return RedisTokenStore(redis.Redis.from_url(url), namespace)
+    raise ValueError(f"Unsupported TOKEN_STORE_URL '{url}'. Use memory://, sqlite:///path or redis://host:port/db")
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval benchmark and regression check.
+
+Builds the vector store with the real embed_and_store / retriever code, but
+with a deterministic fake embedding provider over a synthetic corpus, then
+measures for every index mode:
+
+    build time, load time, memory, query p50/p95/p99, QPS, recall@k
+    (recall is against exact IndexFlatIP search over full-dimension vectors)
+
+Each mode runs in a fresh subprocess with its own INDEX_* settings and a
+scratch data directory, so memory is measured per mode and data/ is untouched.
+
+    python scripts/bench_retrieval.py --docs 300 --json bench.json
+    python scripts/bench_retrieval.py --docs 300 --baseline bench.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Every knob that shapes the index or the query path is pinned, so neither a
+# local .env (load_dotenv never overrides the environment) nor exported
+# variables leak into the comparison. Chunk sizes are in characters so the
+# corpus chunks the same with or without tiktoken; dedup is off so every mode
+# indexes every chunk.
+BASE_ENV = {
+    "INDEX_QUANTIZATION": "flat",
+    "INDEX_DIM_REDUCTION": "none",
+    "INDEX_TARGET_DIM": "256",
+    "INDEX_SHARDS": "1",
+    "INDEX_MMAP": "false",
+    "INDEX_RESCORE_FACTOR": "4",
+    "CHUNKING": "structured",
+    "CHUNK_TOKENIZER": "",
+    "CHUNK_SIZE": "1000",
+    "CHUNK_OVERLAP": "100",
+    "DEDUP": "none",
+    "EMBEDDING_PROVIDER": "sentence-transformers",  # replaced by the fake; never reaches a network
+    "EMBEDDING_BATCH_SIZE": "64",
+    "EMBEDDING_BATCH_TOKENS": "50000",
+    "QUERY_BATCH_MAX": "32",
+    "QUERY_BATCH_WAIT_MS": "5",
+}
+MODES = {
+    "flat": {},
+    "fp16": {"INDEX_QUANTIZATION": "fp16"},
+    "sq8": {"INDEX_QUANTIZATION": "sq8"},
+    "pq": {"INDEX_QUANTIZATION": "pq"},
+    "pca256": {"INDEX_DIM_REDUCTION": "pca"},
+    "sq8+pca256": {"INDEX_QUANTIZATION": "sq8", "INDEX_DIM_REDUCTION": "pca"},
+    "shards4": {"INDEX_SHARDS": "4"},
+    "mmap": {"INDEX_MMAP": "true"},
+}
+
+
+# ----------------- Worker side (runs inside the scratch directory) -----------------
+class FakeEmbeddingClient:
+    """
+    Deterministic bag-of-words embeddings: every word maps to a fixed random
+    vector, a text is the normalized sum of its words. Texts sharing words are
+    close, which gives recall numbers a meaningful ground truth. No network.
+    """
+
+    def __init__(self, dim: int, seed: int = 0):
+        import numpy as np
+        self._np = np
+        self.dim = dim
+        self.seed = seed
+        self.provider = "fake"
+        self._words = {}
+        self.seconds = 0.0  # time spent embedding, excluded from index build time
+
+    def model_id(self, provider: str) -> str:
+        return f"{provider}:bag-of-words-{self.dim}"
+
+    def resolved_provider(self) -> str:
+        return self.provider
+
+    def _word(self, word: str):
+        vec = self._words.get(word)
+        if vec is None:
+            rng = self._np.random.default_rng(zlib.crc32(word.encode("utf-8")) ^ self.seed)
+            vec = self._words[word] = rng.standard_normal(self.dim).astype("float32")
+        return vec
+
+    def embed_array(self, texts):
+        from backend.vector_index import normalize_inplace
+        t0 = time.perf_counter()
+        out = self._np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for word in text.split():
+                out[i] += self._word(word)
+        normalize_inplace(out)
+        self.seconds += time.perf_counter() - t0
+        return out
+
+    def embed_array_with_provider(self, texts):
+        return self.embed_array(texts), self.provider
+
+    def embed_texts(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_single(self, text):
+        return self.embed_texts([text])[0]
+
+
+def _write_corpus(processed_dir: str, docs: int, words_per_doc: int, vocab: int, seed: int) -> None:
+    """Topic-structured synthetic documents: each draws mostly from its topic's words."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    words = [f"w{i:05d}" for i in range(vocab)]
+    topics = max(2, docs // 4)
+    topic_words = [rng.choice(vocab, size=min(vocab, 300), replace=False) for _ in range(topics)]
+    zipf = 1.0 / np.arange(1, 301)[:min(vocab, 300)]
+    zipf /= zipf.sum()
+    for d in range(docs):
+        topic = topic_words[rng.integers(topics)]
+        picks = np.where(rng.random(words_per_doc) < 0.8,
+                         topic[rng.choice(len(topic), words_per_doc, p=zipf)],
+                         rng.integers(0, vocab, words_per_doc))
+        sentences = [" ".join(words[w] for w in picks[i:i + 12]) + "." for i in range(0, words_per_doc, 12)]
+        paragraphs = ["\n".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+        with open(os.path.join(processed_dir, f"doc_{d:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux), else peak RSS."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _percentile(values, p: float) -> float:
+    import numpy as np
+    return float(np.percentile(values, p)) if len(values) else 0.0
+
+
+def run_worker(mode: str, args) -> dict:
+    import faiss
+    import numpy as np
+    from backend import embedding_utils, retriever
+    from backend.config import PROCESSED_DIR
+    from backend.embed import embed_and_store
+
+    _write_corpus(PROCESSED_DIR, args.docs, args.words_per_doc, args.vocab, args.seed)
+    fake = FakeEmbeddingClient(args.dim, args.seed)
+    embedding_utils._embedding_client = fake  # get_embedding_client() now returns the fake
+
+    t0 = time.perf_counter()
+    embed_and_store()
+    embed_s = fake.seconds
+    build_s = time.perf_counter() - t0 - embed_s
+
+    rss_before = _rss_bytes()
+    t0 = time.perf_counter()
+    retriever.reload_index()
+    load_s = time.perf_counter() - t0
+    snap = retriever._ensure_loaded()
+    manifest = snap.manifest
+
+    # Queries: a handful of words sampled from random chunks
+    rng = np.random.default_rng(args.seed + 1)
+    chunks = [snap.chunks[i] for i in range(len(snap.chunks))]
+    queries = []
+    for i in rng.integers(0, len(chunks), args.queries):
+        words = chunks[i].replace(".", " ").split()
+        queries.append(" ".join(rng.choice(words, size=min(8, len(words)), replace=False)))
+
+    for q in queries[:min(20, len(queries))]:  # warm-up
+        retriever.search(q, args.k)
+
+    latencies, found = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = retriever.search(q, args.k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found.append([i for i, _ in hits])
+    rss_after = _rss_bytes()
+
+    qps = None
+    if args.threads > 1:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            list(pool.map(lambda q: retriever.search(q, args.k), queries))
+        qps = len(queries) / (time.perf_counter() - t0)
+
+    # Ground truth: exact search over full-dimension embeddings of the same chunks
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(fake.embed_array(chunks))
+    _, truth = exact.search(fake.embed_array(queries), args.k)
+    overlap = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found))
+
+    return {
+        "mode": mode,
+        "chunks": len(chunks),
+        "dim": manifest.get("dim"),
+        "quantization": manifest.get("quantization"),
+        "shards": len(snap.indexes),
+        "build_seconds": round(build_s, 3),
+        "embed_seconds": round(embed_s, 3),
+        "load_seconds": round(load_s, 4),
+        "index_bytes": manifest.get("index_bytes"),
+        "rss_delta_bytes": rss_after - rss_before,
+        "query_ms_p50": round(_percentile(latencies, 50), 3),
+        "query_ms_p95": round(_percentile(latencies, 95), 3),
+        "query_ms_p99": round(_percentile(latencies, 99), 3),
+        "qps": round(len(latencies) / (sum(latencies) / 1000), 1) if latencies else 0.0,
+        "qps_threads": round(qps, 1) if qps else None,
+        f"recall@{args.k}": round(overlap / (len(queries) * args.k), 4) if queries else 0.0,
+    }
+
+
+# ----------------- Orchestrator side -----------------
+def run_mode(mode: str, args) -> dict:
+    env = dict(os.environ)
+    env.update(BASE_ENV)
+    env.update(MODES[mode])
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory(prefix=f"bench-{mode}-") as scratch:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", mode] + _passthrough(args)
+        proc = subprocess.run(cmd, cwd=scratch, env=env, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    return {"mode": mode, "error": (proc.stderr or proc.stdout).strip()[-2000:]}
+
+
+def _passthrough(args) -> list:
+    return ["--docs", str(args.docs), "--words-per-doc", str(args.words_per_doc), "--vocab", str(args.vocab),
+            "--dim", str(args.dim), "--queries", str(args.queries), "--k", str(args.k),
+            "--threads", str(args.threads), "--seed", str(args.seed)]
+
+
+# metric -> (direction, tolerance kind); "lower" means smaller is better
+REGRESSION_CHECKS = {
+    "query_ms_p95": ("lower", "relative"),
+    "build_seconds": ("lower", "relative"),
+    "qps": ("higher", "relative"),
+    "index_bytes": ("lower", "relative"),
+}
+
+
+def compare(results: list, baseline: dict, tolerance: float, recall_drop: float, k: int) -> list:
+    """Return human-readable regressions of results against a baseline run."""
+    previous = {r["mode"]: r for r in baseline.get("results", []) if "error" not in r}
+    problems = []
+    for r in results:
+        old = previous.get(r["mode"])
+        if not old or "error" in r:
+            continue
+        for metric, (direction, _) in REGRESSION_CHECKS.items():
+            new_v, old_v = r.get(metric), old.get(metric)
+            if not new_v or not old_v:
+                continue
+            change = (new_v - old_v) / old_v
+            if (direction == "lower" and change > tolerance) or (direction == "higher" and -change > tolerance):
+                problems.append(f"{r['mode']}: {metric} {old_v} -> {new_v} ({change:+.0%})")
+        recall = f"recall@{k}"
+        if recall in r and recall in old and old[recall] - r[recall] > recall_drop:
+            problems.append(f"{r['mode']}: {recall} {old[recall]} -> {r[recall]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of: {', '.join(MODES)}")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents")
+    parser.add_argument("--words-per-doc", type=int, default=1500)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384, help="fake embedding dimension")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent query threads for qps_threads (1 = skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    parser.add_argument("--baseline", help="previous --json output; exit 1 if this run regresses")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    parser.add_argument("--recall-drop", type=float, default=0.01, help="allowed absolute recall drop vs baseline")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print("RESULT " + json.dumps(run_worker(args.worker, args)))
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+
+    results = []
+    for mode in modes:
+        print(f"⏱️  {mode} ...", flush=True)
+        results.append(run_mode(mode, args))
+
+    recall = f"recall@{args.k}"
+    print(f"\n{'mode':<12} {'chunks':>7} {'dim':>5} {'build s':>8} {'index MB':>9} {'p50 ms':>7} "
+          f"{'p95 ms':>7} {'p99 ms':>7} {'qps':>8} {recall:>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<12} ERROR: {r['error'].splitlines()[-1] if r['error'] else 'unknown'}")
+            continue
+        print(f"{r['mode']:<12} {r['chunks']:>7} {r['dim']:>5} {r['build_seconds']:>8} "
+              f"{(r['index_bytes'] or 0) / 1e6:>9.2f} {r['query_ms_p50']:>7} {r['query_ms_p95']:>7} "
+              f"{r['query_ms_p99']:>7} {r['qps']:>8} {r[recall]:>9}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "params": {k: v for k, v in vars(args).items() if k not in ("worker", "json", "baseline")},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Results written to {args.json}")
+
+    failed = any("error" in r for r in results)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance, args.recall_drop, args.k)
+        if problems:
+            print("\n❌ Regressions vs baseline:")
+            for p in problems:
+                print(f"   - {p}")
+            failed = True
+        else:
+            print("\n✅ No regressions vs baseline")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
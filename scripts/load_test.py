@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for /ask (backend/main.py) and the ServiceNow JSON-RPC
+/mcp handler (mcp_server_oauth.py), with no real Azure traffic.
+
+A local stub stands in for Azure OpenAI chat completions and embeddings,
+injecting configurable latency and errors. The target server runs as a real
+uvicorn subprocess pointed at the stub, and an open-loop generator drives it
+at a fixed request rate. The report covers throughput, latency percentiles
+and errors, plus the target's event-loop lag. That lag is the latency of a
+trivial endpoint probed alongside the load: a blocking call on the server's
+event loop shows up there directly.
+
+    python scripts/load_test.py --target ask --rps 20 --duration 30
+    python scripts/load_test.py --target mcp --tool search_chunks --rps 50 --json mcp.json
+
+The target uses the vector store in data/ (it must exist; its dimension must
+match --embed-dim, 1536 for ada-002).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MCP_DIR = os.path.join(REPO_ROOT, "mcp-new-main", "mcp-new-main")
+
+QUESTIONS = [
+    "What is the Model Context Protocol?",
+    "How does the IT helpdesk agent escalate tickets?",
+    "Which Azure AI Foundry services are used?",
+    "Summarize the Python toolkit design.",
+    "How is the knowledge management agent deployed?",
+]
+
+TOOL_FAILURE_PREFIXES = ("Error", "Vector store not found", "Document agent not available")
+
+
+# ----------------- Azure OpenAI stub -----------------
+def build_stub(args) -> Starlette:
+    """Minimal Azure OpenAI look-alike with injected latency and failures."""
+
+    async def _delay(mean_ms: float) -> Optional[JSONResponse]:
+        await asyncio.sleep(max(0.0, random.gauss(mean_ms, mean_ms * args.jitter)) / 1000)
+        if random.random() < args.error_rate:
+            return JSONResponse({"error": {"code": "429", "message": "Rate limit (injected)"}}, status_code=429)
+        return None
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        failure = await _delay(args.embed_latency_ms)
+        if failure:
+            return failure
+        data = []
+        for i, text in enumerate(inputs):
+            vec = np.random.default_rng(zlib.crc32(str(text).encode("utf-8"))).standard_normal(args.embed_dim)
+            vec = (vec / np.linalg.norm(vec)).astype("<f4")
+            emb = base64.b64encode(vec.tobytes()).decode() if body.get("encoding_format") == "base64" else vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        tokens = sum(len(str(t).split()) for t in inputs)
+        return JSONResponse({"object": "list", "data": data, "model": "stub-embedding",
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    async def chat(request: Request):
+        await request.json()
+        failure = await _delay(args.chat_latency_ms)
+        if failure:
+            return failure
+        return JSONResponse({
+            "id": "chatcmpl-" + secrets.token_hex(6), "object": "chat.completion", "created": int(time.time()),
+            "model": "stub-chat",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "Stub answer based on the provided context."}}],
+            "usage": {"prompt_tokens": 500, "completion_tokens": 20, "total_tokens": 520},
+        })
+
+    return Starlette(routes=[
+        Route("/openai/deployments/{deployment}/embeddings", embeddings, methods=["POST"]),
+        Route("/openai/deployments/{deployment}/chat/completions", chat, methods=["POST"]),
+    ])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args) -> str:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(build_stub(args), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+# ----------------- Target server -----------------
+def start_target(args, stub_url: str):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": stub_url,
+        "AZURE_OPENAI_API_KEY": "stub-key",
+        "AZURE_OPENAI_DEPLOYMENT": "stub-chat",
+        "AZURE_OPENAI_EMBEDDING_MODEL": "stub-embedding",
+        "EMBEDDING_PROVIDER": "azure",
+        "OAUTH_CLIENT_ID": "load-test-client",
+        "OAUTH_CLIENT_SECRET": "load-test-secret",
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    if args.target == "ask":
+        app, extra = "backend.main:app", []
+    else:
+        app, extra = "mcp_server_oauth:app", ["--app-dir", MCP_DIR]
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning"] + extra
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Target did not come up at {url}")
+
+
+async def oauth_token(client: httpx.AsyncClient, base: str) -> str:
+    """Run the authorization-code flow against mcp_server_oauth.py."""
+    redirect = "http://localhost/callback"
+    resp = await client.get(f"{base}/oauth/authorize", params={
+        "client_id": "load-test-client", "redirect_uri": redirect, "response_type": "code"})
+    code = parse_qs(urlparse(resp.headers["location"]).query)["code"][0]
+    resp = await client.post(f"{base}/oauth/token", data={
+        "grant_type": "authorization_code", "code": code, "redirect_uri": redirect,
+        "client_id": "load-test-client", "client_secret": "load-test-secret"})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+# ----------------- Load generation -----------------
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors: dict = {}
+        self.dropped = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def one_request(client: httpx.AsyncClient, args, base: str, headers: dict, i: int, rec: Recorder) -> None:
+    question = QUESTIONS[i % len(QUESTIONS)]
+    if args.target == "ask":
+        url, body = f"{base}/ask", {"question": question}
+    else:
+        arguments = {"question": question} if args.tool == "ask_document" else {"query": question}
+        url, body = f"{base}/mcp", {"jsonrpc": "2.0", "id": i, "method": "tools/call",
+                                    "params": {"name": args.tool, "arguments": arguments}}
+    t0 = time.perf_counter()
+    try:
+        resp = await client.post(url, json=body, headers=headers)
+    except httpx.TimeoutException:
+        rec.error("timeout")
+        return
+    except httpx.TransportError as e:
+        rec.error(type(e).__name__)
+        return
+    elapsed = (time.perf_counter() - t0) * 1000
+    if resp.status_code != 200:
+        rec.error(f"http_{resp.status_code}")
+        return
+    if args.target == "mcp":
+        payload = resp.json()
+        if "error" in payload:
+            rec.error(f"jsonrpc_{payload['error'].get('code')}")
+            return
+        result = payload.get("result", {})
+        text = (result.get("content") or [{}])[0].get("text", "")
+        # Tools report failures as text as well as via isError
+        if result.get("isError") or text.startswith(TOOL_FAILURE_PREFIXES):
+            rec.error("tool_error")
+            return
+    rec.latencies.append(elapsed)
+
+
+async def probe_lag(client: httpx.AsyncClient, url: str, headers: dict, stop: asyncio.Event, out: List[float]) -> None:
+    """Latency of a trivial endpoint while under load = target event-loop lag."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            await client.get(url, headers=headers)
+            out.append((time.perf_counter() - t0) * 1000)
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def local_lag(stop: asyncio.Event, out: List[float]) -> None:
+    """Generator's own loop lag; if high, the generator itself is the bottleneck."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.05)
+        out.append((time.perf_counter() - t0 - 0.05) * 1000)
+
+
+async def drive(args, base: str) -> dict:
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits, follow_redirects=False) as client, \
+            httpx.AsyncClient(timeout=args.timeout) as probe_client:
+        probe_path = "/health" if args.target == "ask" else "/.well-known/oauth-authorization-server"
+        await wait_ready(probe_client, base + probe_path)
+        headers = {}
+        if args.target == "mcp":
+            headers["Authorization"] = f"Bearer {await oauth_token(probe_client, base)}"
+
+        rec = Recorder()
+        target_lag: List[float] = []
+        gen_lag: List[float] = []
+        stop = asyncio.Event()
+        monitors = [asyncio.create_task(probe_lag(probe_client, base + probe_path, {}, stop, target_lag)),
+                    asyncio.create_task(local_lag(stop, gen_lag))]
+
+        inflight = set()
+        total = int(args.rps * args.duration)
+        started = time.perf_counter()
+        for i in range(total):
+            # Open loop: send on schedule regardless of how fast responses come back
+            delay = started + i / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(inflight) >= args.max_inflight:
+                rec.dropped += 1
+                continue
+            task = asyncio.create_task(one_request(client, args, base, headers, i, rec))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        if inflight:
+            await asyncio.wait(inflight)
+        wall = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*monitors)
+
+    def pct(values, p):
+        return round(float(np.percentile(values, p)), 1) if values else None
+
+    return {
+        "target": args.target,
+        "tool": args.tool if args.target == "mcp" else None,
+        "target_rps": args.rps,
+        "duration_seconds": round(wall, 1),
+        "sent": total - rec.dropped,
+        "ok": len(rec.latencies),
+        "errors": rec.errors,
+        "dropped_client_side": rec.dropped,
+        "throughput_rps": round(len(rec.latencies) / wall, 2),
+        "latency_ms": {"p50": pct(rec.latencies, 50), "p95": pct(rec.latencies, 95),
+                       "p99": pct(rec.latencies, 99), "max": round(max(rec.latencies), 1) if rec.latencies else None},
+        "target_loop_lag_ms": {"p50": pct(target_lag, 50), "p99": pct(target_lag, 99),
+                               "max": round(max(target_lag), 1) if target_lag else None},
+        "generator_loop_lag_ms": {"p99": pct(gen_lag, 99)},
+        "stub": {"embed_latency_ms": args.embed_latency_ms, "chat_latency_ms": args.chat_latency_ms,
+                 "error_rate": args.error_rate},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["ask", "mcp"], default="ask")
+    parser.add_argument("--tool", default="ask_document", help="MCP tool for --target mcp (ask_document, search_chunks)")
+    parser.add_argument("--rps", type=float, default=10.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--max-inflight", type=int, default=256, help="client-side concurrency cap")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the target")
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=1200.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="stub latency stddev as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls answered with 429")
+    parser.add_argument("--embed-dim", type=int, default=1536)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    stub_url = start_stub(args)
+    proc, base = start_target(args, stub_url)
+    try:
+        report = asyncio.run(drive(args, base))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    lat, lag = report["latency_ms"], report["target_loop_lag_ms"]
+    print(f"\n🎯 {report['target']}{' / ' + report['tool'] if report['tool'] else ''} "
+          f"@ {args.rps} rps for {report['duration_seconds']}s")
+    print(f"   ok={report['ok']} sent={report['sent']} dropped={report['dropped_client_side']} "
+          f"errors={report['errors'] or 0}")
+    print(f"   throughput={report['throughput_rps']} rps")
+    print(f"   latency ms: p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    print(f"   target event-loop lag ms: p50={lag['p50']} p99={lag['p99']} max={lag['max']}")
+    print(f"   generator loop lag p99={report['generator_loop_lag_ms']['p99']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
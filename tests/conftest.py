@@ -0,0 +1,45 @@
+"""
+Test setup: python -m pytest -q (from the repository root).
+
+backend.config reads the environment and creates data/ relative to the
+working directory when it is first imported, so the suite pins the settings
+it depends on and moves into a scratch directory before any test module
+imports the backend. Nothing under the repository's data/ is touched.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "mcp-new-main", "mcp-new-main"))  # token_store
+
+os.environ.update({
+    "EMBEDDING_PROVIDER": "sentence-transformers",
+    "CHUNKING": "structured",
+    "CHUNK_TOKENIZER": "",  # sizes in characters: no tiktoken download
+    "CHUNK_SIZE": "200",
+    "CHUNK_OVERLAP": "20",
+    "DEDUP": "near",
+    "INDEX_QUANTIZATION": "flat",
+    "INDEX_DIM_REDUCTION": "none",
+    "INDEX_SHARDS": "1",
+    "INDEX_MMAP": "false",
+    "INDEX_REFRESH_SECONDS": "0",
+    "QUERY_BATCH_MAX": "1",
+    "OTEL_TRACES_EXPORTER": "none",
+})
+
+_scratch = tempfile.mkdtemp(prefix="rag-tests-")
+_cwd = os.getcwd()
+
+
+def pytest_sessionstart(session):
+    # After the command line is resolved, before test modules are imported
+    os.chdir(_scratch)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(_cwd)
+    shutil.rmtree(_scratch, ignore_errors=True)
@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+from backend.admission import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, AdmissionRejected, Scheduler, current_context,
+    remaining_time, request_context, shared_context
+)
+
+
+def _hold(scheduler, release, holding):
+    """Occupy one slot until `release` is set."""
+    def run():
+        with scheduler.slot():
+            holding.set()
+            release.wait(5)
+    t = threading.Thread(target=run)
+    t.start()
+    assert holding.wait(5)
+    return t
+
+
+def _queue(scheduler, order, name, priority, errors):
+    def run():
+        try:
+            with request_context(priority=priority), scheduler.slot():
+                order.append(name)
+        except AdmissionRejected as e:
+            errors[name] = e
+    t = threading.Thread(target=run)
+    t.start()
+    return t
+
+
+def _wait_queued(scheduler, n):
+    deadline = time.monotonic() + 5
+    while scheduler.snapshot()["queued"] < n and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert scheduler.snapshot()["queued"] == n
+
+
+def test_admits_up_to_max_concurrent_without_queueing():
+    scheduler = Scheduler("test", max_concurrent=2, max_queue=4)
+    with scheduler.slot(), scheduler.slot():
+        assert scheduler.snapshot()["active"] == 2
+    assert scheduler.snapshot()["active"] == 0
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    scheduler = Scheduler("test", max_concurrent=1, max_queue=8)
+    release, holding, order, errors = threading.Event(), threading.Event(), [], {}
+    holder = _hold(scheduler, release, holding)
+    threads = []
+    for name, priority in [("background", PRIORITY_BACKGROUND), ("normal-1", PRIORITY_NORMAL),
+                           ("interactive", PRIORITY_INTERACTIVE), ("normal-2", PRIORITY_NORMAL)]:
+        threads.append(_queue(scheduler, order, name, priority, errors))
+        _wait_queued(scheduler, len(threads))
+    release.set()
+    for t in [holder] + threads:
+        t.join(5)
+    assert not errors
+    assert order == ["interactive", "normal-1", "normal-2", "background"]
+
+
+def test_full_queue_sheds_the_least_urgent_waiter():
+    scheduler = Scheduler("test", max_concurrent=1, max_queue=1)
+    release, holding, order, errors = threading.Event(), threading.Event(), [], {}
+    holder = _hold(scheduler, release, holding)
+    background = _queue(scheduler, order, "background", PRIORITY_BACKGROUND, errors)
+    _wait_queued(scheduler, 1)
+    interactive = _queue(scheduler, order, "interactive", PRIORITY_INTERACTIVE, errors)
+    background.join(5)
+    assert "shed" in str(errors["background"])
+    release.set()
+    for t in (holder, interactive):
+        t.join(5)
+    assert order == ["interactive"]
+
+
+def test_full_queue_rejects_a_caller_that_is_not_more_urgent():
+    scheduler = Scheduler("test", max_concurrent=1, max_queue=1)
+    release, holding, order, errors = threading.Event(), threading.Event(), [], {}
+    holder = _hold(scheduler, release, holding)
+    first = _queue(scheduler, order, "first", PRIORITY_NORMAL, errors)
+    _wait_queued(scheduler, 1)
+    with pytest.raises(AdmissionRejected, match="too many queued"):
+        with scheduler.slot():
+            pass
+    release.set()
+    for t in (holder, first):
+        t.join(5)
+    assert order == ["first"]
+
+
+def test_rejects_early_when_the_deadline_cannot_be_met():
+    scheduler = Scheduler("test", max_concurrent=1, max_queue=4)
+    with scheduler.slot():
+        time.sleep(0.05)  # typical call now ~50 ms
+    release, holding = threading.Event(), threading.Event()
+    holder = _hold(scheduler, release, holding)
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected, match="deadline") as info:
+        with request_context(timeout=0.01), scheduler.slot():
+            pass
+    assert time.monotonic() - started < 0.05  # rejected without queueing
+    assert info.value.retry_after >= 0.5
+    release.set()
+    holder.join(5)
+
+
+def test_queued_caller_gives_up_at_its_deadline():
+    scheduler = Scheduler("test", max_concurrent=1, max_queue=4)
+    release, holding = threading.Event(), threading.Event()
+    holder = _hold(scheduler, release, holding)
+    with pytest.raises(AdmissionRejected, match="expired while queued"):
+        with request_context(timeout=0.05), scheduler.slot():
+            pass
+    assert scheduler.snapshot()["queued"] == 0
+    release.set()
+    holder.join(5)
+
+
+def test_nested_request_context_only_tightens():
+    with request_context(timeout=1.0):
+        with request_context(timeout=10.0):
+            assert remaining_time() <= 1.0
+        with request_context(timeout=0.1):
+            assert remaining_time() <= 0.1
+    assert remaining_time() is None
+
+
+def test_shared_context_takes_loosest_deadline_and_most_urgent_priority():
+    now = time.monotonic()
+    with shared_context([(now + 1, PRIORITY_BACKGROUND), (now + 5, PRIORITY_NORMAL),
+                         (now + 2, PRIORITY_INTERACTIVE)]):
+        assert current_context() == (now + 5, PRIORITY_INTERACTIVE)
+    with request_context(timeout=1.0), shared_context([(now + 1, PRIORITY_NORMAL), (None, PRIORITY_NORMAL)]):
+        assert remaining_time() is None  # one member has no deadline
+    assert current_context() == (None, PRIORITY_NORMAL)
+
+
+def test_query_batch_is_admitted_under_its_members_merged_context(monkeypatch):
+    from backend import retriever
+
+    seen = []
+
+    class Stop(Exception):
+        pass
+
+    class Client:
+        def embed_array(self, texts):
+            seen.append(current_context())
+            raise Stop()
+
+    monkeypatch.setattr(retriever, "_embedding_client_once", lambda: Client())
+    now = time.monotonic()
+    with pytest.raises(Stop):
+        retriever._search_batch([(None, "a", 1, (now + 1, PRIORITY_BACKGROUND)),
+                                 (None, "b", 1, (now + 3, PRIORITY_INTERACTIVE))])
+    assert seen == [(now + 3, PRIORITY_INTERACTIVE)]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from backend.batcher import MicroBatcher
+
+
+class Boom(Exception):
+    pass
+
+
+def _submit_all(batcher, items):
+    """Submit every item from its own thread at once; {item: result or exception}."""
+    out = {}
+    barrier = threading.Barrier(len(items))
+
+    def call(item):
+        barrier.wait()
+        try:
+            out[item] = batcher.submit(item)
+        except Exception as e:
+            out[item] = e
+
+    threads = [threading.Thread(target=call, args=(item,)) for item in items]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return out
+
+
+def _slow_square(batches):
+    def process(items):
+        batches.append(list(items))
+        time.sleep(0.02)  # keep the leader busy so the others form a batch
+        return [i * i for i in items]
+    return process
+
+
+def test_each_caller_gets_its_own_result():
+    batches = []
+    batcher = MicroBatcher(_slow_square(batches), max_batch=32, max_wait=0.05)
+    out = _submit_all(batcher, list(range(10)))
+    assert out == {i: i * i for i in range(10)}
+    assert sum(len(b) for b in batches) == 10
+    assert len(batches) < 10  # concurrent submissions were batched
+
+
+def test_batches_respect_max_batch():
+    batches = []
+    batcher = MicroBatcher(_slow_square(batches), max_batch=3, max_wait=0.05)
+    out = _submit_all(batcher, list(range(10)))
+    assert out == {i: i * i for i in range(10)}
+    assert max(len(b) for b in batches) <= 3
+
+
+def test_exception_reaches_every_item_of_the_batch():
+    def process(items):
+        time.sleep(0.02)
+        raise Boom("provider down")
+
+    out = _submit_all(MicroBatcher(process, max_batch=32, max_wait=0.05), list(range(6)))
+    assert all(isinstance(v, Boom) for v in out.values())
+
+
+def test_lone_caller_does_not_wait():
+    sizes = []
+    batcher = MicroBatcher(lambda items: items, max_batch=32, max_wait=5.0, on_batch=sizes.append)
+    started = time.perf_counter()
+    assert batcher.submit("q") == "q"
+    assert time.perf_counter() - started < 1.0
+    assert sizes == [1]
+
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: [], max_batch=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit("q")
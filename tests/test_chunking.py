@@ -0,0 +1,125 @@
+import sys
+import types
+
+from backend import chunking
+from backend.chunking import chunk_elements, text_elements
+
+
+def _split_words(text, max_size):
+    """Deterministic splitter for oversized elements: greedy word packing."""
+    pieces, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > max_size:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    return pieces + [current] if current else pieces
+
+
+def _chunks(elements, max_size=100):
+    return chunk_elements(elements, max_size=max_size, split_text=_split_words, length=len)
+
+
+def test_headings_start_chunks_and_prefix_them():
+    chunks = _chunks([
+        {"type": "Title", "text": "Setup", "depth": 0, "page": 1},
+        {"type": "NarrativeText", "text": "a" * 60, "page": 1},
+        {"type": "Title", "text": "Installation", "depth": 1, "page": 2},
+        {"type": "NarrativeText", "text": "b" * 60, "page": 2},
+        {"type": "Title", "text": "Usage", "depth": 0, "page": 3},
+        {"type": "NarrativeText", "text": "c" * 60, "page": 3},
+    ])
+    assert chunks == [
+        "Setup (p. 1)\n" + "a" * 60,
+        "Setup > Installation (p. 2)\n" + "b" * 60,
+        "Usage (p. 3)\n" + "c" * 60,
+    ]
+
+
+def test_small_sections_are_merged_with_their_heading_inline():
+    chunks = _chunks([
+        {"type": "Title", "text": "Intro", "depth": 0},
+        {"type": "NarrativeText", "text": "short"},
+        {"type": "Title", "text": "Next", "depth": 0},
+        {"type": "NarrativeText", "text": "also short"},
+    ])
+    assert chunks == ["Intro\nshort\nNext\nalso short"]
+
+
+def test_elements_are_packed_up_to_max_size():
+    chunks = _chunks([{"type": "NarrativeText", "text": f"{i} " + "x" * 40} for i in range(6)])
+    assert len(chunks) == 3
+    assert all(len(c) <= 100 for c in chunks)
+    assert "".join(chunks).count("x" * 40) == 6
+
+
+def test_heading_prefix_counts_towards_max_size():
+    elements = [{"type": "Title", "text": "Chapter", "depth": 0, "page": 1}]
+    elements += [{"type": "Title", "text": "A rather long section heading", "depth": 1, "page": 1}]
+    elements += [{"type": "NarrativeText", "text": f"{i} " + "x" * 40, "page": 1 + i // 3} for i in range(9)]
+    elements += [{"type": "NarrativeText", "text": " ".join(["word"] * 60), "page": 5}]
+    chunks = _chunks(elements)
+    assert all(c.startswith("Chapter > A rather long section heading (p. ") for c in chunks)
+    assert all(len(c) <= 100 for c in chunks)
+    assert "".join(chunks).count("x" * 40) == 9
+    assert "".join(chunks).count("word") == 60
+
+    big = chunk_elements([{"type": "Title", "text": "Heading", "depth": 0},
+                          {"type": "NarrativeText", "text": "word " * 100}], max_size=50, length=len)
+    assert len(big) > 1 and all(len(c) <= 50 for c in big)
+
+
+def test_tables_are_not_split_unless_oversized():
+    table = {"type": "Table", "text": "t" * 80}
+    chunks = _chunks([{"type": "NarrativeText", "text": "n" * 40}, table])
+    assert chunks == ["n" * 40, "t" * 80]
+
+    big = _chunks([{"type": "Table", "text": " ".join(["cell"] * 60)}])
+    assert len(big) > 1 and all(len(c) <= 100 for c in big)
+
+
+def test_layout_noise_and_empty_elements_are_skipped():
+    chunks = _chunks([
+        {"type": "Header", "text": "Doc", "depth": 0},
+        {"type": "PageNumber", "text": "7"},
+        {"type": "Footer", "text": "Confidential"},
+        {"type": "NarrativeText", "text": "   "},
+        {"type": "NarrativeText", "text": "body"},
+    ])
+    assert chunks == ["Doc\nbody"]
+
+
+def test_page_ranges_in_prefix():
+    chunks = _chunks([
+        {"type": "Title", "text": "Report", "depth": 0, "page": 3},
+        {"type": "NarrativeText", "text": "p" * 30, "page": 3},
+        {"type": "NarrativeText", "text": "q" * 30, "page": 4},
+    ])
+    assert chunks == ["Report (p. 3-4)\n" + "p" * 30 + "\n" + "q" * 30]
+
+
+def test_text_elements_markdown_titles():
+    assert text_elements("# Title\nFirst paragraph\n\n## Sub\n\nSecond") == [
+        {"type": "Title", "text": "Title", "depth": 0},
+        {"type": "NarrativeText", "text": "First paragraph"},
+        {"type": "Title", "text": "Sub", "depth": 1},
+        {"type": "NarrativeText", "text": "Second"},
+    ]
+
+
+def test_default_splitter_handles_oversized_text():
+    chunks = chunk_elements([{"type": "NarrativeText", "text": "word " * 100}], max_size=50, length=len)
+    assert len(chunks) > 1 and all(len(c) <= 50 for c in chunks)
+
+
+def test_unloadable_tokenizer_falls_back_to_estimates(monkeypatch):
+    def get_encoding(name):
+        raise ConnectionError("offline")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+    monkeypatch.setattr(chunking, "CHUNK_TOKENIZER", "cl100k_base")
+    monkeypatch.setattr(chunking, "_encoding", None)
+    assert chunking.length_function()("x" * 40) == 10
+    assert chunking.count_tokens(["x" * 8, ""]) == [2, 0]
+    assert chunking._encoding is False  # not retried on every call
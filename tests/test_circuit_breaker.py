@@ -0,0 +1,115 @@
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from backend import circuit_breaker
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from backend.embedding_utils import EmbeddingClient, is_transient
+
+_REQUEST = httpx.Request("POST", "https://example.invalid/embeddings")
+
+
+def _status_error(code: int) -> openai.APIStatusError:
+    return openai.APIStatusError("error", response=httpx.Response(code, request=_REQUEST), body=None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure(RuntimeError("boom"))
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure(RuntimeError("boom"))
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()["last_error"] == "boom"
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_one_probe(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # the probe is still in flight
+
+
+def test_probe_success_closes_and_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.snapshot()["retry_in_seconds"] == 10
+
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_release_frees_the_probe_without_a_verdict(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("error, transient", [
+    (openai.APITimeoutError(request=_REQUEST), True),
+    (openai.APIConnectionError(request=_REQUEST), True),
+    (_status_error(429), True),
+    (_status_error(503), True),
+    (_status_error(400), False),
+    (_status_error(401), False),
+    (_status_error(404), False),
+    (ValueError("bad input"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) is transient
+
+
+def _failing_client(monkeypatch, error):
+    circuit_breaker._breakers.clear()
+    client = EmbeddingClient()
+    client.provider = "openai"
+
+    def call_provider(name, texts):
+        if name == "openai":
+            raise error
+        return np.ones((len(texts), 4), dtype="float32")
+
+    monkeypatch.setattr(client, "_call_provider", call_provider)
+    return client
+
+
+def test_client_errors_do_not_count_against_the_provider(monkeypatch):
+    client = _failing_client(monkeypatch, _status_error(400))
+    with pytest.raises(openai.APIStatusError):
+        client.embed_array(["text"])
+    assert circuit_breaker.get_breaker("embedding:openai").snapshot()["consecutive_failures"] == 0
+
+
+def test_transient_errors_count_against_the_provider(monkeypatch):
+    client = _failing_client(monkeypatch, _status_error(503))
+    with pytest.raises(openai.APIStatusError):
+        client.embed_array(["text"])
+    assert circuit_breaker.get_breaker("embedding:openai").snapshot()["consecutive_failures"] == 1
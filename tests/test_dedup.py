@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from backend.dedup import dedup_chunks
+
+_rng = random.Random(7)
+_VOCAB = [f"word{i}" for i in range(500)]
+
+
+def _paragraph(n=80):
+    return " ".join(_rng.choice(_VOCAB) for _ in range(n))
+
+
+def test_none_keeps_everything():
+    kept, duplicate_of, counts = dedup_chunks(["a", "a"], mode="none")
+    assert kept == [0, 1] and duplicate_of == {} and counts == {"exact": 0, "near": 0}
+
+
+def test_exact_ignores_case_and_whitespace():
+    chunks = ["Hello   World", "hello world", "\nHELLO world ", "something else"]
+    kept, duplicate_of, counts = dedup_chunks(chunks, mode="exact")
+    assert kept == [0, 3]
+    assert duplicate_of == {1: 0, 2: 0}
+    assert counts == {"exact": 2, "near": 0}
+
+
+def test_exact_mode_keeps_near_duplicates():
+    text = _paragraph()
+    kept, _, _ = dedup_chunks([text, text + " extra"], mode="exact")
+    assert kept == [0, 1]
+
+
+def test_near_duplicates_map_to_the_first_occurrence():
+    base, other = _paragraph(), _paragraph()
+    words = base.split()
+    edited = " ".join(words[:-1] + ["changed"])  # one word of 80 differs
+    chunks = [base, other, edited, base.upper()]
+    kept, duplicate_of, counts = dedup_chunks(chunks, mode="near", threshold=0.85)
+    assert kept == [0, 1]
+    assert duplicate_of == {2: 0, 3: 0}
+    assert counts == {"exact": 1, "near": 1}
+
+
+def test_exact_copy_of_a_near_duplicate_points_to_the_kept_chunk():
+    base = _paragraph()
+    edited = " ".join(base.split()[:-1] + ["changed"])
+    kept, duplicate_of, _ = dedup_chunks([base, edited, edited], mode="near", threshold=0.85)
+    assert kept == [0]
+    assert duplicate_of == {1: 0, 2: 0}
+
+
+def test_dissimilar_chunks_are_kept():
+    chunks = [_paragraph() for _ in range(50)]
+    kept, duplicate_of, _ = dedup_chunks(chunks, mode="near", threshold=0.85)
+    assert kept == list(range(50)) and duplicate_of == {}
+
+
+def test_short_chunks_are_only_deduplicated_exactly():
+    kept, duplicate_of, _ = dedup_chunks(["one two", "one two three", "One  two"], mode="near")
+    assert kept == [0, 1] and duplicate_of == {2: 0}
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        dedup_chunks(["a"], mode="fuzzy")
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from backend import documents
+from backend.config import PROCESSED_DIR
+
+TEXT = "Überblick: naïve café — 東京の天気 😀 résumé\n" * 40
+
+
+@pytest.fixture
+def doc():
+    path = os.path.join(PROCESSED_DIR, "Multibyte Notes.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(TEXT)
+    yield documents.find_document("multibyte notes")
+    os.remove(path)
+
+
+def _read_all(doc, page_bytes):
+    pages, offset = [], 0
+    while offset < doc.size:
+        page = documents.read_range(doc, offset, page_bytes)
+        assert page.end > offset  # always makes progress
+        pages.append(page)
+        offset = page.end
+    return pages
+
+
+@pytest.mark.parametrize("page_bytes", [1, 2, 3, 5, 7, 64, 1000])
+def test_pages_concatenate_to_the_document(doc, page_bytes):
+    pages = _read_all(doc, page_bytes)
+    assert "".join(p.text for p in pages) == TEXT
+    assert "�" not in "".join(p.text for p in pages)
+    assert all(p.size == doc.size for p in pages)
+
+
+def test_offset_inside_a_character_starts_at_the_next_one(doc):
+    offset = TEXT.encode("utf-8").index("東".encode("utf-8")) + 1
+    page = documents.read_range(doc, offset, 6)
+    assert page.text == "京の"
+    assert page.start == offset + 2
+
+
+def test_range_past_the_end_is_empty(doc):
+    page = documents.read_range(doc, doc.size + 100, 10)
+    assert page.text == "" and page.start == page.end == doc.size
+
+
+def test_find_document_is_case_and_extension_insensitive(doc):
+    assert doc.name == "Multibyte Notes.txt"
+    assert documents.find_document("MULTIBYTE NOTES.TXT") == doc
+    assert documents.find_document("missing") is None
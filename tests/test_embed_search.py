@@ -0,0 +1,154 @@
+"""
+End to end: processed text -> embed_and_store() -> a published snapshot ->
+retriever search, with the provider call replaced by deterministic
+bag-of-words embeddings (no network, no model download).
+"""
+import os
+import zlib
+
+import numpy as np
+import pytest
+
+from backend import embed, embedding_utils, retriever
+from backend.config import PROCESSED_DIR
+from backend.embed import embed_and_store
+from backend.index_store import current_version, read_manifest
+
+DIM = 64
+
+DOCS = {
+    "solar.txt": "# Solar panels\n\nSolar panels convert sunlight into electricity using photovoltaic cells "
+                 "mounted on the roof.\n\n# Maintenance\n\nClean the panels twice a year and inspect the inverter.",
+    "garden.txt": "# Garden\n\nTomatoes need full sun, regular watering and a stake to climb as they grow tall.",
+    "copy.txt": "# Garden\n\nTomatoes need full sun, regular watering and a stake to climb as they grow tall.",
+}
+
+
+def _bag_of_words(texts):
+    out = np.zeros((len(texts), DIM), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in text.casefold().replace(".", " ").replace(",", " ").split():
+            out[i] += np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(DIM)
+    return out
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The real EmbeddingClient on EMBEDDING_PROVIDER=auto, with OpenAI "configured" and faked."""
+    client = embedding_utils.EmbeddingClient()
+    client.provider = "auto"
+    client.embedded = []
+
+    def call_provider(name, texts):
+        if name != "openai":
+            return None
+        client.embedded.extend(texts)
+        return _bag_of_words(texts)
+
+    monkeypatch.setattr(client, "_call_provider", call_provider)
+    monkeypatch.setattr(embedding_utils, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embedding_utils, "AZURE_OPENAI_API_KEY", None)
+    monkeypatch.setattr(embedding_utils, "_embedding_client", client)
+    return client
+
+
+@pytest.fixture
+def corpus():
+    paths = []
+    for name, text in DOCS.items():
+        path = os.path.join(PROCESSED_DIR, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    yield
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _build(reuse=True):
+    version = embed_and_store(reuse=reuse)
+    retriever.reload_index()
+    return version
+
+
+def test_build_and_search(client, corpus):
+    version = _build()
+    assert retriever.current_index_version() == version
+    manifest = read_manifest(version)
+    assert manifest["embedding_model"] == "openai:" + embedding_utils.EMBEDDING_MODEL_NAME
+    assert manifest["dedup"]["exact"] == 1  # copy.txt repeats garden.txt
+
+    hits = retriever.retrieve_chunks("how do photovoltaic solar panels make electricity", k=2)
+    text, score, docs = hits[0]
+    assert "photovoltaic" in text and docs == ["solar.txt"]
+    assert score >= hits[1][1]
+
+    text, _, docs = retriever.retrieve_chunks("watering tomatoes", k=1)[0]
+    assert "Tomatoes" in text
+    assert sorted(docs) == ["copy.txt", "garden.txt"]  # the skipped duplicate is still attributed
+
+    context = retriever.retrieve_relevant_chunks("inverter maintenance", k=1)
+    assert "inverter" in context
+
+
+def test_rebuild_reuses_vectors_of_unchanged_chunks(client, corpus):
+    _build(reuse=False)
+    first = len(client.embedded)
+    assert first > 0
+
+    client.embedded.clear()
+    _build()
+    assert client.embedded == []  # nothing changed: every vector reused, even on "auto"
+
+    with open(os.path.join(PROCESSED_DIR, "garden.txt"), "a", encoding="utf-8") as f:
+        f.write("\n\n# Pests\n\nAphids can be washed off the leaves with a strong jet of water.")
+    os.remove(os.path.join(PROCESSED_DIR, "copy.txt"))
+    client.embedded.clear()
+    version = _build()
+    assert client.embedded and all("Aphids" in t or "Tomatoes" in t for t in client.embedded)
+    assert len(client.embedded) < first
+    assert read_manifest(version)["embedding_model"] == "openai:" + embedding_utils.EMBEDDING_MODEL_NAME
+    assert "Aphids" in retriever.retrieve_chunks("aphids on leaves", k=1)[0][0]
+
+
+def test_fallback_provider_is_not_mixed_with_reused_vectors(client, corpus, monkeypatch):
+    _build()
+    with open(os.path.join(PROCESSED_DIR, "solar.txt"), "a", encoding="utf-8") as f:
+        f.write("\n\n# Warranty\n\nMost panels carry a twenty five year performance warranty.")
+
+    def local_only(name, texts):  # OpenAI is down; the local model answers instead
+        if name != "sentence-transformers":
+            return None
+        client.embedded.extend(texts)
+        return _bag_of_words(texts)
+
+    monkeypatch.setattr(client, "_call_provider", local_only)
+    client.embedded.clear()
+    version = _build()
+    assert read_manifest(version)["embedding_model"] == "sentence-transformers:" + \
+        embedding_utils.SENTENCE_TRANSFORMER_MODEL
+    # The new chunk came back from the fallback, so every chunk was embedded again with it
+    assert len(client.embedded) == 1 + read_manifest(version)["num_chunks"]
+
+
+def test_flapping_provider_aborts_the_build(client, corpus, monkeypatch):
+    _build()
+    live = current_version()
+    batches = []
+
+    def flapping(name, texts):  # OpenAI answers every other batch, the local model the rest
+        if name == "openai":
+            batches.append(texts)
+            return _bag_of_words(texts) if len(batches) % 2 else None
+        return _bag_of_words(texts) if name == "sentence-transformers" else None
+
+    monkeypatch.setattr(client, "_call_provider", flapping)
+    monkeypatch.setattr(embed, "EMBEDDING_BATCH_SIZE", 1)
+    with pytest.raises(RuntimeError, match="keeps changing"):
+        embed_and_store(reuse=False)
+    assert current_version() == live  # nothing half-mixed was published
+
+
+def test_empty_input_embeds_to_an_empty_matrix():
+    assert embedding_utils.EmbeddingClient().embed_array([]).shape == (0, 0)
@@ -0,0 +1,57 @@
+import os
+import pickle
+
+import faiss
+import numpy as np
+import pytest
+
+from backend import index_store
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_store, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(index_store, "VERSIONS_DIR", str(tmp_path / "versions"))
+    monkeypatch.setattr(index_store, "CURRENT_POINTER", str(tmp_path / "CURRENT"))
+    monkeypatch.setattr(index_store, "_stats_cache", (None, {}))
+    return tmp_path
+
+
+def test_legacy_store_stats_come_from_its_files(store_dir):
+    # Layout written before versioning: index and chunks directly in the store, no manifest
+    index = faiss.IndexFlatIP(16)
+    index.add(np.random.default_rng(0).standard_normal((5, 16)).astype("float32"))
+    faiss.write_index(index, str(store_dir / index_store.INDEX_FILE))
+    with open(store_dir / index_store.CHUNKS_FILE, "wb") as f:
+        pickle.dump([f"chunk {i}" for i in range(5)], f)
+
+    stats = index_store.vector_store_stats()
+    assert stats["version"] == index_store.LEGACY_VERSION
+    assert stats["num_chunks"] == 5
+    assert stats["dim"] == 16
+    assert stats["index_type"] == "IndexFlatIP"
+    assert stats["shard_sizes"] == [5]
+    assert stats["index_bytes"] == os.path.getsize(store_dir / index_store.INDEX_FILE)
+    assert set(stats["file_bytes"]) == {index_store.INDEX_FILE, index_store.CHUNKS_FILE}
+
+    os.remove(store_dir / index_store.CHUNKS_FILE)
+    assert index_store.vector_store_stats() is stats  # cached for the version
+
+
+def test_mmap_flag_follows_index_type(tmp_path, monkeypatch):
+    from backend import retriever
+
+    rng = np.random.default_rng(0)
+    flat = faiss.IndexIDMap(faiss.IndexFlatIP(8))
+    flat.add_with_ids(rng.standard_normal((4, 8)).astype("float32"), np.arange(4))
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatIP(8), 8, 2, faiss.METRIC_INNER_PRODUCT)
+    ivf.train(rng.standard_normal((100, 8)).astype("float32"))
+    faiss.write_index(flat, str(tmp_path / "flat.bin"))
+    faiss.write_index(ivf, str(tmp_path / "ivf.bin"))
+
+    flags = []
+    read_index = faiss.read_index
+    monkeypatch.setattr(faiss, "read_index", lambda path, flag=0: flags.append(flag) or read_index(path, flag))
+    assert retriever._read_index_mmap(str(tmp_path / "flat.bin")).ntotal == 4
+    assert retriever._read_index_mmap(str(tmp_path / "ivf.bin")).nlist == 2
+    assert flags == [faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY]
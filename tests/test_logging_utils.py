@@ -0,0 +1,39 @@
+import atexit
+import io
+import logging
+
+import pytest
+
+from backend import logging_utils
+
+
+def _stop_listener():
+    listener = logging_utils._listener
+    if listener is not None:
+        listener.stop()  # drains the queue
+        atexit.unregister(listener.stop)
+        logging_utils._listener = None
+
+
+@pytest.fixture
+def fresh_root(monkeypatch):
+    """Run configure_logging() as if for the first time, then restore the root logger."""
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    monkeypatch.setattr(logging_utils, "_listener", None)
+    yield root
+    _stop_listener()
+    root.handlers[:] = saved_handlers
+    root.setLevel(saved_level)
+
+
+def test_replaces_handlers_installed_before_it(fresh_root):
+    early = io.StringIO()
+    logging.basicConfig(stream=early, force=True)  # what FastMCP() does on startup
+
+    logging_utils.configure_logging()
+    assert [type(h) for h in fresh_root.handlers] == [logging_utils._Enqueue]
+
+    logging.getLogger("test").warning("once")
+    _stop_listener()
+    assert early.getvalue() == ""
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+class Boom(Exception):
+    pass
+
+
+class Retry(Exception):
+    pass
+
+
+def _run_concurrently(flight, key, fn, callers, **kwargs):
+    """Start `callers` threads on one key while fn() is blocked; (results, errors)."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn, **kwargs))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _blocking(release, started, outcomes):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return fn, calls
+
+
+def _let_followers_join(threads):
+    """Give the other callers time to block on the in-flight call."""
+    for t in threads:
+        t.join(0.05)
+
+
+def test_concurrent_callers_share_one_result():
+    flight, release, started = SingleFlight(), threading.Event(), threading.Event()
+    fn, calls = _blocking(release, started, ["answer"])
+    threads, results, errors = _run_concurrently(flight, "q", fn, 5)
+    started.wait(5)
+    _let_followers_join(threads)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1 and not errors
+    assert sorted(results, key=lambda r: r[1]) == [("answer", False)] + [("answer", True)] * 4
+    assert flight.in_flight() == 0
+
+
+def test_exception_reaches_every_caller():
+    flight, release, started = SingleFlight(), threading.Event(), threading.Event()
+    fn, calls = _blocking(release, started, [Boom("failed")])
+    threads, results, errors = _run_concurrently(flight, "q", fn, 4)
+    started.wait(5)
+    _let_followers_join(threads)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1 and not results
+    assert len(errors) == 4 and all(isinstance(e, Boom) for e in errors)
+
+
+def test_followers_retry_on_listed_errors():
+    flight, release, started = SingleFlight(), threading.Event(), threading.Event()
+    fn, calls = _blocking(release, started, [Retry("leader deadline"), "answer"])
+    threads, results, errors = _run_concurrently(flight, "q", fn, 4, retry_on=(Retry,))
+    started.wait(5)
+    _let_followers_join(threads)
+    release.set()
+    for t in threads:
+        t.join(5)
+    # The leader gets its own error; each follower retries once (sharing a call when they overlap)
+    assert len(errors) == 1 and isinstance(errors[0], Retry)
+    assert [r for r, _ in results] == ["answer"] * 3
+    assert 2 <= len(calls) <= 4
+
+
+def test_nothing_is_cached():
+    flight = SingleFlight()
+    assert flight.do("q", lambda: 1) == (1, False)
+    assert flight.do("q", lambda: 2) == (2, False)
+
+
+def test_leader_error_is_raised():
+    def fail():
+        raise Boom()
+
+    flight = SingleFlight()
+    with pytest.raises(Boom):
+        flight.do("q", fail)
+    assert flight.in_flight() == 0
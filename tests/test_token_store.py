@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+import token_store
+from token_store import open_token_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return open_token_store("memory://", "access_token")
+    return open_token_store(f"sqlite:///{tmp_path / 'tokens.db'}", "access_token")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(token_store.time, "time", lambda: now[0])
+    return now
+
+
+def test_get_until_expiry(store, clock):
+    store.put("token", {"client_id": "a"}, clock[0] + 60)
+    assert store.get("token") == {"client_id": "a"}
+    clock[0] += 59
+    assert store.get("token") == {"client_id": "a"}
+    clock[0] += 1
+    assert store.get("token") is None
+
+
+def test_pop_is_single_use(store, clock):
+    store.put("code", {"scope": "read"}, clock[0] + 60)
+    assert store.pop("code") == {"scope": "read"}
+    assert store.pop("code") is None
+    assert store.get("code") is None
+
+
+def test_pop_of_expired_entry(store, clock):
+    store.put("code", {"scope": "read"}, clock[0] + 1)
+    clock[0] += 2
+    assert store.pop("code") is None
+
+
+def test_delete(store, clock):
+    store.put("token", {}, clock[0] + 60)
+    store.delete("token")
+    assert store.get("token") is None
+
+
+def test_sweep_removes_only_expired(store, clock):
+    store.put("old", {}, clock[0] + 1)
+    store.put("new", {}, clock[0] + 100)
+    clock[0] += 10
+    assert store.sweep() == 1
+    assert store.get("new") == {}
+
+
+def test_namespaces_are_separate(tmp_path, clock):
+    url = f"sqlite:///{tmp_path / 'tokens.db'}"
+    tokens, codes = open_token_store(url, "access_token"), open_token_store(url, "authorization_code")
+    tokens.put("same", {"kind": "token"}, clock[0] + 60)
+    assert codes.get("same") is None
+
+
+def test_concurrent_pop_redeems_once(store):
+    store.put("code", {"scope": "read"}, time.time() + 60)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def redeem():
+        barrier.wait()
+        results.append(store.pop("code"))
+
+    threads = [threading.Thread(target=redeem) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r for r in results if r is not None] == [{"scope": "read"}]
+
+
+def test_unknown_scheme():
+    with pytest.raises(ValueError):
+        open_token_store("mongodb://localhost", "access_token")
+
+
+def test_backend_must_implement_every_operation():
+    class NoPop(token_store.TokenStore):
+        def _put(self, key, data, expires_at): ...
+        def get(self, key): ...
+        def delete(self, key): ...
+
+    with pytest.raises(TypeError, match="pop"):
+        NoPop()